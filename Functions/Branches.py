@@ -0,0 +1,84 @@
+import argparse
+import glob
+import json
+import os
+
+import uproot
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+
+def open_events(file, branches, treepath="/Events", **kwargs):
+    """
+    Opens a NanoAOD file as NanoEvents exposing only the given branches, so that
+    nothing else is ever requested from the (remote) file.
+    """
+    return NanoEventsFactory.from_root(
+        file,
+        treepath=treepath,
+        schemaclass=NanoAODSchema,
+        iteritems_options={"filter_name": branches},
+        **kwargs
+    ).events()
+
+def bytes_per_event(file, branches, treepath="Events"):
+    """
+    Returns the compressed bytes per event of the selected branches and of the
+    whole tree, from the basket sizes stored in the file.
+    """
+    with uproot.open(file) as f:
+        tree = f[treepath]
+        nevents = max(tree.num_entries, 1)
+        selected = set(branches)
+        total = sum(b.compressed_bytes for b in tree.branches)
+        used = sum(b.compressed_bytes for b in tree.branches if b.name in selected)
+    return used / nevents, total / nevents
+
+def dry_run(processor, jsons, nfiles=1, params=None):
+    """
+    Prints, for every dataset in the json files, the branches the processor reads
+    and the estimated bytes per event read compared to the full events. With the
+    configuration `params`, the jet calibration and trigger branches are included.
+    """
+    for json_file in jsons:
+        with open(json_file) as f:
+            datasets = json.load(f)
+        for dataset, content in datasets.items():
+            metadata = content["metadata"]
+            isMC = metadata.get("isMC", "True") == "True"
+            truth = metadata.get(
+                "truth", str(metadata.get("sample") in processor.truth_samples)
+            ) == "True"
+            branches = processor.required_branches(
+                isMC=isMC, truth=truth, params=params, year=metadata.get("year")
+            )
+
+            used, total = 0., 0.
+            files = content["files"][:nfiles]
+            for file in files:
+                file_used, file_total = bytes_per_event(file, branches)
+                used += file_used / len(files)
+                total += file_total / len(files)
+
+            nevents = int(metadata.get("nevents", 0))
+            print(f"{dataset} ({os.path.basename(json_file)})")
+            print(f"    {len(branches)} branches: {', '.join(branches)}")
+            print(f"    {used:.0f} B/event read out of {total:.0f} B/event "
+                  f"({100 * used / max(total, 1):.1f}%), "
+                  f"~{used * nevents / 1e9:.1f} GB for {nevents} events")
+
+if __name__ == "__main__":
+    # export PYTHONPATH=..:$PYTHONPATH
+    # python -m Functions.Branches --dry-run
+    parser = argparse.ArgumentParser(description="Branches read by ttBaseProcessor_res")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the branch list and bytes per event of every dataset")
+    parser.add_argument("--jsons", nargs="+", default=sorted(glob.glob("Datasets/*.json")))
+    parser.add_argument("--nfiles", type=int, default=1,
+                        help="Number of files per dataset used for the estimate")
+    args = parser.parse_args()
+
+    from workflow import ttBaseProcessor_res
+    from config import parameters
+    if args.dry_run:
+        dry_run(ttBaseProcessor_res, [j for j in args.jsons if "definitions" not in j], args.nfiles, parameters)
+    else:
+        print("\n".join(ttBaseProcessor_res.required_branches(params=parameters)))
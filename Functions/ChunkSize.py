@@ -0,0 +1,91 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import yaml
+from coffea.util import load
+
+def fit_chunk_stats(stats):
+    """
+    Fits the peak RSS growth of a chunk as `growth = growth0 + mb_per_event * nevents`
+    and the average time per event from a list of [nevents, seconds, peak_growth_mb,
+    rss_before_mb] chunk measurements. The RSS of the worker before the chunks
+    (largest one measured) is added to the constant term. With chunks all of the
+    same size the growth is attributed to the events only, which is conservative.
+    """
+    stats = np.asarray(stats, dtype=float)
+    nevents, seconds, growth = stats[:, 0], stats[:, 1], stats[:, 2]
+    # Outputs written before the RSS of the worker was recorded
+    rss_before = stats[:, 3].max() if stats.shape[1] > 3 else 0.
+    nevents = np.maximum(nevents, 1)
+    mb_per_event, growth0 = 0., 0.
+    if len(stats) >= 2 and np.ptp(nevents) > 0:
+        mb_per_event, growth0 = np.polyfit(nevents, growth, 1)
+    if mb_per_event <= 0:
+        mb_per_event, growth0 = max(np.mean(growth / nevents), 1e-9), 0.
+    return {
+        "chunks": len(stats),
+        "events": int(nevents.sum()),
+        "max_peak_growth_mb": float(growth.max()),
+        "rss0_mb": float(rss_before + max(growth0, 0.)),
+        "mb_per_event": float(mb_per_event),
+        "seconds_per_event": float(seconds.sum() / nevents.sum()),
+    }
+
+def choose_chunksize(fit, target_memory_mb, target_seconds,
+                     min_chunksize=10_000, max_chunksize=2_000_000):
+    """
+    Largest chunk size meeting both the memory and the task duration targets.
+    """
+    by_memory = (target_memory_mb - fit["rss0_mb"]) / fit["mb_per_event"]
+    by_time = target_seconds / max(fit["seconds_per_event"], 1e-9)
+    return int(np.clip(min(by_memory, by_time), min_chunksize, max_chunksize))
+
+def tune_chunksize(outputs, target_memory_mb=2000., target_seconds=600.):
+    """
+    Collects the `chunk_stats` of the coffea outputs and returns the chunk size
+    chosen for each dataset with its measurements, and the overall chunk size
+    (the smallest one) to pass to `pocket-coffea run --chunksize`.
+    """
+    stats = {}
+    for output in outputs:
+        for dataset, chunks in load(output).get("chunk_stats", {}).items():
+            stats.setdefault(dataset, []).extend(chunks)
+
+    datasets = {}
+    for dataset, chunks in sorted(stats.items()):
+        fit = fit_chunk_stats(chunks)
+        datasets[dataset] = {
+            "chunksize": choose_chunksize(fit, target_memory_mb, target_seconds),
+            "measurements": fit,
+        }
+    # Also a run options file: pocket-coffea run -ro chunksize.yaml
+    return {
+        "chunksize": min((d["chunksize"] for d in datasets.values()), default=None),
+        "chunksize-tuning": {
+            "target_memory_mb": target_memory_mb,
+            "target_seconds": target_seconds,
+            "datasets": datasets,
+        },
+    }
+
+if __name__ == "__main__":
+    # After a first run, e.g. with --limit-chunks (the chunks are measured while
+    # they run, the chunk size is only chosen afterwards):
+    # python -m Functions.ChunkSize output_test
+    # pocket-coffea run --cfg config.py -ro output_test/chunksize.yaml ...
+    parser = argparse.ArgumentParser(description="Chunk size from the measured memory and time per event")
+    parser.add_argument("outdir", help="Output directory of pocket-coffea run")
+    parser.add_argument("--target-memory-mb", type=float, default=2000.)
+    parser.add_argument("--target-seconds", type=float, default=600.)
+    args = parser.parse_args()
+
+    outputs = sorted(glob.glob(os.path.join(args.outdir, "output_*.coffea")))
+    result = tune_chunksize(outputs, args.target_memory_mb, args.target_seconds)
+    # Written next to parameters_dump.yaml, as run options for the next run
+    with open(os.path.join(args.outdir, "chunksize.yaml"), "w") as f:
+        yaml.safe_dump(result, f, sort_keys=False)
+    for dataset, content in result["chunksize-tuning"]["datasets"].items():
+        print(f"{dataset}: chunksize {content['chunksize']}")
+    print(f"--chunksize {result['chunksize']}")
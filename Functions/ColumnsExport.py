@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+import awkward as ak
+
+def chunk_id(metadata):
+    """
+    Unique name of a processed chunk, from its file and entry range.
+    """
+    filename = hashlib.md5(metadata["filename"].encode()).hexdigest()
+    return f"{filename}_{metadata['entrystart']}_{metadata['entrystop']}"
+
+def write_columns(columns, directory, sample, name):
+    """
+    Writes the column accumulators of one chunk, structured as
+    {dataset: {category: {column: column_accumulator}}}, to one Parquet file per
+    dataset and category under `directory/sample/dataset/category/`.
+
+    Returns the manifest of the files written, with the same structure and the
+    list of file paths as values.
+    """
+    manifest = {}
+    for dataset, categories in columns.items():
+        for category, cols in categories.items():
+            if not cols:
+                continue
+            path = os.path.join(directory, sample, dataset, category, f"{name}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            table = ak.zip(
+                {column: ak.Array(acc.value) for column, acc in cols.items()},
+                depth_limit=1
+            )
+            ak.to_parquet(table, path)
+            manifest.setdefault(dataset, {})[category] = [path]
+    return manifest
+
+def read_columns(paths, columns=None):
+    """
+    Reads back the Parquet files of a manifest entry, optionally only `columns`.
+    """
+    return ak.concatenate([ak.from_parquet(path, columns=columns) for path in paths])
@@ -0,0 +1,143 @@
+import argparse
+import glob
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import uproot
+
+def index_file(path, treepath="Events"):
+    """
+    Per-file entry of the index: number of events, compressed bytes of the tree,
+    file uuid (hex of the raw bytes read by the coffea preprocessing) and cluster
+    boundaries (entries where all the baskets start).
+    """
+    with uproot.open(path) as f:
+        tree = f[treepath]
+        return {
+            "nevents": int(tree.num_entries),
+            "bytes": int(sum(b.compressed_bytes for b in tree.branches)),
+            "uuid": f.file.fUUID.hex(),
+            "clusters": [int(c) for c in tree.common_entry_offsets()],
+        }
+
+def index_path(dataset_json):
+    """
+    Sidecar index written next to a dataset json.
+    """
+    return dataset_json.replace(".json", ".index.json")
+
+def build_index(datasets, treepath="Events", workers=8):
+    """
+    Builds the index of a {dataset: {"files": [...]}} dictionary, as written by
+    `pocket-coffea build-datasets`. Files are opened in parallel; the ones that
+    cannot be opened are left out of the index.
+    """
+    def safe_index(path):
+        try:
+            return path, index_file(path, treepath)
+        except OSError as e:
+            print(f"Skipping {path}: {e}")
+            return path, None
+
+    index = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for dataset, content in datasets.items():
+            entries = dict(pool.map(safe_index, content["files"]))
+            index[dataset] = {path: entry for path, entry in entries.items() if entry is not None}
+    return index
+
+def make_chunks(file_index, target_bytes):
+    """
+    Splits the files of one dataset into (file, entrystart, entrystop, bytes)
+    chunks of about `target_bytes`, cutting only at cluster boundaries.
+    """
+    chunks = []
+    for path, entry in file_index.items():
+        clusters = entry["clusters"] or [0, entry["nevents"]]
+        bytes_per_event = entry["bytes"] / max(entry["nevents"], 1)
+        start = clusters[0]
+        for stop, next_stop in zip(clusters[1:], clusters[2:] + [None]):
+            chunk_bytes = (stop - start) * bytes_per_event
+            # Close the chunk if adding the next cluster would overshoot the target
+            if next_stop is None or (next_stop - start) * bytes_per_event > target_bytes:
+                chunks.append((path, start, stop, chunk_bytes))
+                start = stop
+    return chunks
+
+def balance_chunks(chunks, njobs):
+    """
+    Distributes the chunks on `njobs` jobs by bytes rather than by file count
+    (largest chunks first, each one to the least loaded job).
+    """
+    jobs = [[] for _ in range(njobs)]
+    load = np.zeros(njobs)
+    for chunk in sorted(chunks, key=lambda c: c[3], reverse=True):
+        job = int(np.argmin(load))
+        jobs[job].append(chunk)
+        load[job] += chunk[3]
+    return jobs
+
+def coffea_metadata_cache(file_index, dataset, treename="Events"):
+    """
+    Metadata of the indexed files in the format of the coffea Runner
+    `metadata_cache`, so that the preprocessing does not open them again.
+    """
+    from coffea.processor.executor import FileMeta
+    return {
+        FileMeta(dataset, path, treename): {
+            "numentries": entry["nevents"],
+            # Raw bytes, as read by the preprocessing (also accepts the dashed form)
+            "uuid": uuid.UUID(entry["uuid"]).bytes,
+            "clusters": entry["clusters"],
+        }
+        for path, entry in file_index.items()
+    }
+
+def preload_metadata_cache(dataset_jsons, treename="Events"):
+    """
+    Fills the default metadata cache of the coffea Runner, used by `pocket-coffea run`,
+    with the sidecar indexes of `dataset_jsons` that exist. Returns the number of
+    files whose preprocessing is skipped.
+    """
+    from coffea.processor.executor import DEFAULT_METADATA_CACHE
+    nfiles = 0
+    for dataset_json in dataset_jsons:
+        path = index_path(dataset_json)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            index = json.load(f)
+        for dataset, file_index in index.items():
+            DEFAULT_METADATA_CACHE.update(coffea_metadata_cache(file_index, dataset, treename))
+            nfiles += len(file_index)
+    return nfiles
+
+if __name__ == "__main__":
+    # python -m Functions.DatasetIndex Datasets/signals_MC_ttbar.json
+    # python -m Functions.DatasetIndex --local /path/to/rootfiles -o local.index.json
+    parser = argparse.ArgumentParser(description="Per-file index of the datasets")
+    parser.add_argument("jsons", nargs="*", help="Dataset jsons from build-datasets")
+    parser.add_argument("--local", help="Index the .root files of a local directory instead")
+    parser.add_argument("-o", "--output", help="Output of the --local index")
+    parser.add_argument("-j", "--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.local:
+        files = sorted(glob.glob(os.path.join(args.local, "*.root")))
+        datasets = {os.path.basename(os.path.normpath(args.local)): {"files": files}}
+        outputs = [(args.output or "local.index.json", datasets)]
+    else:
+        outputs = []
+        for json_file in args.jsons:
+            with open(json_file) as f:
+                outputs.append((index_path(json_file), json.load(f)))
+
+    for output, datasets in outputs:
+        index = build_index(datasets, workers=args.workers)
+        with open(output, "w") as f:
+            json.dump(index, f, indent=4)
+        nfiles = sum(len(files) for files in index.values())
+        print(f"Written {output}: {len(index)} datasets, {nfiles} files")
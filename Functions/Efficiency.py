@@ -0,0 +1,128 @@
+import numpy as np
+import hist
+from scipy import stats
+
+# Central 1 sigma interval
+ONE_SIGMA = stats.norm.cdf(1) - stats.norm.cdf(-1)
+
+def make_efficiency_hist(pairs, bins, name="pt_gen"):
+    """
+    Empty efficiency histogram for the (numerator, denominator) `pairs`, with
+    axes (pair, kind, `name`): kind "passed" holds the numerator, "total" the
+    denominator. Weighted storage, so the intervals use the effective entries.
+
+    Parameters:
+        pairs (list): (numerator, denominator) names, the pair label is "num/den".
+        bins: Bin edges, or (n, start, stop) for regular bins.
+    """
+    if isinstance(bins, tuple):
+        axis = hist.axis.Regular(*bins, name=name)
+    else:
+        axis = hist.axis.Variable(bins, name=name)
+    return hist.Hist(
+        hist.axis.StrCategory([f"{num}/{den}" for num, den in pairs], name="pair"),
+        hist.axis.StrCategory(["passed", "total"], name="kind"),
+        axis,
+        storage=hist.storage.Weight(),
+    )
+
+def fill_efficiency(h, entries):
+    """
+    Fills all the pairs of `h` in a single call.
+
+    Parameters:
+        entries (dict): {pair label: (passed, total, passed_weights, total_weights)},
+            the weights can be None for unit weights.
+    """
+    pair, kind, values, weights = [], [], [], []
+    for label, (passed, total, w_passed, w_total) in entries.items():
+        for k, x, w in (("passed", passed, w_passed), ("total", total, w_total)):
+            x = np.asarray(x, dtype=np.float64)
+            pair.append(np.full(x.size, label))
+            kind.append(np.full(x.size, k))
+            values.append(x)
+            weights.append(np.ones_like(x) if w is None else np.asarray(w, dtype=np.float64))
+    if values:
+        h.fill(np.concatenate(pair), np.concatenate(kind), np.concatenate(values),
+               weight=np.concatenate(weights))
+    return h
+
+def fill_efficiencies(df, pairs, bins=10, weight=None):
+    """
+    Efficiency histogram of the (matched, gen) column `pairs` of a DataFrame, as a
+    function of the gen pt. A gen object (gen pt > 0) passes if the matched object in
+    the same row has pt > 0. With an integer `bins`, regular bins span the gen pt
+    range of all the pairs, or [0, 1] if there is no gen object.
+    """
+    w_all = df[weight].values if weight is not None else None
+    entries = {}
+    for var1, var2 in pairs:
+        pt_gen = df[f"{var2}_pt"].values
+        pt_matched = df[f"{var1}_pt"].values
+        gen_mask = pt_gen > 0
+        passed = gen_mask & (pt_matched > 0)
+        w = w_all if w_all is not None else np.ones_like(pt_gen, dtype=float)
+        entries[f"{var1}/{var2}"] = (pt_gen[passed], pt_gen[gen_mask], w[passed], w[gen_mask])
+
+    if isinstance(bins, int):
+        totals = [total for _, total, _, _ in entries.values() if total.size]
+        if totals:
+            lo = min(t.min() for t in totals)
+            hi = np.nextafter(max(t.max() for t in totals), np.inf)
+        else:
+            lo, hi = 0., 1.
+        bins = (bins, lo, hi)
+    return fill_efficiency(make_efficiency_hist(pairs, bins), entries)
+
+def efficiency_intervals(passed, total, total_variances=None, method="clopper-pearson", cl=ONE_SIGMA):
+    """
+    Efficiencies and their (low, high) interval bounds, vectorized over any array shape.
+
+    Weighted entries are turned into effective entries n_eff = (sum w)^2 / sum w^2,
+    k_eff = eff * n_eff, before the Clopper-Pearson or Wilson interval is evaluated.
+    Empty bins give NaN.
+
+    Returns:
+        (eff, low, high)
+    """
+    passed = np.asarray(passed, dtype=np.float64)
+    total = np.asarray(total, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = np.where(total > 0, passed / total, np.nan)
+        if total_variances is None:
+            n = total
+        else:
+            n = np.where(total_variances > 0, total**2 / np.asarray(total_variances), 0.)
+    k = np.clip(eff * n, 0, n)
+    alpha = 1 - cl
+
+    if method == "clopper-pearson":
+        with np.errstate(invalid="ignore"):
+            low = np.where(k > 0, stats.beta.ppf(alpha / 2, k, n - k + 1), 0.)
+            high = np.where(k < n, stats.beta.ppf(1 - alpha / 2, k + 1, n - k), 1.)
+    elif method == "wilson":
+        z = stats.norm.ppf(1 - alpha / 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denom = 1 + z**2 / n
+            center = (eff + z**2 / (2 * n)) / denom
+            half = z * np.sqrt(eff * (1 - eff) / n + z**2 / (4 * n**2)) / denom
+        low, high = center - half, center + half
+    else:
+        raise ValueError(f"Unknown interval method {method}, use clopper-pearson or wilson")
+
+    empty = ~(n > 0)
+    low = np.where(empty, np.nan, low)
+    high = np.where(empty, np.nan, high)
+    return eff, low, high
+
+def hist_efficiency(h, pair=None, method="clopper-pearson", cl=ONE_SIGMA):
+    """
+    `efficiency_intervals` of an efficiency histogram, for all pairs (shape
+    (npairs, nbins)) or for a single `pair` label.
+    """
+    if pair is not None:
+        h = h[{"pair": pair}]
+    passed, total = h[{"kind": "passed"}], h[{"kind": "total"}]
+    return efficiency_intervals(
+        passed.values(), total.values(), total.variances(), method, cl
+    )
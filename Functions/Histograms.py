@@ -0,0 +1,65 @@
+from pocket_coffea.lib.hist_manager import HistConf, Axis
+
+# Reconstructed candidates of ttBaseProcessor_res: (collection, label)
+RECO_CANDIDATES = [
+    ("jj", r"W_{jj}"),
+    ("bjj_deltaR", r"top_{\Delta R}"),
+    ("bjj_deltaM", r"top_{\Delta M}"),
+]
+
+def candidate_hists(coll, label, only_samples=None, variations=True,
+                    mass_range=(0, 700), pt_range=(0, 700), bins=100):
+    '''
+    Mass and pt of a candidate collection.
+    '''
+    return {
+        f"{coll}_mass": HistConf(
+            [Axis(coll=coll, field="mass", bins=bins, start=mass_range[0], stop=mass_range[1],
+                  label=rf"$M_{{{label}}}$ [GeV]")],
+            only_samples=only_samples, variations=variations,
+        ),
+        f"{coll}_pt": HistConf(
+            [Axis(coll=coll, field="pt", bins=bins, start=pt_range[0], stop=pt_range[1],
+                  label=rf"$p_{{T,{label}}}$ [GeV]")],
+            only_samples=only_samples, variations=variations,
+        ),
+    }
+
+def response_hists(coll, label, only_samples=None, variations=False, bins=50):
+    '''
+    Reco/gen pt response against the gen pt of the matched candidates "Matched<coll>",
+    see ttBaseProcessor_res.truth_reconstruction.
+    '''
+    return {
+        f"Matched{coll}_response": HistConf(
+            [
+                Axis(coll=f"Matched{coll}", field="genPt", bins=bins, start=0, stop=700,
+                     label=rf"$p_{{T,{label}}}^{{gen}}$ [GeV]"),
+                Axis(coll=f"Matched{coll}", field="ptResponse", bins=bins, start=0, stop=2,
+                     label=rf"$p_{{T,{label}}}^{{reco}} / p_{{T,{label}}}^{{gen}}$"),
+            ],
+            only_samples=only_samples, variations=variations,
+        ),
+    }
+
+def resolved_hists(samples, truth_samples=()):
+    '''
+    Histogram preset of the resolved workflow: W/top candidate mass and pt, with the
+    systematic variations, for `samples`. For the `truth_samples` among them, the
+    Gen-level candidates and the matched reco/gen response are added (nominal only).
+    '''
+    samples = list(samples)
+    truth_samples = [s for s in samples if s in truth_samples]
+    hists = {}
+    if not samples:
+        return hists
+    for coll, label in RECO_CANDIDATES:
+        mass_range = (0, 200) if coll == "jj" else (0, 700)
+        hists.update(candidate_hists(coll, label, samples, mass_range=mass_range))
+    if truth_samples:
+        for coll, label in RECO_CANDIDATES:
+            mass_range = (0, 200) if coll == "jj" else (0, 700)
+            hists.update(candidate_hists(f"Gen{coll}", f"{label}^{{gen}}", truth_samples,
+                                         variations=False, mass_range=mass_range))
+            hists.update(response_hists(coll, label, truth_samples))
+    return hists
@@ -5,16 +5,88 @@ import cloudpickle
 
 import awkward as ak
 import numpy as np
+import numba
 import correctionlib
 from coffea.jetmet_tools import  CorrectedMETFactory
 
+def _leading_p4(jets, n):
+    '''
+    Returns the number of objects per event and the cartesian (px, py, pz, E)
+    components of the `n` leading ones as (nevents, n) NumPy arrays, zero-padded.
+    Only the leading entries are materialised, not the whole jagged collection.
+    A collection with one record per event counts as one object where not None.
+    '''
+    if jets.ndim == 1:
+        counts = ak.to_numpy(~ak.is_none(jets, axis=0)).astype(np.int64)
+        leading = {
+            var: ak.to_numpy(ak.fill_none(jets[var], 0.)).astype(np.float64)[:, None]
+            for var in ("pt", "eta", "phi", "mass")
+        }
+    else:
+        counts = ak.to_numpy(ak.num(jets, axis=1))
+        leading = {
+            var: ak.to_numpy(
+                ak.fill_none(ak.pad_none(jets[var], n, axis=1, clip=True), 0.)
+            ).astype(np.float64)
+            for var in ("pt", "eta", "phi", "mass")
+        }
+    pt, eta, phi, mass = leading["pt"], leading["eta"], leading["phi"], leading["mass"]
+    px = pt * np.cos(phi)
+    py = pt * np.sin(phi)
+    pz = pt * np.sinh(eta)
+    e = np.sqrt((pt * np.cosh(eta))**2 + mass**2)
+    return counts, (px, py, pz, e)
+
+def _candidate_from_p4(px, py, pz, e, exists):
+    '''
+    Builds a PtEtaPhiMCandidate from per-event cartesian components,
+    zero where `exists` is False.
+    '''
+    pt = np.hypot(px, py)
+    eta = np.arcsinh(np.divide(pz, pt, out=np.zeros_like(pz), where=pt > 0))
+    phi = np.arctan2(py, px)
+    mass = np.sqrt(np.maximum(e**2 - px**2 - py**2 - pz**2, 0.))
+    return ak.zip(
+        {
+            "pt": np.where(exists, pt, 0.),
+            "eta": np.where(exists, eta, 0.),
+            "phi": np.where(exists, phi, 0.),
+            "mass": np.where(exists, mass, 0.),
+        },
+        with_name="PtEtaPhiMCandidate"
+    )
+
 def get_dijet(jets, taggerVars=True):
+    '''
+    Four-vector sum of the two leading jets, zero in events with less than 2 jets.
+    '''
     if isinstance(taggerVars, str):
         raise NotImplementedError(
             f"Using the tagger name while calling `get_dijet` is deprecated. "
             f"Please use `jet_tagger={taggerVars}` as an argument to `jet_selection`."
         )
 
+    njet, (px, py, pz, e) = _leading_p4(jets, 2)
+    return _candidate_from_p4(
+        px.sum(axis=1), py.sum(axis=1), pz.sum(axis=1), e.sum(axis=1), njet >= 2
+    )
+
+def combine_jets(jet1, jet2):
+    '''
+    Four-vector sum of the leading object of each input, zero unless both exist.
+    '''
+    n1, (px1, py1, pz1, e1) = _leading_p4(jet1, 1)
+    n2, (px2, py2, pz2, e2) = _leading_p4(jet2, 1)
+    return _candidate_from_p4(
+        px1[:, 0] + px2[:, 0], py1[:, 0] + py2[:, 0],
+        pz1[:, 0] + pz2[:, 0], e1[:, 0] + e2[:, 0],
+        (n1 >= 1) & (n2 >= 1)
+    )
+
+def _get_dijet_awkward(jets, taggerVars=True):
+    '''
+    Reference implementation of `get_dijet` built from padded awkward arrays.
+    '''
     fields = {
         "pt": 0.,
         "eta": 0.,
@@ -58,7 +130,10 @@ def get_dijet(jets, taggerVars=True):
     # leading_pair = ak.concatenate([jets[:, 0:1], jets[:, 1:2]], axis=1)
     return dijet
 
-def combine_jets(jet1, jet2):
+def _combine_jets_awkward(jet1, jet2):
+    '''
+    Reference implementation of `combine_jets` built from padded awkward arrays.
+    '''
     fields = {
         "pt": 0.,
         "eta": 0.,
@@ -86,6 +161,314 @@ def combine_jets(jet1, jet2):
 
     return comb
 
+# Top mass window used by the deltaM strategy, and the tie-breaker inside it
+TOP_MASS_WINDOW = (170., 180.)
+TOP_MASS_NOMINAL = 172.52
+
+@numba.njit(cache=True)
+def _sum_p4(pt1, eta1, phi1, m1, pt2, eta2, phi2, m2):
+    # Sum two (pt, eta, phi, mass) vectors through their cartesian components
+    px = pt1 * np.cos(phi1) + pt2 * np.cos(phi2)
+    py = pt1 * np.sin(phi1) + pt2 * np.sin(phi2)
+    pz = pt1 * np.sinh(eta1) + pt2 * np.sinh(eta2)
+    e = (np.sqrt((pt1 * np.cosh(eta1))**2 + m1**2)
+         + np.sqrt((pt2 * np.cosh(eta2))**2 + m2**2))
+
+    pt = np.sqrt(px**2 + py**2)
+    eta = np.arcsinh(pz / pt) if pt > 0 else 0.
+    phi = np.arctan2(py, px)
+    m2_sum = e**2 - px**2 - py**2 - pz**2
+    mass = np.sqrt(m2_sum) if m2_sum > 0 else 0.
+    return pt, eta, phi, mass
+
+@numba.njit(cache=True)
+def _delta_r(eta1, phi1, eta2, phi2):
+    dphi = (phi1 - phi2 + np.pi) % (2 * np.pi) - np.pi
+    return np.sqrt((eta1 - eta2)**2 + dphi**2)
+
+@numba.njit(cache=True)
+def _bjj_pair_kernel(offsets, pt, eta, phi, mass,
+                     w_pt, w_eta, w_phi, w_mass, w_ok):
+    '''
+    Single pass over the flat b-jet buffers. For every event with at least two
+    b-jets and a W candidate, the first two b-jets are each summed with the W.
+    Returns the two b+W four-vectors, the two ΔR(b, W) and the event mask;
+    the strategies only have to choose between the two candidates.
+    '''
+    nev = len(offsets) - 1
+    cands = np.zeros((nev, 2, 4))
+    dr = np.zeros((nev, 2))
+    valid = np.zeros(nev, dtype=np.bool_)
+    for i in range(nev):
+        start = offsets[i]
+        if offsets[i + 1] - start < 2 or not w_ok[i]:
+            continue
+        valid[i] = True
+        for j in range(2):
+            b = start + j
+            c = _sum_p4(pt[b], eta[b], phi[b], mass[b],
+                        w_pt[i], w_eta[i], w_phi[i], w_mass[i])
+            for k in range(4):
+                cands[i, j, k] = c[k]
+            dr[i, j] = _delta_r(eta[b], phi[b], w_eta[i], w_phi[i])
+    return cands, dr, valid
+
+def _flat_jets(jets):
+    '''
+    Returns the offsets and the flat float64 pt/eta/phi/mass buffers of a jagged jet collection.
+    '''
+    counts = ak.to_numpy(ak.num(jets, axis=1))
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    buffers = [
+        np.asarray(ak.to_numpy(ak.flatten(jets[var], axis=1)), dtype=np.float64)
+        for var in ("pt", "eta", "phi", "mass")
+    ]
+    return offsets, buffers
+
+def _leading_candidate(cands):
+    '''
+    Returns the per-event pt/eta/phi/mass of a candidate collection, given either
+    as one record per event (get_dijet) or as a singleton list (to_singleton_jet),
+    together with a mask of the events in which the candidate exists.
+    '''
+    if cands.ndim > 1:
+        cands = ak.firsts(cands, axis=1)
+    exists = np.asarray(ak.to_numpy(~ak.is_none(cands, axis=0)), dtype=np.bool_)
+    buffers = [
+        np.asarray(ak.to_numpy(ak.fill_none(cands[var], 0.)), dtype=np.float64)
+        for var in ("pt", "eta", "phi", "mass")
+    ]
+    return buffers, exists
+
+# W mass and resolutions used by the chi2 strategy
+W_MASS_NOMINAL = 80.38
+CHI2_SIGMA_W = 10.
+CHI2_SIGMA_TOP = 15.
+# Default pruning of the combinatoric hypotheses: 4 sigma around the W and top masses
+TRIPLET_W_MASS_BOUNDS = (W_MASS_NOMINAL - 4 * CHI2_SIGMA_W, W_MASS_NOMINAL + 4 * CHI2_SIGMA_W)
+TRIPLET_TOP_MASS_BOUNDS = (TOP_MASS_NOMINAL - 4 * CHI2_SIGMA_TOP, TOP_MASS_NOMINAL + 4 * CHI2_SIGMA_TOP)
+
+def _select_deltaR(cands, dr, w):
+    # b-jet closest to the W in ΔR, the second one on ties
+    return dr[:, 0] < dr[:, 1]
+
+def _select_deltaM(cands, dr, w):
+    # Closest to the top mass window, then closest to the nominal top mass
+    low, high = TOP_MASS_WINDOW
+    mass = cands[:, :, 3]
+    dist = np.where(mass < low, low - mass, np.where(mass > high, mass - high, 0.))
+    tie = np.abs(mass - TOP_MASS_NOMINAL)
+    return (dist[:, 0] < dist[:, 1]) | ((dist[:, 0] == dist[:, 1]) & (tie[:, 0] < tie[:, 1]))
+
+def _select_chi2(cands, dr, w):
+    # Lowest chi2 built from the W and the top mass hypotheses
+    chi2 = (
+        ((w[:, 3, None] - W_MASS_NOMINAL) / CHI2_SIGMA_W)**2
+        + ((cands[:, :, 3] - TOP_MASS_NOMINAL) / CHI2_SIGMA_TOP)**2
+    )
+    return chi2[:, 0] < chi2[:, 1]
+
+# Strategies available in `reconstruct_top_candidates`. Each one receives the shared
+# (nevents, 2, 4) b+W candidates, the (nevents, 2) ΔR(b, W) and the (nevents, 4) W,
+# and returns True where the first b-jet has to be used.
+TOP_STRATEGIES = {
+    "deltaR": _select_deltaR,
+    "deltaM": _select_deltaM,
+    "chi2": _select_chi2,
+}
+
+def reconstruct_top_candidates(bjets, dijet, strategies=("deltaR", "deltaM")):
+    """
+    Reconstructs the top quark candidates for several b-jet assignment strategies
+    at once. The pairing and the b+W four-vector sums are computed a single time,
+    each strategy only chooses between the two candidates.
+
+    Parameters
+    ----------
+    bjets : ak.Array
+        Array of b-tagged jets (at least two per event).
+
+    dijet : ak.Array
+        Dijet (W candidate), either one record per event or a singleton list.
+
+    strategies : list of str
+        Keys of `TOP_STRATEGIES`.
+
+    Returns
+    -------
+    ak.Array
+        Record array with one PtEtaPhiMCandidate field per strategy.
+    """
+    unknown = [name for name in strategies if name not in TOP_STRATEGIES]
+    if unknown:
+        raise ValueError(
+            f"Unknown top reconstruction strategies {unknown}. "
+            f"Available ones are {list(TOP_STRATEGIES.keys())}."
+        )
+
+    offsets, (pt, eta, phi, mass) = _flat_jets(bjets)
+    (w_pt, w_eta, w_phi, w_mass), w_ok = _leading_candidate(dijet)
+    cands, dr, valid = _bjj_pair_kernel(
+        offsets, pt, eta, phi, mass,
+        w_pt, w_eta, w_phi, w_mass, w_ok,
+    )
+    w = np.stack([w_pt, w_eta, w_phi, w_mass], axis=1)
+
+    tops = {}
+    for name in strategies:
+        use_1 = TOP_STRATEGIES[name](cands, dr, w)
+        best = np.where(use_1[:, None], cands[:, 0], cands[:, 1])
+        # Events without two b-jets and a W are left at zero, like `combine_jets`
+        best[~valid] = 0.
+        tops[name] = ak.zip(
+            {
+                "pt": best[:, 0],
+                "eta": best[:, 1],
+                "phi": best[:, 2],
+                "mass": best[:, 3],
+            },
+            with_name="PtEtaPhiMCandidate"
+        )
+    return ak.zip(tops, depth_limit=1)
+
+@numba.njit(cache=True)
+def chi2_top_w(mjj, mbjj):
+    '''
+    Default score of a (b, j1, j2) hypothesis: chi2 of the W and top mass constraints.
+    '''
+    return (
+        ((mjj - W_MASS_NOMINAL) / CHI2_SIGMA_W)**2
+        + ((mbjj - TOP_MASS_NOMINAL) / CHI2_SIGMA_TOP)**2
+    )
+
+# Not cached on disk: the metric is a function argument
+@numba.njit
+def _triplet_kernel(b_offsets, b_pt, b_eta, b_phi, b_mass,
+                    l_offsets, l_pt, l_eta, l_phi, l_mass,
+                    max_b, max_l, k,
+                    mw_low, mw_high, mt_low, mt_high, metric):
+    '''
+    Enumerates the (b, j1, j2) hypotheses of every event over the leading `max_b`
+    b-jets and the leading `max_l` light jets, and keeps the best `k` by `metric`
+    with an insertion sort. W candidates outside the W mass bounds are pruned
+    before looping on the b-jets, top candidates outside the top mass bounds are
+    dropped. The memory is fixed to (nevents, k) whatever the jet multiplicity.
+    '''
+    nev = len(b_offsets) - 1
+    score = np.full((nev, k), np.inf)
+    idx = np.full((nev, k, 3), -1, dtype=np.int64)
+    top = np.zeros((nev, k, 4))
+    mjj = np.zeros((nev, k))
+    for i in range(nev):
+        nb = min(b_offsets[i + 1] - b_offsets[i], max_b)
+        nl = min(l_offsets[i + 1] - l_offsets[i], max_l)
+        for j1 in range(nl):
+            a = l_offsets[i] + j1
+            for j2 in range(j1 + 1, nl):
+                c = l_offsets[i] + j2
+                w = _sum_p4(l_pt[a], l_eta[a], l_phi[a], l_mass[a],
+                            l_pt[c], l_eta[c], l_phi[c], l_mass[c])
+                if w[3] < mw_low or w[3] > mw_high:
+                    continue
+                for ib in range(nb):
+                    b = b_offsets[i] + ib
+                    t = _sum_p4(b_pt[b], b_eta[b], b_phi[b], b_mass[b],
+                                w[0], w[1], w[2], w[3])
+                    if t[3] < mt_low or t[3] > mt_high:
+                        continue
+                    s = metric(w[3], t[3])
+                    if s >= score[i, k - 1]:
+                        continue
+                    pos = k - 1
+                    while pos > 0 and score[i, pos - 1] > s:
+                        score[i, pos] = score[i, pos - 1]
+                        mjj[i, pos] = mjj[i, pos - 1]
+                        for n in range(3):
+                            idx[i, pos, n] = idx[i, pos - 1, n]
+                        for n in range(4):
+                            top[i, pos, n] = top[i, pos - 1, n]
+                        pos -= 1
+                    score[i, pos] = s
+                    mjj[i, pos] = w[3]
+                    idx[i, pos, 0] = ib
+                    idx[i, pos, 1] = j1
+                    idx[i, pos, 2] = j2
+                    for n in range(4):
+                        top[i, pos, n] = t[n]
+    return score, idx, top, mjj
+
+def top_triplet_candidates(bjets, lightjets, k=1, metric=chi2_top_w,
+                           max_bjets=4, max_lightjets=6,
+                           w_mass_bounds=TRIPLET_W_MASS_BOUNDS, top_mass_bounds=TRIPLET_TOP_MASS_BOUNDS):
+    """
+    Combinatoric top reconstruction: every (b, j1, j2) assignment of the b-jets and
+    the pairs of non-b jets is scored, and the best `k` per event are kept.
+
+    Parameters
+    ----------
+    bjets : ak.Array
+        Array of b-tagged jets, pt ordered (e.g. BJetGood).
+
+    lightjets : ak.Array
+        Array of non b-tagged jets, pt ordered (e.g. BJetBad).
+
+    k : int
+        Number of hypotheses kept per event, at least 1.
+
+    metric : numba.njit function
+        Score `metric(mjj, mbjj)` of a hypothesis, the lowest is the best.
+
+    max_bjets, max_lightjets : int
+        Only the leading jets of each collection are considered.
+
+    w_mass_bounds, top_mass_bounds : tuple
+        (low, high) masses outside of which the W or the top candidate is pruned,
+        None for no bound. The default windows are 4 sigma of the chi2 resolutions
+        around the W and top masses, (None, None) keeps every hypothesis.
+
+    Returns
+    -------
+    ak.Array
+        Jagged array of at most `k` top candidates per event, ordered by score,
+        with the top four-vector, the W mass `mjj`, the `score` and the indices
+        `b_idx`, `j1_idx`, `j2_idx` of the jets in the input collections.
+    """
+    if k < 1:
+        raise ValueError(f"At least one hypothesis per event must be kept, got k={k}")
+
+    def bounds(low_high):
+        low, high = low_high
+        return (-np.inf if low is None else low), (np.inf if high is None else high)
+
+    b_offsets, (b_pt, b_eta, b_phi, b_mass) = _flat_jets(bjets)
+    l_offsets, (l_pt, l_eta, l_phi, l_mass) = _flat_jets(lightjets)
+    score, idx, top, mjj = _triplet_kernel(
+        b_offsets, b_pt, b_eta, b_phi, b_mass,
+        l_offsets, l_pt, l_eta, l_phi, l_mass,
+        max_bjets, max_lightjets, k,
+        *bounds(w_mass_bounds), *bounds(top_mass_bounds), metric,
+    )
+
+    # The hypotheses found are at the front of each row, the rest is at +inf
+    found = np.isfinite(score)
+    counts = found.sum(axis=1)
+    fields = {
+        "pt": top[:, :, 0][found],
+        "eta": top[:, :, 1][found],
+        "phi": top[:, :, 2][found],
+        "mass": top[:, :, 3][found],
+        "mjj": mjj[found],
+        "score": score[found],
+        "b_idx": idx[:, :, 0][found],
+        "j1_idx": idx[:, :, 1][found],
+        "j2_idx": idx[:, :, 2][found],
+    }
+    return ak.zip(
+        {var: ak.unflatten(value, counts) for var, value in fields.items()},
+        with_name="PtEtaPhiMCandidate"
+    )
+
 def bjj_deltaR(bjets, dijet):
     '''
     Reconstructs a top quark candidate by combining a dijet system (W candidate)
@@ -105,7 +488,12 @@ def bjj_deltaR(bjets, dijet):
         Four-vector sum of the dijet and the closest b-jet, interpreted as the
         reconstructed top quark candidate.
     '''
-    
+    return reconstruct_top_candidates(bjets, dijet, strategies=["deltaR"])["deltaR"]
+
+def _bjj_deltaR_awkward(bjets, dijet):
+    '''
+    Reference implementation of `bjj_deltaR` built from awkward combinations.
+    '''
     # Form all unique unordered pairs of bjets per event
     paris = ak.argcombinations(bjets, 2, axis=1)
     b1 = bjets[paris.slot0]
@@ -119,7 +507,7 @@ def bjj_deltaR(bjets, dijet):
     min_b_to_jj = ak.where(deltaR_b_to_jj_1 < deltaR_b_to_jj_2, b1, b2)
 
     # Combine the closest b-jet with the dijet to form a top candidate
-    bjj = combine_jets(min_b_to_jj, dijet)
+    bjj = _combine_jets_awkward(min_b_to_jj, dijet)
 
     return bjj
 
@@ -143,18 +531,24 @@ def bjj_deltaM(bjets, dijet):
     ak.Array
         Top candidate (bjj) four-vector with best mass match.
     """
+    return reconstruct_top_candidates(bjets, dijet, strategies=["deltaM"])["deltaM"]
+
+def _bjj_deltaM_awkward(bjets, dijet):
+    '''
+    Reference implementation of `bjj_deltaM` built from awkward combinations.
+    '''
     # Form all unique unordered pairs of bjets per event
     paris = ak.argcombinations(bjets, 2, axis=1)
     b1 = bjets[paris.slot0]
     b2 = bjets[paris.slot1]
 
     # Combine dijet with each b-jet
-    bjj_1 = combine_jets(b1, dijet)
-    bjj_2 = combine_jets(b2, dijet)
+    bjj_1 = _combine_jets_awkward(b1, dijet)
+    bjj_2 = _combine_jets_awkward(b2, dijet)
 
     # Define mass window
-    target_low, target_high = 170, 180
-    top_nominal = 172.52
+    target_low, target_high = TOP_MASS_WINDOW
+    top_nominal = TOP_MASS_NOMINAL
 
     # Distance to [170, 180] window
     def dist_to_range(mass):
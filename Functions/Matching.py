@@ -0,0 +1,116 @@
+import awkward as ak
+import numpy as np
+import numba
+
+from .JetsCom import _flat_jets, _delta_r
+
+@numba.njit(cache=True)
+def _greedy_match_kernel(offsets1, pt1, eta1, phi1,
+                         offsets2, pt2, eta2, phi2, dr_min):
+    '''
+    Per-event greedy one-to-one ΔR matching: the closest free (obj, obj2) pair
+    below `dr_min` is matched first, then the next closest, and so on.
+    Objects with pt <= 0 (the zero placeholders of get_dijet and combine_jets)
+    are never matched. Returns the flat indices of the matched objects and their
+    ΔR in matching order, and the number of matches per event.
+    '''
+    nev = len(offsets1) - 1
+    nmax = min(len(pt1), len(pt2))
+    idx1 = np.empty(nmax, dtype=np.int64)
+    idx2 = np.empty(nmax, dtype=np.int64)
+    drs = np.empty(nmax)
+    counts = np.zeros(nev, dtype=np.int64)
+    n = 0
+    for i in range(nev):
+        s1, n1 = offsets1[i], offsets1[i + 1] - offsets1[i]
+        s2, n2 = offsets2[i], offsets2[i + 1] - offsets2[i]
+        if n1 == 0 or n2 == 0:
+            continue
+
+        # Singleton candidates: a single comparison
+        if n1 == 1 and n2 == 1:
+            if pt1[s1] > 0 and pt2[s2] > 0:
+                dr = _delta_r(eta1[s1], phi1[s1], eta2[s2], phi2[s2])
+                if dr < dr_min:
+                    idx1[n], idx2[n], drs[n] = s1, s2, dr
+                    counts[i] = 1
+                    n += 1
+            continue
+
+        dr = np.empty((n1, n2))
+        for a in range(n1):
+            for b in range(n2):
+                dr[a, b] = _delta_r(eta1[s1 + a], phi1[s1 + a], eta2[s2 + b], phi2[s2 + b])
+        used1 = pt1[s1:s1 + n1] <= 0
+        used2 = pt2[s2:s2 + n2] <= 0
+        while True:
+            best, best_a, best_b = dr_min, -1, -1
+            for a in range(n1):
+                if used1[a]:
+                    continue
+                for b in range(n2):
+                    if not used2[b] and dr[a, b] < best:
+                        best, best_a, best_b = dr[a, b], a, b
+            if best_a < 0:
+                break
+            used1[best_a] = True
+            used2[best_b] = True
+            idx1[n], idx2[n], drs[n] = s1 + best_a, s2 + best_b, best
+            counts[i] += 1
+            n += 1
+    return idx1[:n], idx2[:n], drs[:n], counts
+
+def object_matching(obj, obj2, dr_min):
+    '''
+    Greedy one-to-one ΔR matching of two jagged collections, computed event by
+    event in a compiled loop instead of building the cartesian product.
+
+    Parameters
+    ----------
+    obj, obj2 : ak.Array
+        Jagged collections with pt, eta, phi fields.
+
+    dr_min : float
+        Maximum ΔR for a pair to be matched.
+
+    Returns
+    -------
+    tuple of ak.Array
+        Matched objects of `obj`, matched objects of `obj2` and their ΔR,
+        jagged, one entry per matched pair, closest pair first.
+    '''
+    offsets1, (pt1, eta1, phi1, _) = _flat_jets(obj)
+    offsets2, (pt2, eta2, phi2, _) = _flat_jets(obj2)
+    idx1, idx2, deltaR, counts = _greedy_match_kernel(
+        offsets1, pt1, eta1, phi1,
+        offsets2, pt2, eta2, phi2, dr_min,
+    )
+    matched = ak.unflatten(ak.flatten(obj, axis=1)[idx1], counts)
+    matched2 = ak.unflatten(ak.flatten(obj2, axis=1)[idx2], counts)
+    return matched, matched2, ak.unflatten(deltaR, counts)
+
+def _candidate_lists(cand):
+    '''
+    Candidates as lists per event: a record per event becomes a list of length 1
+    (`ak.singletons` would turn each field into a list on non-option records).
+    Missing candidates and the zero-filled placeholders (pt == 0) of get_dijet and
+    reconstruct_top_candidates are dropped, so they never match each other.
+    '''
+    if cand.ndim == 1:
+        # Variable-length lists, a regular mask would be applied as a 2-D index
+        cand = ak.unflatten(cand, np.ones(len(cand), dtype=np.int64))
+    return cand[ak.fill_none(cand.pt > 0, False)]
+
+def object_matching1(cand, cand2, dr_min):
+    '''
+    Matches the reconstructed candidates (jj, bjj_deltaR, bjj_deltaM) to the
+    Gen-level ones within `dr_min`. The candidates can be one record per event
+    (get_dijet, reconstruct_top_candidates) or singleton lists (to_singleton_jet).
+
+    Returns
+    -------
+    tuple of ak.Array
+        Matched reco candidate, matched Gen candidate and their ΔR, as lists
+        of length 1 in matched events and empty otherwise.
+    '''
+    return object_matching(_candidate_lists(cand), _candidate_lists(cand2), dr_min)
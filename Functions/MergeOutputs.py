@@ -0,0 +1,179 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import hist
+from coffea.util import load, save
+
+from .ColumnsExport import write_columns
+
+def add_inplace(total, new):
+    """
+    Adds the output `new` into `total`, in place where possible: histograms are
+    summed bin by bin, dictionaries merged recursively, lists concatenated.
+    Returns the merged output.
+    """
+    if total is None:
+        return new
+    if isinstance(total, dict):
+        for key, value in new.items():
+            total[key] = add_inplace(total.get(key), value)
+        return total
+    if isinstance(total, hist.Hist):
+        total += new
+        return total
+    if isinstance(total, list):
+        total.extend(new)
+        return total
+    if isinstance(total, set):
+        total |= new
+        return total
+    if isinstance(total, str):
+        # Metadata strings are the same in every job
+        return total
+    return total + new
+
+def spill_columns(output, directory, name):
+    """
+    Moves the column accumulators of `output` to Parquet files under `directory`,
+    leaving only their paths in output["columns_manifest"].
+    """
+    columns = output.pop("columns", {})
+    manifest = output.setdefault("columns_manifest", {})
+    for sample, datasets in columns.items():
+        spilled = write_columns(datasets, directory, sample, name)
+        add_inplace(manifest, {sample: spilled})
+    return output
+
+def load_input(path, columns_dir=None):
+    output = load(path)
+    if columns_dir is not None and "columns" in output:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = spill_columns(output, columns_dir, name)
+    return output
+
+def merge_group(paths, out_path, columns_dir=None):
+    """
+    Merges `paths` into `out_path`, keeping only the running total and the file
+    being added in memory. The output is written atomically, an existing one is
+    kept as is, so that an interrupted merge can be resumed.
+    """
+    if os.path.exists(out_path):
+        return out_path
+    total = None
+    for path in paths:
+        total = add_inplace(total, load_input(path, columns_dir))
+    save(total, out_path + ".tmp")
+    os.replace(out_path + ".tmp", out_path)
+    return out_path
+
+def group_key(paths):
+    """
+    Hash of a group of files to merge: their paths, sizes and modification times,
+    so that an intermediate file is only reused for exactly the same inputs.
+    """
+    parts = [[path, os.path.getsize(path), os.path.getmtime(path)] for path in sorted(paths)]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+def columns_directory(output, spill=True):
+    """
+    Absolute directory of the spilled columns of `output`, None without spilling.
+    The manifests keep these paths, so they stay valid from any working directory.
+    """
+    return os.path.abspath(output + ".columns") if spill else None
+
+def tree_merge(inputs, output, workdir, fan_in=8, workers=4, spill=True):
+    """
+    Merges the job outputs as a tree: groups of `fan_in` files are merged in
+    parallel by `workers` processes into intermediate files under `workdir`,
+    level after level, until one output is left. At most `workers * 2` files
+    are open at a time. The intermediate files are named after a hash of their
+    inputs, so re-running with the same inputs and `workdir` resumes from the
+    ones already written and changed inputs are merged again.
+
+    The columns are spilled to `<output>.columns`, outside of `workdir`, which
+    can be removed after the merge.
+    """
+    if not inputs:
+        raise ValueError("No input to merge")
+    os.makedirs(workdir, exist_ok=True)
+    columns_dir = columns_directory(output, spill)
+    level, paths = 0, sorted(inputs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # A single input still goes through one level, to spill its columns
+        while len(paths) > 1 or level == 0:
+            groups = [paths[i:i + fan_in] for i in range(0, len(paths), fan_in)]
+            outs = [os.path.join(workdir, f"level{level}_{group_key(group)}.coffea") for group in groups]
+            # Columns are spilled when the job outputs are first read
+            cols = columns_dir if level == 0 else None
+            paths = list(pool.map(merge_group, groups, outs, [cols] * len(groups)))
+            level += 1
+    os.replace(paths[0], output)
+    return output
+
+def watch(directory, output, pattern="output_job_*.coffea", interval=60.,
+          njobs=None, settle=30., spill=True):
+    """
+    Polls `directory` and folds every new job output into the running total
+    `output` as soon as it is complete (not modified for `settle` seconds).
+
+    The list of merged job files is stored in the output itself under
+    "merged_jobs", and the output is replaced atomically after each fold, so it
+    can be read at any time and a restarted watcher never counts a job twice.
+    Stops once `njobs` jobs are merged, or never if None.
+    """
+    columns_dir = columns_directory(output, spill)
+    total = load(output) if os.path.exists(output) else {"merged_jobs": []}
+    merged = set(total["merged_jobs"])
+    print(f"Resuming with {len(merged)} merged jobs")
+    while njobs is None or len(merged) < njobs:
+        now = time.time()
+        new = [
+            path for path in sorted(glob.glob(os.path.join(directory, pattern)))
+            if os.path.basename(path) not in merged and now - os.path.getmtime(path) > settle
+        ]
+        for path in new:
+            total = add_inplace(total, load_input(path, columns_dir))
+            merged.add(os.path.basename(path))
+            total["merged_jobs"] = sorted(merged)
+            save(total, output + ".tmp")
+            os.replace(output + ".tmp", output)
+            print(f"Merged {path} ({len(merged)} jobs)")
+        if njobs is None or len(merged) < njobs:
+            time.sleep(interval)
+    return output
+
+if __name__ == "__main__":
+    # export PYTHONPATH=..:$PYTHONPATH
+    # python -m Functions.MergeOutputs -o output_condor/output_all.coffea output_condor/output_job_*.coffea
+    # python -m Functions.MergeOutputs -o output_condor/output_all.coffea --watch output_condor --njobs 100
+    parser = argparse.ArgumentParser(description="Out-of-core tree merge of pocket-coffea outputs")
+    parser.add_argument("inputs", nargs="*")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--workdir", default=None,
+                        help="Intermediate files, kept to resume (default: <output>.merge)")
+    parser.add_argument("--fan-in", type=int, default=8)
+    parser.add_argument("-j", "--workers", type=int, default=4)
+    parser.add_argument("--in-memory-columns", action="store_true",
+                        help="Concatenate the column accumulators instead of spilling them to Parquet")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="Fold the job outputs of DIR into the output as they land")
+    parser.add_argument("--njobs", type=int, default=None, help="Stop watching after this many jobs")
+    parser.add_argument("--interval", type=float, default=60., help="Seconds between polls")
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(args.watch, args.output, interval=args.interval, njobs=args.njobs,
+              spill=not args.in_memory_columns)
+        raise SystemExit
+
+    inputs = sorted(set(p for pattern in args.inputs for p in glob.glob(pattern)))
+    tree_merge(
+        inputs, args.output, args.workdir or args.output + ".merge",
+        fan_in=args.fan_in, workers=args.workers, spill=not args.in_memory_columns,
+    )
+    print(f"Merged {len(inputs)} outputs into {args.output}")
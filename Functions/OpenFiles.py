@@ -1,3 +1,9 @@
+import json
+import os
+import pickle
+from collections.abc import Mapping
+
+import numpy as np
 import pandas as pd
 
 def extract_dataframes(data):
@@ -59,3 +65,274 @@ def extract_combined_dfs(data, df_dict):
 
     return df_per_channel
 
+
+def _wrap_arrow(v4):
+    """
+    Wraps a NumPy column in an Arrow array sharing its buffer. 2-D columns become
+    fixed-size lists over the same buffer. Boolean and object columns, which
+    Arrow stores differently, are copied into the same layout.
+    """
+    import pyarrow as pa
+
+    if v4.dtype == bool or v4.dtype == object:
+        flat = pa.array(v4.ravel())
+    else:
+        v4 = np.ascontiguousarray(v4)  # no copy for the contiguous accumulators
+        flat = pa.Array.from_buffers(
+            pa.from_numpy_dtype(v4.dtype), v4.size, [None, pa.py_buffer(v4)]
+        )
+    if v4.ndim == 1:
+        return flat
+    return pa.FixedSizeListArray.from_arrays(flat, v4.shape[1])
+
+def extract_arrow_tables(data, columns=None):
+    """
+    Zero-copy version of `extract_dataframes`: every dataset/year/category becomes
+    an Arrow table over the column accumulator buffers, with the same keys.
+    Only `columns` (accumulator names, e.g. "jj_pt") are wrapped if given.
+    """
+    import pyarrow as pa
+
+    tables = {}
+
+    for dataset in data["columns"].keys():
+        for k1, v1 in data["columns"][dataset].items():
+            for k2, v2 in v1.items():
+                arrays = {
+                    k3: _wrap_arrow(v3.value) for k3, v3 in v2.items()
+                    if hasattr(v3, "value") and (columns is None or k3 in columns)
+                }
+                if arrays:
+                    tables[f"{dataset}_{k1}_{k2}"] = pa.table(arrays)
+
+    return tables
+
+def combine_arrow_tables(data, tables):
+    """
+    Same as `extract_combined_dfs` on Arrow tables: the years of each channel are
+    concatenated as chunks, without copying the columns.
+    """
+    import pyarrow as pa
+
+    years = list(data.get("datasets_metadata", {}).get("by_datataking_period", {}).keys())
+    channels = list(data.get("columns", {}).keys())
+
+    table_per_channel = {}
+
+    for channel in channels:
+        parts = [tables.get(f"{channel}_{channel}_{year}_baseline") for year in years]
+        parts = [t for t in parts if t is not None]
+
+        if parts:
+            table_per_channel[f"df_{channel}"] = pa.concat_tables(parts)
+
+    return table_per_channel
+
+def _is_2d(col):
+    """
+    Fixed-size list column, or list column with rows all of the same length
+    (2-D columns read back from Parquet files written by awkward).
+    """
+    import pyarrow as pa
+
+    if pa.types.is_fixed_size_list(col.type):
+        return True
+    if not (pa.types.is_list(col.type) or pa.types.is_large_list(col.type)):
+        return False
+    col = col.combine_chunks() if hasattr(col, "combine_chunks") else col
+    lengths = col.value_lengths().to_numpy(zero_copy_only=False)
+    return len(lengths) > 0 and (lengths == lengths[0]).all()
+
+def _split_2d(data_dict, name, col, index=None):
+    """
+    Adds the components of a 2-D Arrow column (see `_is_2d`) to `data_dict` as
+    `name_1.._n`, or only the component `index` (1-based) as `name`.
+    """
+    col = col.combine_chunks() if hasattr(col, "combine_chunks") else col
+    v4 = col.flatten().to_numpy(zero_copy_only=False).reshape(len(col), -1)
+    if index is not None:
+        data_dict[name] = v4[:, index - 1]
+        return
+    for i in range(v4.shape[1]):
+        data_dict[f"{name}_{i+1}"] = v4[:, i]
+
+def arrow_to_dataframe(table, columns=None):
+    """
+    Materialises only `columns` of an Arrow table as a DataFrame. The 2-D
+    columns are split into `_1.._n`, and `name_i` selects a single component.
+    """
+    if columns is None:
+        columns = table.column_names
+
+    data_dict = {}
+    for name in columns:
+        base, _, index = name.rpartition("_")
+        if name not in table.column_names and base in table.column_names and index.isdigit():
+            _split_2d(data_dict, name, table[base], int(index))
+            continue
+        col = table[name]
+        if _is_2d(col):
+            _split_2d(data_dict, name, col)
+        else:
+            data_dict[name] = col.to_numpy()
+    return pd.DataFrame(data_dict)
+
+def _parquet_to_dict(paths, columns=None):
+    """
+    Reads Parquet files into a dict of NumPy columns, splitting the 2-D columns
+    into `_1.._n` like `extract_dataframes`.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.concat_tables([pq.read_table(path, columns=columns) for path in paths])
+    data_dict = {}
+    for name in table.column_names:
+        col = table[name].combine_chunks()
+        if _is_2d(col):
+            _split_2d(data_dict, name, col)
+        else:
+            data_dict[name] = col.to_numpy(zero_copy_only=False)
+    return data_dict
+
+def extract_parquet_dataframes(data, columns=None):
+    """
+    Same as `extract_dataframes` for outputs written with `columns_export.mode: parquet`:
+    the DataFrames are read from the Parquet files listed in data["columns_manifest"].
+    """
+    df_dict = {}
+
+    for dataset, v1 in data["columns_manifest"].items():
+        for k1, v2 in v1.items():
+            for k2, paths in v2.items():
+                df_dict[f"{dataset}_{k1}_{k2}"] = pd.DataFrame(_parquet_to_dict(paths, columns))
+
+    return df_dict
+
+
+def write_lazy_output(path, out_dir=None):
+    """
+    Writes the companion on-disk format of a .coffea output read by `LazyOutput`:
+    every column as a .npy file, every variable as its own pickle, the rest
+    in one small pickle, and an index.json of the keys. The output is loaded
+    once here, never again afterwards.
+    """
+    from coffea.util import load
+
+    out_dir = out_dir or path + ".lazy"
+    data = load(path)
+    index = {"columns": {}, "variables": []}
+
+    for dataset, v1 in data.pop("columns", {}).items():
+        for k1, v2 in v1.items():
+            for k2, v3 in v2.items():
+                names = []
+                for k3, acc in v3.items():
+                    if not hasattr(acc, "value"):
+                        continue
+                    col_dir = os.path.join(out_dir, "columns", dataset, k1, k2)
+                    os.makedirs(col_dir, exist_ok=True)
+                    np.save(os.path.join(col_dir, f"{k3}.npy"), acc.value, allow_pickle=True)
+                    names.append(k3)
+                index["columns"].setdefault(dataset, {}).setdefault(k1, {})[k2] = names
+
+    os.makedirs(os.path.join(out_dir, "variables"), exist_ok=True)
+    for name, hists in data.pop("variables", {}).items():
+        with open(os.path.join(out_dir, "variables", f"{name}.pkl"), "wb") as f:
+            pickle.dump(hists, f)
+        index["variables"].append(name)
+
+    index["other"] = list(data.keys())
+    with open(os.path.join(out_dir, "other.pkl"), "wb") as f:
+        pickle.dump(data, f)
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    return out_dir
+
+class MappedColumn:
+    """
+    Column accumulator stand-in whose `.value` is memory-mapped from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def value(self):
+        try:
+            return np.load(self.path, mmap_mode="r")
+        except ValueError:
+            # Object arrays cannot be memory-mapped
+            return np.load(self.path, allow_pickle=True)
+
+class _LazyMapping(Mapping):
+    def __init__(self, keys, loader):
+        self._keys = list(keys)
+        self._loader = loader
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key not in self._cache:
+            self._cache[key] = self._loader(key)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+class LazyOutput(_LazyMapping):
+    """
+    Lazy view of a .coffea output, from the companion format of `write_lazy_output`
+    (`<output>.coffea.lazy`). The keys come from a small index, `columns` are
+    memory-mapped on access, `variables` unpickled one at a time, and the rest
+    (`datasets_metadata`, `cutflow`, ...) loaded on first use. It can be passed to
+    `extract_dataframes` or `extract_arrow_tables` in place of the loaded output.
+    """
+
+    def __init__(self, path):
+        self.path = path if os.path.isdir(path) else path + ".lazy"
+        if not os.path.exists(os.path.join(self.path, "index.json")):
+            raise FileNotFoundError(
+                f"No lazy output in {self.path}, create it with write_lazy_output({path!r})"
+            )
+        with open(os.path.join(self.path, "index.json")) as f:
+            self.index = json.load(f)
+        self._other = None
+        super().__init__(["columns", "variables"] + self.index["other"], self._load)
+
+    def _load(self, key):
+        if key == "columns":
+            return self._columns()
+        if key == "variables":
+            return _LazyMapping(self.index["variables"], self._variable)
+        if self._other is None:
+            with open(os.path.join(self.path, "other.pkl"), "rb") as f:
+                self._other = pickle.load(f)
+        return self._other[key]
+
+    def _variable(self, name):
+        with open(os.path.join(self.path, "variables", f"{name}.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def _columns(self):
+        base = os.path.join(self.path, "columns")
+        return {
+            dataset: {
+                k1: {
+                    k2: {k3: MappedColumn(os.path.join(base, dataset, k1, k2, f"{k3}.npy")) for k3 in names}
+                    for k2, names in v2.items()
+                }
+                for k1, v2 in v1.items()
+            }
+            for dataset, v1 in self.index["columns"].items()
+        }
+
+if __name__ == "__main__":
+    # python OpenFiles.py output_run2/output_all.coffea
+    import sys
+    for path in sys.argv[1:]:
+        print(f"Written {write_lazy_output(path)}")
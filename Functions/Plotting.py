@@ -9,22 +9,105 @@ import seaborn as sns
 import pandas as pd
 from matplotlib.colors import Normalize
 import copy
+import hashlib
+import json
 import math
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 import textwrap
+import hist
 from pocket_coffea.parameters.lumi import lumi
+try:
+    from .Sketch import QuantileSketch
+    from .Efficiency import fill_efficiencies, efficiency_intervals, hist_efficiency
+except ImportError:
+    # Plotting imported directly from the Functions directory, as in the notebooks
+    from Sketch import QuantileSketch
+    from Efficiency import fill_efficiencies, efficiency_intervals, hist_efficiency
+
+def fill_hists(datasets, columns=None, bins=50, limits=None):
+    """
+    Fills, in a single pass over each DataFrame, one 1-D histogram per dataset and
+    column, binned over the common range of the column across the datasets.
+
+    Parameters:
+        limits (dict): {column: (low, high)} used for the columns without any finite
+            value, which are skipped otherwise.
 
-def inital_distributions_plot(datasets, bins=50):
+    Returns:
+        dict: {dataset: {column: hist.Hist}}, to be passed to the plotting functions.
+    """
+    if isinstance(datasets, pd.DataFrame):
+        datasets = {'Dataset': datasets}
+    if columns is None:
+        columns = list(next(iter(datasets.values())).columns)
+    limits = limits or {}
+
+    hists = {name: {} for name in datasets}
+    for column in columns:
+        low, high = np.inf, -np.inf
+        for df in datasets.values():
+            if column in df.columns:
+                values = df[column].values
+                values = values[np.isfinite(values)]
+                if values.size:
+                    low, high = min(low, values.min()), max(high, values.max())
+        if not np.isfinite(low) and column not in limits:
+            continue
+        low, high = _axis_range(low, high, limits.get(column))
+        for name, df in datasets.items():
+            if column not in df.columns:
+                continue
+            h = hist.Hist(hist.axis.Regular(bins, low, _upper_edge(high), name=column))
+            h.fill(df[column].values)
+            hists[name][column] = h
+    return hists
+
+def project_hist(h, cat="baseline", variation="nominal"):
+    """
+    Selects a category and a variation of a histogram from the processor's `variables`,
+    for the axes it has.
+    """
+    selection = {}
+    if "cat" in h.axes.name:
+        selection["cat"] = cat
+    if "variation" in h.axes.name:
+        selection["variation"] = variation
+    return h[selection] if selection else h
+
+def _is_hist(obj):
+    return isinstance(obj, hist.Hist)
+
+def _upper_edge(value):
+    # hist excludes the upper edge of the last bin, unlike np.histogram
+    return np.nextafter(value, np.inf)
+
+def _axis_range(low, high, limits=None):
+    # Range of the data, or `limits` (else [0, 1]) when there is no finite value
+    if not (np.isfinite(low) and np.isfinite(high)):
+        low, high = limits if limits is not None else (0., 1.)
+    if high <= low:
+        high = low + 1
+    return low, high
+
+def inital_distributions_plot(datasets, bins=50, limits=None):
     """
     Function to plot the variables from the datasets.
+    Takes DataFrames, or pre-filled histograms {dataset: {column: hist.Hist}}
+    (see `fill_hists`), in which case nothing is re-binned. `limits` gives the
+    range of the columns without any finite value, see `fill_hists`.
     """
     # Handle the case when a single DataFrame is passed
     if isinstance(datasets, pd.DataFrame):
         datasets = {'Dataset': datasets}
+    first_key = next(iter(datasets))
+    if not isinstance(datasets[first_key], dict):
+        datasets = fill_hists(datasets, bins=bins, limits=limits)
 
     # Extract column names from the first dataset
-    first_key = next(iter(datasets))
-    df_first = datasets[first_key]
-    num_variables = len(df_first.columns)
+    columns = list(datasets[first_key].keys())
+    num_variables = len(columns)
 
     num_rows = math.ceil(math.sqrt(num_variables))
     num_cols = math.ceil(num_variables / num_rows)
@@ -32,14 +115,16 @@ def inital_distributions_plot(datasets, bins=50):
     fig, axes = plt.subplots(nrows=num_rows, ncols=num_cols, figsize=(18, 16))
     fig.suptitle(f"Distribution of {num_variables} Variables", fontsize=18, fontweight="bold")
 
-    axes = axes.flatten()
+    axes = np.atleast_1d(axes).flatten()
 
-    for i, column in enumerate(df_first.columns):  
+    for i, column in enumerate(columns):  
         ax = axes[i]
 
         # Plot each dataset on the same axes for comparison
-        for dataset_name, dataset_df in datasets.items():
-            dataset_df[column].hist(ax=ax, bins=bins, alpha=0.7, label=f'{dataset_name}', edgecolor='black')
+        for dataset_name, hists in datasets.items():
+            if column in hists:
+                hep.histplot(hists[column], ax=ax, histtype="fill", alpha=0.7,
+                             label=f'{dataset_name}', edgecolor='black')
 
         # Set titles and labels for clarity
         ax.set_title(column, fontsize=12)
@@ -57,6 +142,8 @@ def inital_distributions_plot(datasets, bins=50):
     plt.show()
 
 
+_cms_style_set = False
+
 def setup_plot():
     """
     Helper function to set up a consistent plot style for all plots,
@@ -65,8 +152,11 @@ def setup_plot():
     Returns:
         fig, ax: The figure and axis objects.
     """
-    # Use CMS style
-    hep.style.use("CMS")
+    # Use CMS style, once per process
+    global _cms_style_set
+    if not _cms_style_set:
+        hep.style.use("CMS")
+        _cms_style_set = True
     # Create plot
     fig, ax = plt.subplots(figsize=(10, 8))
 
@@ -113,42 +203,59 @@ def get_lumi_display(year):
         return f"Unknown Lumi for {year}"
 
 
-def stacked_hist(datasets, column_name, year, xlim_upper=None, bins=100, drop_zeros=False, xlim_lower=0):
+def fill_stacked_hist(datasets, column_name, xlim_upper=None, bins=100, drop_zeros=False, xlim_lower=0):
     """
-    Plots a stacked histogram for the specified column from the datasets, with CMS styling.
+    Fills the histograms of `stacked_hist` from DataFrames in one pass per dataset.
     """
     # Convert single DataFrame to a dictionary if necessary
     if isinstance(datasets, pd.DataFrame):
         datasets = {'Dataset': datasets}
-        
-    fig, ax = setup_plot()
-
-    data_for_stack = []
-    labels = list(datasets.keys())
-    global_max = -float('inf')  # For automatic xlim_upper
 
+    values = {}
     for name, df in datasets.items():
         if column_name in df.columns:
-            data = df[column_name].dropna()
+            data = df[column_name].values
+            mask = ~np.isnan(data) & (data >= xlim_lower)
             if drop_zeros:
-                data = data[data != 0]
-            # Clip by lower bound only for now
-            data = data[data >= xlim_lower]
-            if xlim_upper is None:
-                if not data.empty:
-                    global_max = max(global_max, data.max())
-            else:
-                data = data[data <= xlim_upper]
-            data_for_stack.append(data)
+                mask &= data != 0
+            values[name] = data[mask]
         else:
             print(f"Warning: Column '{column_name}' not found in dataset '{name}'")
 
     # Set xlim_upper automatically if it was None
     if xlim_upper is None:
-        xlim_upper = global_max if global_max != -float('inf') else xlim_lower + 1  # fallback to prevent crash
+        maxima = [v.max() for v in values.values() if v.size]
+        xlim_upper = _upper_edge(max(maxima)) if maxima else xlim_lower + 1  # fallback to prevent crash
+
+    hists = {}
+    for name, data in values.items():
+        h = hist.Hist(hist.axis.Regular(bins, xlim_lower, xlim_upper, name=column_name))
+        h.fill(data)
+        hists[name] = h
+    return hists
+
+def stacked_hist(datasets, column_name, year, xlim_upper=None, bins=100, drop_zeros=False, xlim_lower=0):
+    """
+    Plots a stacked histogram for the specified column from the datasets, with CMS styling.
+    `datasets` can also be a dict of pre-filled 1-D histograms (see `fill_stacked_hist`
+    and `project_hist`): then only the drawing and the x range are redone.
+    """
+    if _is_hist(datasets):
+        datasets = {'Dataset': datasets}
+    if not all(_is_hist(h) for h in datasets.values()):
+        datasets = fill_stacked_hist(datasets, column_name, xlim_upper, bins, drop_zeros, xlim_lower)
+
+    fig, ax = setup_plot()
+
+    labels = list(datasets.keys())
+    hists = list(datasets.values())
+
+    if xlim_upper is None:
+        xlim_upper = hists[0].axes[0].edges[-1] if hists else xlim_lower + 1
 
     # Plot the stacked histogram
-    plt.hist(data_for_stack, bins=bins, stacked=True, label=labels, edgecolor=None, alpha=1)
+    if hists:
+        hep.histplot(hists, ax=ax, stack=True, histtype="fill", label=labels, edgecolor=None, alpha=1)
 
     plt.xlabel(column_name, fontsize=16)
     plt.ylabel("Counts", fontsize=16)
@@ -169,36 +276,84 @@ def stacked_hist(datasets, column_name, year, xlim_upper=None, bins=100, drop_ze
     plt.tight_layout()
     plt.show()
 
-def heat_map(datasets, var1, var2, xlim, ylim, year, bins=100):
+def fill_heat_map(datasets, var1, var2, bins=100, weight=None, sketch=None, xlim=None, ylim=None):
     """
-    Plots a 2D heatmap where each bin along var1 (x-axis, quantile bins) is normalized to 1 over var2 (y-axis, linear bins).
-    Drops zero values from both variables.
+    Fills the weighted 2-D histogram of `heat_map`: quantile bins along var1, linear
+    bins along var2. Drops missing and zero values from both variables.
+
+    The quantile edges come from a streaming weighted `QuantileSketch`, filled dataset
+    by dataset (or given through `sketch`, e.g. accumulated in the processor), so the
+    datasets are never concatenated. Without data, or with less than two distinct
+    edges, var1 falls back to linear bins.
+
+    Parameters:
+        weight (str): Column with the event weights (e.g. genWeight * lumi * XS * pileup),
+            None for unit weights.
+        sketch (QuantileSketch): Pre-filled sketch of var1.
+        xlim, ylim (tuple): Ranges of var1 and var2 used when there is no data.
     """
 
     # Support both dict and single DataFrame
-    if isinstance(datasets, dict):
-        x = np.concatenate([df[var1].dropna() for df in datasets.values()])
-        y = np.concatenate([df[var2].dropna() for df in datasets.values()])
-    else:
-        x = datasets[var1].dropna().values
-        y = datasets[var2].dropna().values
+    if not isinstance(datasets, dict):
+        datasets = {'Dataset': datasets}
 
-    # Drop zero values from both arrays
-    nonzero_mask = (x != 0) & (y != 0)
-    x = x[nonzero_mask]
-    y = y[nonzero_mask]
+    def selected(df):
+        x, y = df[var1].values, df[var2].values
+        w = df[weight].values if weight is not None else np.ones_like(x, dtype=float)
+        mask = ~np.isnan(x) & ~np.isnan(y) & (x != 0) & (y != 0)
+        return x[mask], y[mask], w[mask]
+
+    # First pass: quantiles of var1 and range of var2
+    fill_sketch = sketch is None
+    if fill_sketch:
+        sketch = QuantileSketch()
+    x_min, x_max, y_min, y_max = np.inf, -np.inf, np.inf, -np.inf
+    for df in datasets.values():
+        x, y, w = selected(df)
+        if fill_sketch:
+            sketch.fill(x, w)
+        if x.size:
+            x_min, x_max = min(x_min, x.min()), max(x_max, x.max())
+            y_min, y_max = min(y_min, y.min()), max(y_max, y.max())
+
+    x_min, x_max = _axis_range(x_min, x_max, xlim)
+    y_min, y_max = _axis_range(y_min, y_max, ylim)
+
+    # Quantile-based bins for var1 (x-axis); the sketch is accurate to `alpha`, so the
+    # outer edges are stretched to the exact range
+    quantile_bins = sketch.quantile(np.linspace(0, 1, bins + 1))
+    if not np.isnan(quantile_bins).any():
+        quantile_bins[0], quantile_bins[-1] = x_min, _upper_edge(x_max)
+        quantile_bins = np.unique(np.clip(quantile_bins, x_min, quantile_bins[-1]))
+    if np.isnan(quantile_bins).any() or quantile_bins.size < 2:
+        x_axis = hist.axis.Regular(bins, x_min, _upper_edge(x_max), name=var1)
+    else:
+        x_axis = hist.axis.Variable(quantile_bins, name=var1)
 
-    # Quantile-based bins for var1 (x-axis)
-    quantile_bins = np.quantile(x, np.linspace(0, 1, bins + 1))
+    h = hist.Hist(
+        x_axis,
+        hist.axis.Regular(bins, y_min, _upper_edge(y_max), name=var2),
+        storage=hist.storage.Weight(),
+    )
 
-    # Linear bins for var2 (y-axis)
-    linear_bins = np.linspace(y.min(), y.max(), bins + 1)
+    # Second pass: weighted filling
+    for df in datasets.values():
+        x, y, w = selected(df)
+        h.fill(x, y, weight=w)
+    return h
 
-    # Create 2D histogram
-    hist, xedges, yedges = np.histogram2d(x, y, bins=[quantile_bins, linear_bins])
+def heat_map(datasets, var1, var2, xlim, ylim, year, bins=100, weight=None):
+    """
+    Plots a 2D heatmap where each bin along var1 (x-axis, quantile bins) is normalized to 1 over var2 (y-axis, linear bins).
+    `datasets` can be DataFrames or a pre-filled 2-D histogram over (var1, var2), see `fill_heat_map`.
+    `weight` is the column of the event weights, None for unweighted entries.
+    """
+    h = datasets if _is_hist(datasets) else fill_heat_map(datasets, var1, var2, bins, weight, xlim=xlim, ylim=ylim)
+    hist2d = h.values()
+    xedges, yedges = h.axes[0].edges, h.axes[1].edges
 
     # Normalize each column (bin of var1) to sum to 1
-    hist_normalized = hist / np.maximum(hist.sum(axis=1, keepdims=True), 1e-9)
+    hist_normalized = hist2d / np.maximum(hist2d.sum(axis=1, keepdims=True), 1e-9)
 
     # Plot
     fig, ax = setup_plot()
@@ -225,20 +380,17 @@ def heat_map(datasets, var1, var2, xlim, ylim, year, bins=100):
     plt.show()
 
 
-def eff_plot(df, var1, var2, bins=10, year="2018"):
+def fill_eff_hists(df, var1, var2, bins=10):
     """
-    Plot matching efficiency as a function of gen-level transverse momentum.
-    
-    Efficiency is defined as:
-        (# gen objects with a match in var1) / (# total gen objects) in each pt bin.
-    """
-
-    # Set style
-    fig, ax = setup_plot()
+    Fills the gen-level pt histograms of all gen objects and of those with a match in var1,
+    binned linearly over the gen pt range.
 
+    Returns:
+        (hist.Hist, hist.Hist): matched and total gen objects.
+    """
     # Field names
-    pt_gen = df[f"{var2}_pt"]
-    pt_matched = df[f"{var1}_pt"]
+    pt_gen = df[f"{var2}_pt"].values
+    pt_matched = df[f"{var1}_pt"].values
 
     # Mask for valid gen entries
     gen_mask = pt_gen > 0
@@ -249,24 +401,46 @@ def eff_plot(df, var1, var2, bins=10, year="2018"):
     matched_mask = pt_matched > 0
 
     # Histogram bins based on gen pt range
-    min_pt = pt_gen.min()
-    max_pt = pt_gen.max()
-    bin_edges = np.linspace(min_pt, max_pt, bins + 1)
+    axis = hist.axis.Regular(bins, pt_gen.min(), _upper_edge(pt_gen.max()), name="pt_gen")
 
+    # Bin only those gen entries which have a match
+    h_matched = hist.Hist(axis)
+    h_matched.fill(pt_gen[matched_mask])
     # Bin gen entries
-    gen_counts, _ = np.histogram(pt_gen, bins=bin_edges)
+    h_gen = hist.Hist(axis)
+    h_gen.fill(pt_gen)
+    return h_matched, h_gen
 
-    # Bin only those gen entries which have a match
-    matched_counts, _ = np.histogram(pt_gen[matched_mask], bins=bin_edges)
+def eff_plot(df, var1, var2, bins=10, year="2018", weight=None, method="clopper-pearson"):
+    """
+    Plot matching efficiency as a function of gen-level transverse momentum.
+    
+    Efficiency is defined as:
+        (# gen objects with a match in var1) / (# total gen objects) in each pt bin.
 
-    # Efficiency
-    efficiency = np.divide(
-        matched_counts, gen_counts,
-        out=np.zeros_like(matched_counts, dtype=float),
-        where=gen_counts > 0
-    )
-    uncertainty = np.sqrt(efficiency * (1 - efficiency) / gen_counts)
-    uncertainty[gen_counts == 0] = 0
+    `df` can also be a (matched, gen) pair of pre-filled histograms, see `fill_eff_hists`,
+    or an efficiency histogram holding the "var1/var2" pair, see `Efficiency.fill_efficiencies`.
+    The error bars are weighted Clopper-Pearson (or Wilson, `method="wilson"`) intervals.
+    """
+    if isinstance(df, tuple):
+        h_matched, h_gen = df
+        bin_edges = h_gen.axes[0].edges
+        efficiency, low, high = efficiency_intervals(
+            h_matched.values(), h_gen.values(), h_gen.variances(), method
+        )
+    else:
+        if not _is_hist(df):
+            df = fill_efficiencies(df, [(var1, var2)], bins, weight)
+        bin_edges = df.axes[2].edges
+        efficiency, low, high = hist_efficiency(df, f"{var1}/{var2}", method)
+
+    # Set style
+    fig, ax = setup_plot()
+
+    # Empty bins are left out of the plot
+    filled = ~np.isnan(efficiency)
+    uncertainty = np.array([efficiency - low, high - efficiency])
+    efficiency = np.nan_to_num(efficiency)
 
     # Bin centers and widths
     bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
@@ -274,10 +448,10 @@ def eff_plot(df, var1, var2, bins=10, year="2018"):
 
     # Plot
     ax.errorbar(
-        bin_centers, efficiency, yerr=uncertainty, xerr=bin_widths,
+        bin_centers[filled], efficiency[filled], yerr=uncertainty[:, filled], xerr=bin_widths[filled],
         fmt='o', label="Gen-Match Efficiency", capsize=2
     )
-    ax.plot(bin_centers, efficiency, linestyle='-', color='C0')
+    ax.plot(bin_centers[filled], efficiency[filled], linestyle='-', color='C0')
 
     # Annotate max
     if np.any(efficiency):
@@ -308,20 +482,88 @@ def eff_plot(df, var1, var2, bins=10, year="2018"):
     plt.show()
 
 
+def _init_plot_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    warnings.filterwarnings("ignore", message=".*non-interactive.*")
+    hep.style.use("CMS")
+    global _cms_style_set
+    _cms_style_set = True
+
+def _spec_default(obj):
+    # JSON form of the plot inputs: the contents of histograms, arrays and DataFrames
+    if _is_hist(obj):
+        return {
+            "axes": [list(axis) if isinstance(axis, hist.axis.StrCategory) else axis.edges.tolist()
+                     for axis in obj.axes],
+            "values": obj.values().tolist(),
+            "variances": None if obj.variances() is None else obj.variances().tolist(),
+        }
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict("list")
+    return str(obj)
+
+def _spec_hash(spec):
+    # Canonical JSON, independent of the dict order and of the pickle protocol
+    return hashlib.sha256(
+        json.dumps(spec, sort_keys=True, default=_spec_default).encode()
+    ).hexdigest()
+
+def _render_plot(spec, outdir, formats):
+    func = globals()[spec["func"]]
+    func(*spec.get("args", ()), **spec.get("kwargs", {}))
+    fig = plt.gcf()
+    paths = []
+    for fmt in formats:
+        path = os.path.join(outdir, f"{spec['name']}.{fmt}")
+        fig.savefig(path)
+        paths.append(path)
+    plt.close("all")
+    return paths
+
+def render_plots(specs, outdir, workers=4, formats=("png", "pdf")):
+    """
+    Renders a batch of plots to files with a non-interactive backend, in parallel.
 
+    Parameters:
+        specs (list): Plot specifications, dicts with the name of a plotting function
+            of this module (`func`), its `args` and `kwargs`, and the output file
+            `name` without extension, e.g.
+            {"func": "stacked_hist", "args": (hists, "jj_mass", "2018"), "name": "jj_mass_2018"}.
+            Histogram inputs (see `fill_stacked_hist`) keep the specs small.
+        outdir (str): Output directory.
+        workers (int): Number of processes, each sets up the CMS style once.
+        formats (tuple): File formats written for every plot.
 
-
-    
-
-
-
-
-
-
-
-
-    
-
-
-
-
+    Returns:
+        list: The files written. Plots whose inputs did not change since the last
+        run (same hash in `outdir/.plot_hashes.json`) are skipped.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    hashes_path = os.path.join(outdir, ".plot_hashes.json")
+    hashes = {}
+    if os.path.exists(hashes_path):
+        with open(hashes_path) as f:
+            hashes = json.load(f)
+
+    todo = []
+    for spec in specs:
+        spec_hash = _spec_hash(spec)
+        done = all(os.path.exists(os.path.join(outdir, f"{spec['name']}.{fmt}")) for fmt in formats)
+        if done and hashes.get(spec["name"]) == spec_hash:
+            continue
+        todo.append((spec, spec_hash))
+
+    written = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_plot_worker) as pool:
+        futures = [(spec, spec_hash, pool.submit(_render_plot, spec, outdir, formats)) for spec, spec_hash in todo]
+        for spec, spec_hash, future in futures:
+            written.extend(future.result())
+            hashes[spec["name"]] = spec_hash
+
+    with open(hashes_path, "w") as f:
+        json.dump(hashes, f, indent=4)
+    print(f"Rendered {len(todo)} plots, {len(specs) - len(todo)} unchanged")
+    return written
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import awkward as ak
+import uproot
+
+def read_chunk(file, entry_start, entry_stop, branches, treepath="Events"):
+    """
+    Reads the given branches of a chunk of a (remote) file into memory.
+    """
+    with uproot.open(file) as f:
+        return f[treepath].arrays(
+            branches, entry_start=entry_start, entry_stop=entry_stop, how=dict
+        )
+
+class Prefetcher:
+    """
+    Iterates over (file, entry_start, entry_stop) chunks and reads the pruned
+    branches of the next `depth` chunks in background threads while the current
+    one is being processed.
+
+    The prefetched chunks are kept in memory, or written to `scratch_dir` as
+    Parquet files when given. Every read reserves the expected size of its arrays
+    when it is started, and no new read is started if the current chunk, the
+    outstanding reads and the new one would exceed `memory_budget_mb`. Chunks
+    written to the scratch directory no longer count once on disk.
+
+    The expected size is the average size of the chunks read so far, or, for
+    (file, entry_start, entry_stop, bytes) chunks as given by
+    `DatasetIndex.make_chunks`, the bytes of the index scaled by the ratio of the
+    read to the indexed bytes seen so far. After the loop, `report()` gives the
+    read time hidden behind the processing.
+    """
+
+    def __init__(self, chunks, branches, depth=1, memory_budget_mb=2000.,
+                 scratch_dir=None, read=read_chunk):
+        self.chunks = list(chunks)
+        self.branches = branches
+        self.depth = max(depth, 1)
+        self.memory_budget = memory_budget_mb * 1e6
+        self.scratch_dir = scratch_dir
+        self.read = read
+        self.read_seconds = 0.
+        self.wait_seconds = 0.
+        self._pending = deque()
+        # Bytes of the outstanding reads: reserved at submission, actual once read
+        self._reserved = {}
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self._sizes = []
+        # (read, indexed) bytes of the chunks carrying an index estimate
+        self._indexed_sizes = []
+        # Scratch files of this prefetcher, others may share the directory
+        self._prefix = f"chunk_{uuid.uuid4().hex}"
+        if scratch_dir is not None:
+            os.makedirs(scratch_dir, exist_ok=True)
+
+    def _fetch(self, index):
+        start = time.perf_counter()
+        arrays = self.read(*self.chunks[index][:3], self.branches)
+        # Size in memory, while read and once loaded back from the scratch file
+        nbytes = sum(array.nbytes for array in arrays.values())
+        if self.scratch_dir is not None:
+            path = os.path.join(self.scratch_dir, f"{self._prefix}_{index}.parquet")
+            ak.to_parquet(ak.zip(arrays, depth_limit=1), path)
+            arrays = path
+        return arrays, nbytes, time.perf_counter() - start
+
+    def _load(self, arrays):
+        if self.scratch_dir is None:
+            return arrays
+        table = ak.from_parquet(arrays)
+        os.remove(arrays)
+        return {field: table[field] for field in table.fields}
+
+    def _indexed(self, index):
+        chunk = self.chunks[index]
+        return chunk[3] if len(chunk) > 3 else None
+
+    def _estimate(self, index):
+        # Expected bytes of the chunk, None before the first read without an index
+        indexed = self._indexed(index)
+        if indexed is not None:
+            read_bytes = sum(size for size, _ in self._indexed_sizes)
+            indexed_bytes = sum(size for _, size in self._indexed_sizes)
+            return indexed * (read_bytes / indexed_bytes if indexed_bytes > 0 else 1.)
+        return sum(self._sizes) / len(self._sizes) if self._sizes else None
+
+    def _can_submit(self, index):
+        if not self._pending:
+            return True
+        estimate = self._estimate(index)
+        if estimate is None:
+            return False
+        with self._lock:
+            outstanding = sum(self._reserved[future] for future in self._pending)
+        return self._current_bytes + outstanding + estimate <= self.memory_budget
+
+    def _submit(self, pool, index):
+        future = pool.submit(self._fetch, index)
+        with self._lock:
+            self._reserved[future] = self._estimate(index) or 0
+
+        def read(future):
+            # Failed reads keep their reservation, the error is raised when
+            # the chunk is reached. The scratch files are not in memory.
+            if future.exception() is None:
+                with self._lock:
+                    if future in self._reserved:
+                        self._reserved[future] = 0 if self.scratch_dir is not None else future.result()[1]
+        future.add_done_callback(read)
+        self._pending.append(future)
+
+    def _cleanup(self):
+        # Chunks read ahead but never processed
+        for future in self._pending:
+            future.cancel()
+        for future in self._pending:
+            if self.scratch_dir is not None and not future.cancelled() and future.exception() is None:
+                path = future.result()[0]
+                if os.path.exists(path):
+                    os.remove(path)
+        self._pending.clear()
+        with self._lock:
+            self._reserved.clear()
+
+    def _fill(self, pool, index):
+        # Keep up to `depth` reads ahead of the current chunk, within the budget
+        while (self._next_index < len(self.chunks)
+               and self._next_index <= index + self.depth
+               and self._can_submit(self._next_index)):
+            self._submit(pool, self._next_index)
+            self._next_index += 1
+
+    def __iter__(self):
+        self._next_index = 0
+        with ThreadPoolExecutor(max_workers=self.depth) as pool:
+            try:
+                for index, chunk in enumerate(self.chunks):
+                    self._fill(pool, index)
+                    start = time.perf_counter()
+                    future = self._pending.popleft()
+                    with self._lock:
+                        self._reserved.pop(future)
+                    # Only the result of this chunk, its read errors are raised here
+                    arrays, nbytes, read_seconds = future.result()
+                    self.wait_seconds += time.perf_counter() - start
+                    self.read_seconds += read_seconds
+                    self._sizes.append(nbytes)
+                    if self._indexed(index) is not None:
+                        self._indexed_sizes.append((nbytes, self._indexed(index)))
+                    self._current_bytes = nbytes
+                    # The size of a chunk is known from the first one on
+                    self._fill(pool, index)
+                    yield chunk, self._load(arrays)
+            finally:
+                self._cleanup()
+
+    def report(self):
+        """
+        Time spent reading, time the processing actually waited for, and the
+        difference hidden by the read-ahead.
+        """
+        return {
+            "read_seconds": self.read_seconds,
+            "wait_seconds": self.wait_seconds,
+            "hidden_seconds": max(self.read_seconds - self.wait_seconds, 0.),
+        }
@@ -0,0 +1,267 @@
+import argparse
+import glob
+import os
+import threading
+import time
+
+import awkward as ak
+import numpy as np
+import psutil
+from coffea.util import load
+
+# Measures of each stage, summed over the chunks and the workers
+FIELDS = ["calls", "wall", "cpu", "peak_mb", "events_in", "events_out"]
+
+_process = psutil.Process()
+
+def rss_mb():
+    return _process.memory_info().rss / 1024.**2
+
+class _RSSSampler:
+    """
+    One background thread sampling the RSS every `interval` seconds while any
+    measurement is open, and keeping the peak seen by each of them. ru_maxrss is
+    the lifetime peak of the process and cannot be reset per measurement, and the
+    end-minus-start RSS misses the temporaries freed before the end.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._peaks = {}
+        self._next = 0
+        self._thread = None
+
+    def _run(self):
+        while True:
+            rss = rss_mb()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+            time.sleep(self.interval)
+
+    def start(self):
+        rss = rss_mb()
+        with self._lock:
+            token = self._next
+            self._next += 1
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return token, rss
+
+    def stop(self, token):
+        rss = rss_mb()
+        with self._lock:
+            return max(self._peaks.pop(token), rss)
+
+_sampler = _RSSSampler()
+
+class PeakRSS:
+    """
+    Context manager measuring the RSS at the start (`start_mb`) and the peak RSS
+    reached inside the block (`peak_mb`), in MB. `growth_mb` is the difference.
+    Measurements can be nested and run from several threads.
+    """
+
+    def __enter__(self):
+        self._token, self.start_mb = _sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.peak_mb = _sampler.stop(self._token)
+        self.growth_mb = self.peak_mb - self.start_mb
+        return False
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, peak RSS above the RSS at the start and events
+    in/out of the processor stages in `output[key]`, keyed by the stack of nested
+    stages ("apply_object_preselection;truth_object_preselection"), so that the
+    dictionaries accumulate across chunks and workers.
+
+    Only the wrapped callables are measured: when profiling is disabled nothing
+    is wrapped and there is no overhead.
+    """
+
+    def __init__(self, key="profile"):
+        self.key = key
+        self.stack = []
+
+    def measure(self, processor, name, func, nevents, *args, **kwargs):
+        """
+        Calls `func(*args, **kwargs)` as the stage `name` and records it in the output
+        of `processor`. `nevents(result)` returns the number of events before (result
+        None) and after the stage.
+        """
+        self.stack.append(name)
+        path = ";".join(self.stack)
+        n_in = nevents(None)
+        rss = PeakRSS()
+        cpu, wall = time.process_time(), time.perf_counter()
+        try:
+            with rss:
+                result = func(*args, **kwargs)
+        finally:
+            self.stack.pop()
+        stats = processor.output[self.key].setdefault(path, dict.fromkeys(FIELDS, 0))
+        stats["calls"] += 1
+        stats["wall"] += time.perf_counter() - wall
+        stats["cpu"] += time.process_time() - cpu
+        # Summed like the other fields when the outputs are accumulated, the
+        # table shows the mean peak per call
+        stats["peak_mb"] += rss.growth_mb
+        stats["events_in"] += n_in
+        stats["events_out"] += nevents(result)
+        return result
+
+class ProfiledCut:
+    """
+    Cut proxy timing `get_mask`, with the events in and passing the cut.
+    All the other attributes are the ones of the wrapped cut.
+    """
+
+    def __init__(self, cut, profiler, processor):
+        self._cut = cut
+        self._profiler = profiler
+        self._processor = processor
+
+    def __getattr__(self, name):
+        # Private and special attributes are not forwarded, e.g. while unpickling
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._cut, name)
+
+    def get_mask(self, events, *args, **kwargs):
+        def nevents(mask):
+            if mask is None:
+                return len(events)
+            # The cut functions return numpy or awkward masks, possibly with None
+            return int(np.sum(ak.to_numpy(ak.fill_none(mask, False))))
+        return self._profiler.measure(
+            self._processor, f"cut:{self._cut.name}", self._cut.get_mask, nevents,
+            events, *args, **kwargs
+        )
+
+def _self_times(profile):
+    # Wall time of each stage without the time of its nested stages
+    self_wall = {path: stats["wall"] for path, stats in profile.items()}
+    for path, stats in profile.items():
+        parent = path.rpartition(";")[0]
+        if parent in self_wall:
+            self_wall[parent] -= stats["wall"]
+    return self_wall
+
+def profile_table(profile):
+    """
+    Summary table of an accumulated profile, one row per stage, nested stages
+    indented under their parent.
+    """
+    self_wall = _self_times(profile)
+    header = (f"{'stage':<60} {'calls':>7} {'wall s':>9} {'self s':>9} {'cpu s':>9} "
+              f"{'us/event':>9} {'peak MB/call':>12} {'events in':>11} {'events out':>11} {'eff':>6}")
+    lines = [header, "-" * len(header)]
+    for path, stats in sorted(profile.items()):
+        depth = path.count(";")
+        name = "  " * depth + path.rpartition(";")[2]
+        per_event = 1e6 * stats["wall"] / stats["events_in"] if stats["events_in"] else 0.
+        eff = stats["events_out"] / stats["events_in"] if stats["events_in"] else 0.
+        lines.append(
+            f"{name:<60} {stats['calls']:>7} {stats['wall']:>9.2f} {self_wall[path]:>9.2f} "
+            f"{stats['cpu']:>9.2f} {per_event:>9.1f} {stats.get('peak_mb', 0) / max(stats['calls'], 1):>12.0f} "
+            f"{stats['events_in']:>11} {stats['events_out']:>11} {eff:>6.3f}"
+        )
+    return "\n".join(lines)
+
+def folded_stacks(profile):
+    """
+    Self wall time of each stage stack in microseconds, in the folded format of
+    flamegraph.pl and speedscope ("a;b;c 1234").
+    """
+    return "\n".join(
+        f"{path} {max(int(1e6 * seconds), 0)}"
+        for path, seconds in sorted(_self_times(profile).items())
+    )
+
+def cutflow_table(cutflow):
+    """
+    Efficiency and timing of every step of the preselection chains, from
+    output["presel_cutflow"] ({dataset: {cut: {step: stats}}}).
+    """
+    header = (f"{'dataset':<40} {'cut':<20} {'step':<20} {'events in':>11} {'events out':>11} "
+              f"{'eff':>6} {'cum eff':>7} {'seconds':>9} {'us/event':>9}")
+    lines = [header, "-" * len(header)]
+    for dataset, cuts in sorted(cutflow.items()):
+        for cut, steps in cuts.items():
+            first = None
+            for step, stats in steps.items():
+                first = stats["events_in"] if first is None else first
+                eff = stats["events_out"] / stats["events_in"] if stats["events_in"] else 0.
+                cum_eff = stats["events_out"] / first if first else 0.
+                per_event = 1e6 * stats["seconds"] / stats["events_in"] if stats["events_in"] else 0.
+                lines.append(
+                    f"{dataset:<40} {cut:<20} {step:<20} {stats['events_in']:>11} "
+                    f"{stats['events_out']:>11} {eff:>6.3f} {cum_eff:>7.3f} "
+                    f"{stats['seconds']:>9.2f} {per_event:>9.2f}"
+                )
+    return "\n".join(lines)
+
+def _outputs(outdir):
+    # output_all.coffea if the outputs were merged, else the output_*.coffea files
+    merged = os.path.join(outdir, "output_all.coffea")
+    if os.path.exists(merged):
+        return [merged]
+    return sorted(glob.glob(os.path.join(outdir, "output_*.coffea")))
+
+def _add_stats(total, new):
+    for key, value in new.items():
+        if isinstance(value, dict):
+            _add_stats(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def collect(outdir, key):
+    """
+    `key` entry (nested dictionaries of numbers) summed over the outputs of a
+    pocket-coffea output directory.
+    """
+    total = {}
+    for output in _outputs(outdir):
+        _add_stats(total, load(output).get(key, {}))
+    return total
+
+def write_report(outdir):
+    """
+    Writes profile_summary.txt and profile.folded (if the run was profiled) and
+    cutflow_summary.txt into `outdir`, next to logfile.log.
+    """
+    tables = []
+    profile = collect(outdir, "profile")
+    if profile:
+        table = profile_table(profile)
+        with open(os.path.join(outdir, "profile_summary.txt"), "w") as f:
+            f.write(table + "\n")
+        with open(os.path.join(outdir, "profile.folded"), "w") as f:
+            f.write(folded_stacks(profile) + "\n")
+        tables.append(table)
+    cutflow = collect(outdir, "presel_cutflow")
+    if cutflow:
+        table = cutflow_table(cutflow)
+        with open(os.path.join(outdir, "cutflow_summary.txt"), "w") as f:
+            f.write(table + "\n")
+        tables.append(table)
+    return "\n\n".join(tables)
+
+if __name__ == "__main__":
+    # After a run (with profiling.enabled: true in params/profiling.yaml for the
+    # stage timings): python -m Functions.Profiling output_test
+    parser = argparse.ArgumentParser(description="Per-stage timing and cutflow report of ttBaseProcessor_res")
+    parser.add_argument("outdir", help="Output directory of pocket-coffea run")
+    args = parser.parse_args()
+    print(write_report(args.outdir))
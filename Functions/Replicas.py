@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uproot
+
+def logical_path(url):
+    """
+    Logical file name (/store/...) of a physical file url.
+    """
+    idx = url.find("/store/")
+    if idx < 0:
+        raise ValueError(f"No /store/ logical path in {url}")
+    return url[idx:]
+
+def site_url(rule, lfn):
+    """
+    Physical url of `lfn` at a site of `.sites_map.json`: either a prefix, or a
+    dictionary of regular expressions to replacements with $1 placeholders.
+    """
+    if isinstance(rule, dict):
+        for pattern, replacement in rule.items():
+            match = re.match(pattern, lfn)
+            if match:
+                return re.sub(r"\$(\d+)", lambda m: match.group(int(m.group(1))), replacement)
+        return None
+    return rule + lfn
+
+def missing_file(error):
+    """
+    Whether `error` means that the file is not at the site, rather than that the
+    site cannot be reached (timeout, connection refused, ...).
+    """
+    if isinstance(error, FileNotFoundError):
+        return True
+    message = str(error).lower()
+    return "no such file" in message or "not found" in message or "404" in message
+
+class ReplicaResolver:
+    """
+    Ranks the replicas of a logical file over the sites of `.sites_map.json`
+    by measured open latency and read throughput, and opens the best one,
+    failing over to the next replicas on errors.
+
+    Scores are measured per site on the first file resolved there and cached in
+    `cache_file` for `max_age` seconds, failed probes too: a site that could not
+    be reached is not tried again before its score expires. A file missing at a
+    site only excludes that site for that file.
+    """
+
+    def __init__(self, sites_map=".sites_map.json", sites=None,
+                 cache_file=".replica_scores.json", max_age=3600.,
+                 probe_bytes=1_000_000, timeout=30):
+        if isinstance(sites_map, str):
+            with open(sites_map) as f:
+                sites_map = json.load(f)
+        self.sites_map = {s: r for s, r in sites_map.items() if sites is None or s in sites}
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.probe_bytes = probe_bytes
+        self.timeout = timeout
+        self.scores = {}
+        # {(site, lfn): time} of the files not found at a site
+        self.missing = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file) as f:
+                self.scores = json.load(f)
+
+    def _save(self):
+        if self.cache_file:
+            with open(self.cache_file, "w") as f:
+                json.dump(self.scores, f, indent=4)
+
+    def _fresh(self, site):
+        score = self.scores.get(site)
+        return score is not None and time.time() - score["time"] < self.max_age
+
+    def _failed(self, site):
+        return self._fresh(site) and "error" in self.scores[site]
+
+    def _missing(self, site, lfn):
+        seen = self.missing.get((site, lfn))
+        return seen is not None and time.time() - seen < self.max_age
+
+    def expected_seconds(self, site):
+        """
+        Expected time to open a file and read `probe_bytes` from `site`.
+        """
+        if not self._fresh(site) or self._failed(site):
+            return float("inf")
+        score = self.scores[site]
+        return score["latency"] + self.probe_bytes / max(score["throughput"], 1.)
+
+    def _measure(self, url):
+        # Score of a site from one of its files, or the error if it cannot be read
+        try:
+            start = time.perf_counter()
+            with uproot.open(url, timeout=self.timeout) as f:
+                latency = time.perf_counter() - start
+                source = f.file.source
+                nbytes = min(self.probe_bytes, source.num_bytes)
+                start = time.perf_counter()
+                source.chunk(0, nbytes).raw_data
+                seconds = max(time.perf_counter() - start, 1e-6)
+        except Exception as e:
+            return {"error": str(e), "missing": missing_file(e), "time": time.time()}
+        return {"latency": latency, "throughput": nbytes / seconds, "time": time.time()}
+
+    def probe(self, replicas, lfn):
+        """
+        Measures the open latency and read throughput of the (site, url) `replicas`
+        of `lfn` in parallel, and caches the scores and the unreachable sites. The
+        sites without the file are only recorded for `lfn`, they are probed again
+        with the next file.
+        """
+        if not replicas:
+            return
+        with ThreadPoolExecutor(max_workers=len(replicas)) as pool:
+            scores = pool.map(self._measure, [url for _, url in replicas])
+            for (site, _), score in zip(replicas, scores):
+                if score.pop("missing", False):
+                    self.missing[(site, lfn)] = score["time"]
+                else:
+                    self.scores[site] = score
+        self._save()
+
+    def replicas(self, lfn):
+        """
+        (site, url) replicas of `lfn`, best measured sites first, then the sites
+        without a fresh score and the ones that failed.
+        """
+        candidates = []
+        for site, rule in self.sites_map.items():
+            url = site_url(rule, lfn)
+            if url is not None:
+                candidates.append((site, url))
+        return sorted(candidates, key=lambda c: (self._failed(c[0]), self.expected_seconds(c[0])))
+
+    def resolve(self, url_or_lfn, max_tries=5):
+        """
+        Url of the best replica that can be opened. The sites without a fresh
+        score are probed first, so that all of them are ranked before the best
+        `max_tries` are tried. Raises OSError if none can be opened.
+        """
+        lfn = logical_path(url_or_lfn)
+        replicas = [(site, url) for site, url in self.replicas(lfn) if not self._missing(site, lfn)]
+        unscored = [(site, url) for site, url in replicas if not self._fresh(site)]
+        self.probe(unscored, lfn)
+        errors = [f"{site}: {self.scores[site]['error']} (cached)"
+                  for site, _ in replicas if self._failed(site)]
+        errors += [f"{site}: file not found" for site, _ in replicas if self._missing(site, lfn)]
+        ranked = [(site, url) for site, url in self.replicas(lfn)
+                  if not self._failed(site) and not self._missing(site, lfn)]
+        for site, url in ranked[:max_tries]:
+            if (site, url) in unscored:
+                # Just opened by the probe
+                return url
+            try:
+                uproot.open(url, timeout=self.timeout).close()
+                return url
+            except Exception as e:
+                errors.append(f"{site}: {e}")
+                if missing_file(e):
+                    self.missing[(site, lfn)] = time.time()
+                else:
+                    self.scores[site] = {"error": str(e), "time": time.time()}
+                    self._save()
+        raise OSError(f"No replica of {lfn} could be opened:\n" + "\n".join(errors))
+
+if __name__ == "__main__":
+    # python -m Functions.Replicas Datasets/signals_MC_ttbar.json -o Datasets/signals_MC_ttbar_best.json \
+    #     --sites T1_US_FNAL_Disk T1_IT_CNAF_Disk T2_UK_London_IC
+    parser = argparse.ArgumentParser(description="Pick the best replica of every file of a dataset json")
+    parser.add_argument("json")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--sites-map", default=".sites_map.json")
+    parser.add_argument("--sites", nargs="*", default=None)
+    parser.add_argument("--max-tries", type=int, default=5)
+    args = parser.parse_args()
+
+    resolver = ReplicaResolver(args.sites_map, sites=args.sites)
+    with open(args.json) as f:
+        datasets = json.load(f)
+    for dataset, content in datasets.items():
+        files = []
+        for url in content["files"]:
+            try:
+                files.append(resolver.resolve(url, args.max_tries))
+            except OSError as e:
+                # Keep the original url, the failure is reported and not silent
+                print(e)
+                files.append(url)
+        content["files"] = files
+    with open(args.output, "w") as f:
+        json.dump(datasets, f, indent=4)
@@ -0,0 +1,108 @@
+import numpy as np
+
+class _Store:
+    """
+    Dense weighted counts of log-spaced bins, indexed from `offset`.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0)
+
+    def add(self, indices, weights):
+        if indices.size == 0:
+            return
+        low, high = indices.min(), indices.max()
+        if self.counts.size == 0:
+            self.offset = low
+        start = min(low, self.offset)
+        stop = max(high + 1, self.offset + self.counts.size)
+        if start != self.offset or stop != self.offset + self.counts.size:
+            counts = np.zeros(stop - start)
+            counts[self.offset - start:self.offset - start + self.counts.size] = self.counts
+            self.offset, self.counts = start, counts
+        self.counts += np.bincount(indices - self.offset, weights=weights, minlength=self.counts.size)
+
+    def merge(self, other):
+        if other.counts.size:
+            self.add(np.arange(other.offset, other.offset + other.counts.size), other.counts)
+
+    def collapse(self, max_bins):
+        # Bounded memory: fold the lowest bins into the first kept one
+        excess = self.counts.size - max_bins
+        if excess > 0:
+            self.counts[excess] += self.counts[:excess].sum()
+            self.counts = self.counts[excess:]
+            self.offset += excess
+
+class QuantileSketch:
+    """
+    Weighted, mergeable quantile sketch with a relative accuracy `alpha`
+    (log-spaced bins as in DDSketch). It is filled chunk by chunk, sketches are
+    summed with `+` (so they can be accumulated in the processor output), and the
+    memory is bounded by `max_bins` bins per sign whatever the number of entries.
+    """
+
+    def __init__(self, alpha=0.005, max_bins=4096, min_value=1e-9):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = np.log(self.gamma)
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.positive = _Store()
+        self.negative = _Store()
+        self.zero = 0.
+
+    def _index(self, values):
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def _value(self, indices):
+        return 2 * self.gamma**indices / (self.gamma + 1)
+
+    def fill(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        valid = ~np.isnan(values)
+        values, weights = values[valid], weights[valid]
+
+        pos = values > self.min_value
+        neg = values < -self.min_value
+        self.positive.add(self._index(values[pos]), weights[pos])
+        self.negative.add(self._index(-values[neg]), weights[neg])
+        self.zero += weights[~pos & ~neg].sum()
+        self.positive.collapse(self.max_bins)
+        self.negative.collapse(self.max_bins)
+        return self
+
+    def __iadd__(self, other):
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zero += other.zero
+        self.positive.collapse(self.max_bins)
+        self.negative.collapse(self.max_bins)
+        return self
+
+    def __add__(self, other):
+        out = QuantileSketch(self.alpha, self.max_bins, self.min_value)
+        out += self
+        out += other
+        return out
+
+    @property
+    def total(self):
+        return self.positive.counts.sum() + self.negative.counts.sum() + self.zero
+
+    def quantile(self, qs):
+        """
+        Weighted quantiles `qs` (in [0, 1]) of the values filled so far.
+        """
+        neg_idx = np.arange(self.negative.offset, self.negative.offset + self.negative.counts.size)
+        pos_idx = np.arange(self.positive.offset, self.positive.offset + self.positive.counts.size)
+        values = np.concatenate([-self._value(neg_idx[::-1]), [0.], self._value(pos_idx)])
+        weights = np.concatenate([self.negative.counts[::-1], [self.zero], self.positive.counts])
+        keep = weights > 0
+        values, cumulative = values[keep], np.cumsum(weights[keep])
+        if cumulative.size == 0:
+            return np.full(np.shape(qs), np.nan)
+        idx = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return values[np.clip(idx, 0, values.size - 1)]
@@ -0,0 +1,122 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+import uuid
+
+import awkward as ak
+
+class SkimCache:
+    """
+    Local cache of the raw, branch-pruned events passing the skim and the
+    preselection, stored as one Parquet file per processed chunk.
+
+    Entries are keyed by a hash of the input file, the entry range, the skim and
+    preselection cuts and any other configuration given to `key`. The total size
+    and the number of entries (the chunks without any event only have an info
+    file) of the cache are capped, the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory, max_size_gb=50., max_entries=100_000):
+        self.directory = directory
+        self.max_bytes = max_size_gb * 1e9
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(**parts):
+        """
+        Hash of the json representation of `parts` (file, cuts, parameters, ...).
+        """
+        text = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    @staticmethod
+    def fingerprint(func):
+        """
+        Hash of the code of `func` and of the source of its module, so that the
+        entries are invalidated when a cut function or the steps it uses change.
+        """
+        func = inspect.unwrap(func)
+        code = getattr(func, "__code__", None)
+        parts = [repr(func) if code is None else code.co_code.hex() + repr(code.co_consts)]
+        try:
+            parts.append(inspect.getsource(inspect.getmodule(func)))
+        except (OSError, TypeError):
+            pass
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".parquet", base + ".json"
+
+    def load(self, key):
+        """
+        Returns the path of the cached Parquet file and its info dictionary,
+        or None if the key is not in the cache. The path is None for a chunk
+        without any event passing the skim and the preselection.
+        """
+        data_path, info_path = self._paths(key)
+        if not os.path.exists(info_path):
+            return None
+        with open(info_path) as f:
+            info = json.load(f)
+        empty = info.get("nevents", None) == 0
+        if not empty and not os.path.exists(data_path):
+            return None
+        # Mark as recently used for the LRU eviction
+        now = time.time()
+        os.utime(info_path if empty else data_path, (now, now))
+        return (None, info) if empty else (data_path, info)
+
+    def store(self, key, arrays, info):
+        """
+        Writes the dictionary of flat NanoAOD-like branches `arrays` and the
+        `info` dictionary for `key`, then evicts old entries above the size cap.
+        Without any event only the info is written.
+        """
+        data_path, info_path = self._paths(key)
+        nevents = len(next(iter(arrays.values()))) if arrays else 0
+        info = dict(info, nevents=nevents)
+        # Write to temporary files first, so a crash never leaves a partial entry,
+        # with unique names as several workers may store the same chunk
+        tmp = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            if nevents > 0:
+                ak.to_parquet(ak.zip(arrays, depth_limit=1), data_path + tmp)
+            with open(info_path + tmp, "w") as f:
+                json.dump(info, f)
+            if nevents > 0:
+                os.replace(data_path + tmp, data_path)
+            os.replace(info_path + tmp, info_path)
+        finally:
+            for path in [data_path + tmp, info_path + tmp]:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.evict()
+
+    def evict(self):
+        # An entry is its Parquet and info files, or the info file alone for the
+        # chunks without any event, last used at the latest of their times
+        entries = {}
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext not in (".parquet", ".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # Evicted by another worker
+                continue
+            mtime, size = entries.get(key, (0., 0))
+            entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size)
+        total, count = sum(size for _, size in entries.values()), len(entries)
+        for (_, size), key in sorted((entry, key) for key, entry in entries.items()):
+            if total <= self.max_bytes and count <= self.max_entries:
+                break
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+            count -= 1
@@ -0,0 +1,48 @@
+import awkward as ak
+import numpy as np
+
+def dependent_collections(inputs, varied):
+    """
+    Derived collections depending, directly or through other derived collections,
+    on the `varied` raw collections.
+
+    Parameters:
+        inputs (dict): {collection: [input collections]}. A collection listing itself
+            (e.g. a corrected "MET") depends on its raw version.
+        varied (set): Raw collections changed by a shape variation, e.g. {"Jet"} for JES/JER.
+    """
+    dependent = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, names_in in inputs.items():
+            if name in dependent:
+                continue
+            if any(n in varied or (n in dependent and n != name) for n in names_in):
+                dependent.add(name)
+                changed = True
+    return dependent
+
+def propagate_met(met, jets, nominal_jets, pt_min=15.):
+    """
+    Type-1 propagation of a jet shape variation to the MET: the change of the
+    vector sum of the jets above `pt_min` is subtracted from the nominal MET.
+
+    Parameters:
+        met: Nominal MET (pt, phi) of the events.
+        jets: Varied jets, e.g. the JES/JER up or down calibrated jets.
+        nominal_jets: Nominal calibrated jets, in the same order as `jets`.
+        pt_min (float): Jets below this pt are not propagated.
+
+    Returns:
+        (pt, phi) of the varied MET.
+    """
+    def sum_pxy(j):
+        j = j[j.pt > pt_min]
+        return ak.sum(j.pt * np.cos(j.phi), axis=1), ak.sum(j.pt * np.sin(j.phi), axis=1)
+
+    px, py = sum_pxy(jets)
+    nominal_px, nominal_py = sum_pxy(nominal_jets)
+    met_px = met.pt * np.cos(met.phi) - (px - nominal_px)
+    met_py = met.pt * np.sin(met.phi) - (py - nominal_py)
+    return np.hypot(met_px, met_py), np.arctan2(met_py, met_px)
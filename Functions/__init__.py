@@ -1,4 +1,4 @@
-from .JetsCom import bjj_deltaR, bjj_deltaM, to_singleton_jet, combine_jets
+from .JetsCom import bjj_deltaR, bjj_deltaM, reconstruct_top_candidates, top_triplet_candidates, to_singleton_jet, combine_jets
 from .OpenFiles import extract_dataframes,  extract_combined_dfs
 from .Matching import object_matching
 # from .Plotting import inital_distributions_plot, stacked_hist, heat_map, comparison_plot, heat_map1, eff_plot
\ No newline at end of file
@@ -1,43 +1,62 @@
+import time
+
 import awkward as ak
+import numpy as np
 from pocket_coffea.lib.cut_definition import Cut
 
+def progressive_mask(events, steps, params, year, cutflow=None):
+    '''
+    Evaluates the ordered `steps` (name, function(events, params, year)) on the
+    events surviving the previous ones only, and stops as soon as none is left.
+    Returns the mask of the full `events`. If `cutflow` is a dict, the events in,
+    the events out and the time of each step are accumulated in it.
+    '''
+    survivors = np.arange(len(events))
+    selected = events
+    for name, step in steps:
+        start = time.perf_counter()
+        if len(survivors) > 0:
+            passed = step(selected, params, year)
+            passed = ak.to_numpy(ak.fill_none(passed, False)).astype(bool)
+            n_in = len(survivors)
+            survivors = survivors[passed]
+            selected = selected[passed]
+        else:
+            n_in = 0
+        if cutflow is not None:
+            stats = cutflow.setdefault(name, {"events_in": 0, "events_out": 0, "seconds": 0.})
+            stats["events_in"] += n_in
+            stats["events_out"] += len(survivors)
+            stats["seconds"] += time.perf_counter() - start
+    mask = np.zeros(len(events), dtype=bool)
+    mask[survivors] = True
+    return mask
+
 ############## tt to semileptonic decay ##############
-def semileptonic(events, params, year, sample, **kwargs):
-    has_one_electron = events.nElectronGood == 1
-    has_one_muon = events.nMuonGood == 1
+def leading_lepton_pt(events, params, year):
+    # Distinguish between leading muon and leading electron:
+    leading_pt = ak.firsts(events.LeptonGood.pt)
+    return (
+        ((events.nElectronGood == 1) & (leading_pt > params["pt_leading_electron"][year]))
+        |
+        ((events.nMuonGood == 1) & (leading_pt > params["pt_leading_muon"][year]))
+    )
 
-    mask = (
-        # Ensure only has one lepton:
-        (events.nLeptonGood == 1)
-        & 
-        # Distinguish between leading muon and leading electron:
-        (
-            (
-                has_one_electron
-                &
-                (
-                    ak.firsts(events.LeptonGood.pt) > params["pt_leading_electron"][year]
-                )
-            )
-            |
-            (
-                has_one_muon
-                &
-                (
-                    ak.firsts(events.LeptonGood.pt) > params["pt_leading_muon"][year]
-                )
-            )
-        )
-        # Events have >= 2 AK4 jets
-        & (events.nJetGood >= params["njet"])
-        # Events have >= 2 non-b jets
-        & (events.nBJetBad >= params["nbjet"])
-        # Events have == 1 b jets
-        & (events.nBJetGood == params["nbjet"])
+# Cheapest and most selective first: counts before the leading lepton pt
+SEMILEPTONIC_STEPS = [
+    # Events have == nbjet b jets
+    ("nBJetGood", lambda events, params, year: events.nBJetGood == params["nbjet"]),
+    # Ensure only has one lepton:
+    ("nLeptonGood", lambda events, params, year: events.nLeptonGood == 1),
+    # Events have >= nbjet non-b jets
+    ("nBJetBad", lambda events, params, year: events.nBJetBad >= params["nbjet"]),
+    # Events have >= njet AK4 jets
+    ("nJetGood", lambda events, params, year: events.nJetGood >= params["njet"]),
+    ("leading_lepton_pt", leading_lepton_pt),
+]
 
-    )
-    
-    return ak.where(ak.is_none(mask), False, mask)
+def semileptonic(events, params, year, sample, cutflow=None, **kwargs):
+    return progressive_mask(events, SEMILEPTONIC_STEPS, params, year, cutflow)
 
 semileptonic_presel = Cut(
     name = "semileptonic",
@@ -58,4 +77,4 @@ semileptonic_presel = Cut(
         }
     },
     function=semileptonic
-)
\ No newline at end of file
+)
@@ -19,7 +19,7 @@ from pocket_coffea.lib.objects import (
     met_xy_correction,
 )
 
-from Functions.JetsCom import bjj_deltaR, bjj_deltaM, to_singleton_jet
+from Functions.JetsCom import reconstruct_top_candidates, to_singleton_jet
 # from Functions.Matching import object_matching
 
 class ttBaseProcessor_res(BaseProcessorABC):
@@ -115,10 +115,11 @@ class ttBaseProcessor_res(BaseProcessorABC):
         )
         self.events["jj"] = to_singleton_jet(dijet)  # transform the format to singleton
         
-        top_deltaR = bjj_deltaR(self.events["BJetGood"], self.events["jj"])
-        self.events["bjj_deltaR"] = to_singleton_jet(top_deltaR)
-        top_deltaM = bjj_deltaM(self.events["BJetGood"], self.events["jj"])
-        self.events["bjj_deltaM"] = to_singleton_jet(top_deltaM)
+        tops = reconstruct_top_candidates(
+            self.events["BJetGood"], self.events["jj"], strategies=["deltaR", "deltaM"]
+        )
+        self.events["bjj_deltaR"] = to_singleton_jet(tops["deltaR"])
+        self.events["bjj_deltaM"] = to_singleton_jet(tops["deltaM"])
 
 ###########################################################################
         Genjj = get_dijet(
@@ -126,10 +127,11 @@ class ttBaseProcessor_res(BaseProcessorABC):
         self.events["Genjj"] = to_singleton_jet(Genjj)
 
         # Reconstuct the top with Gen-level data:
-        Gentop_deltaR = bjj_deltaR(self.events["GenBJetGood"], self.events["Genjj"])
-        self.events["Genbjj_deltaR"] = to_singleton_jet(Gentop_deltaR)
-        Gentop_deltaM = bjj_deltaM(self.events["GenBJetGood"], self.events["Genjj"])
-        self.events["Genbjj_deltaM"] = to_singleton_jet(Gentop_deltaM)
+        Gentops = reconstruct_top_candidates(
+            self.events["GenBJetGood"], self.events["Genjj"], strategies=["deltaR", "deltaM"]
+        )
+        self.events["Genbjj_deltaR"] = to_singleton_jet(Gentops["deltaR"])
+        self.events["Genbjj_deltaM"] = to_singleton_jet(Gentops["deltaM"])
 
 ###########################################################################
         # # Match the Reco w, top to he Gen Reco w, top:
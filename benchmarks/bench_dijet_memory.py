@@ -0,0 +1,72 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Peak RSS and time of get_dijet / combine_jets, before (padded awkward arrays)
+# and after (leading-pair sums on NumPy buffers). Every measurement runs in a
+# fresh process so that the peak RSS of one does not hide the other:
+#   python benchmarks/bench_dijet_memory.py --nevents 1000000
+import argparse
+import multiprocessing
+import queue as queue_module
+import resource
+import time
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+def measure(func_name, nevents, seed, queue):
+    import awkward as ak
+    import numpy as np
+    from coffea.nanoevents.methods import candidate
+    from Functions import JetsCom
+    from bench_bjj import synthetic_jets
+
+    ak.behavior.update(candidate.behavior)
+    rng = np.random.default_rng(seed)
+    jets = synthetic_jets(nevents, 3.0, rng)
+    bjets = synthetic_jets(nevents, 2.0, rng)
+
+    func = getattr(JetsCom, func_name)
+    args = (jets,) if "dijet" in func_name else (bjets, jets)
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((peak_rss_mb() - before, elapsed))
+
+def result(proc, queue, timeout):
+    # Waits for the measurement without hanging if the child crashed or stalls
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1.)
+        except queue_module.Empty:
+            if not proc.is_alive():
+                raise RuntimeError(f"measurement process exited with code {proc.exitcode}")
+            if time.monotonic() > deadline:
+                proc.terminate()
+                proc.join()
+                raise RuntimeError(f"measurement process timed out after {timeout} s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=600., help="seconds per measurement")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    scale = 1e6 / args.nevents
+    print(f"{'function':<24}{'peak RSS [MB / 1M events]':>28}{'time [s / 1M events]':>24}")
+    for func_name in ["_get_dijet_awkward", "get_dijet", "_combine_jets_awkward", "combine_jets"]:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=measure, args=(func_name, args.nevents, args.seed, queue))
+        proc.start()
+        rss, elapsed = result(proc, queue, args.timeout)
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"measurement process of {func_name} exited with code {proc.exitcode}")
+        print(f"{func_name:<24}{rss * scale:>28.1f}{elapsed * scale:>24.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Throughput of the compiled ΔR matching, for singleton candidates and for
+# multi-object collections (checked against a brute-force reference in
+# tests/test_matching.py):
+#   python benchmarks/bench_matching.py --nevents 1000000
+import argparse
+import time
+
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate
+
+from Functions.JetsCom import get_dijet
+from Functions.Matching import object_matching, object_matching1
+from bench_bjj import synthetic_jets
+
+ak.behavior.update(candidate.behavior)
+
+def throughput(func, *args, repeat=3):
+    nevents = len(args[0])
+    best = min(_timed(func, *args) for _ in range(repeat))
+    return nevents / best
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", type=int, default=500_000)
+    parser.add_argument("--dr-min", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    reco = synthetic_jets(args.nevents, 4.0, rng)
+    gen = smeared(reco, rng)
+
+    # Multi-object collections: greedy one-to-one matching
+    rate = throughput(object_matching, reco, gen, args.dr_min)
+    print(f"object_matching (collections): {rate / 1e6:.2f} M events/s")
+
+    # Singleton candidates, as the jj / bjj_deltaR / bjj_deltaM matching
+    reco1, gen1 = ak.firsts(reco), ak.firsts(gen)
+    rate = throughput(object_matching1, reco1, gen1, args.dr_min)
+    print(f"object_matching1 (singletons): {rate / 1e6:.2f} M events/s")
+
+    # The real inputs of the workflow: get_dijet records, zero-filled below 2 jets
+    jj, genjj = get_dijet(reco, taggerVars=False), get_dijet(gen, taggerVars=False)
+    rate = throughput(object_matching1, jj, genjj, args.dr_min)
+    print(f"object_matching1 (get_dijet): {rate / 1e6:.2f} M events/s")
+
+def smeared(jets, rng):
+    '''
+    Gen-like copy of `jets` with smeared pt and directions.
+    '''
+    counts = ak.num(jets)
+    ntot = int(ak.sum(counts))
+    flat = {
+        "pt": ak.flatten(jets.pt).to_numpy() * rng.normal(1., 0.1, ntot),
+        "eta": ak.flatten(jets.eta).to_numpy() + rng.normal(0., 0.2, ntot),
+        "phi": ak.flatten(jets.phi).to_numpy() + rng.normal(0., 0.2, ntot),
+        "mass": ak.flatten(jets.mass).to_numpy(),
+    }
+    return ak.zip(
+        {k: ak.unflatten(v, counts) for k, v in flat.items()},
+        with_name="PtEtaPhiMCandidate",
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Merge of synthetic job outputs (histograms and columns): all in memory, as
+# pocket-coffea merge-outputs, against the out-of-core tree merge. Each merge
+# runs in a fresh process to measure its own peak RSS:
+#   python benchmarks/bench_merge.py --njobs 100
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import hist
+import numpy as np
+from coffea.processor import accumulate, column_accumulator
+from coffea.util import load, save
+
+from Functions.MergeOutputs import tree_merge
+
+def synthetic_output(rng, nevents, nhists):
+    sample, dataset = "TTToSemiLeptonic", "TTToSemiLeptonic_2018"
+    hists = {}
+    for i in range(nhists):
+        h = hist.Hist(
+            hist.axis.StrCategory(["baseline"], name="cat"),
+            hist.axis.Regular(100, 0, 500, name="mass"),
+            storage=hist.storage.Weight(),
+        )
+        h.fill(cat="baseline", mass=rng.exponential(100., nevents))
+        hists[f"var{i}"] = {sample: {dataset: h}}
+    columns = {
+        f"{coll}_{field}": column_accumulator(rng.normal(size=nevents))
+        for coll in ["jj", "bjj_deltaR", "bjj_deltaM"] for field in ["pt", "eta", "phi", "mass"]
+    }
+    return {
+        "sumw": {"baseline": {dataset: {sample: float(nevents)}}},
+        "variables": hists,
+        "columns": {sample: {dataset: {"baseline": columns}}},
+    }
+
+def merge_in_memory(inputs, output):
+    save(accumulate([load(path) for path in inputs]), output)
+
+def run(mode, inputs, output, workdir, queue):
+    start = time.perf_counter()
+    if mode == "in-memory":
+        merge_in_memory(inputs, output)
+    else:
+        tree_merge(inputs, output, workdir, fan_in=8, workers=1)
+    queue.put((time.perf_counter() - start,
+               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--njobs", type=int, default=100)
+    parser.add_argument("--nevents", type=int, default=200_000)
+    parser.add_argument("--nhists", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = []
+        for i in range(args.njobs):
+            path = os.path.join(tmp, f"output_job_{i}.coffea")
+            save(synthetic_output(rng, args.nevents, args.nhists), path)
+            inputs.append(path)
+
+        for mode in ["in-memory", "tree"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run, args=(
+                mode, inputs, os.path.join(tmp, f"output_{mode}.coffea"),
+                os.path.join(tmp, f"merge_{mode}"), queue
+            ))
+            proc.start()
+            seconds, rss = queue.get()
+            proc.join()
+            print(f"{mode:<10} {seconds:8.1f} s  peak RSS {rss:8.0f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Output size and merge time of synthetic job outputs of ttBaseProcessor_res in the
+# two output modes of params/output_mode.yaml: per-event columns against the
+# resolved histogram preset (with the weight variations of config.py):
+#   python benchmarks/bench_output_mode.py --njobs 50
+import argparse
+import os
+import tempfile
+import time
+
+import hist
+import numpy as np
+from coffea.processor import column_accumulator
+from coffea.util import load, save
+
+from Functions.MergeOutputs import add_inplace
+
+SAMPLE, DATASET = "TTToSemiLeptonic", "TTToSemiLeptonic_2018"
+CANDIDATES = ["jj", "bjj_deltaR", "bjj_deltaM"]
+VARIATIONS = ["nominal"] + [f"{syst}{shift}" for syst in ["pileup", "sf_mu_id", "sf_mu_iso"]
+                            for shift in ["Up", "Down"]]
+
+def columns_output(rng, nevents):
+    collections = ["MET"] + CANDIDATES + [f"Gen{c}" for c in CANDIDATES] + [f"Matched{c}" for c in CANDIDATES]
+    columns = {
+        f"{coll}_{field}": column_accumulator(rng.normal(size=nevents))
+        for coll in collections for field in ["pt", "eta", "phi", "mass"]
+    }
+    return {"columns": {SAMPLE: {DATASET: {"baseline": columns}}}}
+
+def hists_output(rng, nevents):
+    def hist1d(name, stop, variations):
+        return hist.Hist(
+            hist.axis.StrCategory(["baseline"], name="cat"),
+            hist.axis.StrCategory(variations, name="variation"),
+            hist.axis.Regular(100, 0, stop, name=name),
+            storage=hist.storage.Weight(),
+        )
+    variables = {}
+    for coll in CANDIDATES:
+        for field, stop in [("mass", 200 if coll == "jj" else 700), ("pt", 700)]:
+            for prefix, variations in [("", VARIATIONS), ("Gen", ["nominal"])]:
+                h = hist1d(field, stop, variations)
+                for variation in variations:
+                    h.fill(cat="baseline", variation=variation, **{field: rng.exponential(stop / 4, nevents)},
+                           weight=rng.normal(1., 0.1, nevents))
+                variables[f"{prefix}{coll}_{field}"] = {SAMPLE: {DATASET: h}}
+        h = hist.Hist(
+            hist.axis.StrCategory(["baseline"], name="cat"),
+            hist.axis.StrCategory(["nominal"], name="variation"),
+            hist.axis.Regular(50, 0, 700, name="genPt"),
+            hist.axis.Regular(50, 0, 2, name="ptResponse"),
+            storage=hist.storage.Weight(),
+        )
+        h.fill(cat="baseline", variation="nominal", genPt=rng.exponential(150., nevents),
+               ptResponse=rng.normal(1., 0.15, nevents))
+        variables[f"Matched{coll}_response"] = {SAMPLE: {DATASET: h}}
+    return {"variables": variables}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--njobs", type=int, default=50)
+    parser.add_argument("--nevents", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, make in [("columns", columns_output), ("histograms", hists_output)]:
+            inputs = []
+            for i in range(args.njobs):
+                path = os.path.join(tmp, f"{mode}_job_{i}.coffea")
+                save(make(rng, args.nevents), path)
+                inputs.append(path)
+            size = sum(os.path.getsize(path) for path in inputs) / 1024**2
+
+            start = time.perf_counter()
+            total = None
+            for path in inputs:
+                total = add_inplace(total, load(path))
+            output = os.path.join(tmp, f"{mode}.coffea")
+            save(total, output)
+            seconds = time.perf_counter() - start
+            print(f"{mode:<10} jobs {size:9.1f} MB  merged {os.path.getsize(output) / 1024**2:9.1f} MB"
+                  f"  merge {seconds:7.1f} s")
+
+if __name__ == "__main__":
+    main()
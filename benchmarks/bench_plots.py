@@ -0,0 +1,49 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Throughput of the batch plot renderer on synthetic stacked histograms,
+# with one and several worker processes, and for an unchanged re-run:
+#   python benchmarks/bench_plots.py --nplots 200 --workers 8
+import argparse
+import tempfile
+import time
+
+import hist
+import numpy as np
+
+from Functions.Plotting import render_plots
+
+def synthetic_specs(nplots, rng):
+    specs = []
+    for i in range(nplots):
+        hists = {}
+        for sample in ["TTToSemiLeptonic", "TTTo2L2Nu", "TTToHadronic"]:
+            h = hist.Hist(hist.axis.Regular(100, 0, 500, name="mass"))
+            h.fill(rng.exponential(100., 10_000))
+            hists[sample] = h
+        specs.append({
+            "func": "stacked_hist",
+            "args": (hists, "mass", "2018"),
+            "name": f"plot_{i}",
+        })
+    return specs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nplots", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    specs = synthetic_specs(args.nplots, np.random.default_rng(42))
+    for workers in sorted({1, args.workers}):
+        with tempfile.TemporaryDirectory() as outdir:
+            start = time.perf_counter()
+            render_plots(specs, outdir, workers=workers, formats=("png",))
+            first = time.perf_counter() - start
+
+            start = time.perf_counter()
+            render_plots(specs, outdir, workers=workers, formats=("png",))
+            rerun = time.perf_counter() - start
+        print(f"{workers} workers: {args.nplots / first:.1f} plots/s, "
+              f"unchanged re-run {rerun:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Read-ahead prefetching against a local stand-in of a remote file server:
+# every read of a chunk pays an injected latency, while the processing is a
+# CPU-bound stand-in of apply_object_preselection.
+#   python benchmarks/bench_prefetch.py --latency 0.5 --nchunks 20
+import argparse
+import os
+import tempfile
+import time
+
+import awkward as ak
+import numpy as np
+import uproot
+
+from Functions.Prefetch import Prefetcher, read_chunk
+
+def write_fixture(path, nevents, rng):
+    counts = rng.poisson(5, nevents)
+    ntot = counts.sum()
+    with uproot.recreate(path) as f:
+        f["Events"] = {
+            "Jet": ak.zip({
+                "pt": ak.unflatten(rng.exponential(50., ntot), counts),
+                "eta": ak.unflatten(rng.uniform(-2.4, 2.4, ntot), counts),
+                "phi": ak.unflatten(rng.uniform(-np.pi, np.pi, ntot), counts),
+            }),
+        }
+
+def slow_read(latency):
+    def read(file, entry_start, entry_stop, branches):
+        time.sleep(latency)
+        return read_chunk(file, entry_start, entry_stop, branches)
+    return read
+
+def process(arrays, repeat):
+    pt = ak.flatten(arrays["Jet_pt"]).to_numpy()
+    for _ in range(repeat):
+        np.sort(np.sqrt(pt**2 + 1.))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Injected seconds per read")
+    parser.add_argument("--nchunks", type=int, default=20)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--work", type=int, default=20, help="CPU work per chunk")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nano.root")
+        write_fixture(path, args.nchunks * args.chunksize, np.random.default_rng(42))
+        chunks = [(path, i * args.chunksize, (i + 1) * args.chunksize) for i in range(args.nchunks)]
+        branches = ["Jet_pt", "Jet_eta", "Jet_phi"]
+        read = slow_read(args.latency)
+
+        start = time.perf_counter()
+        for chunk in chunks:
+            process(read(*chunk, branches), args.work)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prefetcher = Prefetcher(chunks, branches, depth=args.depth, read=read)
+        for chunk, arrays in prefetcher:
+            process(arrays, args.work)
+        prefetched = time.perf_counter() - start
+
+    report = prefetcher.report()
+    print(f"serial {serial:.2f} s, prefetch depth {args.depth} {prefetched:.2f} s "
+          f"(x{serial / prefetched:.2f}); read {report['read_seconds']:.2f} s, "
+          f"hidden {report['hidden_seconds']:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#export PYTHONPATH=..:$PYTHONPATH
+# Time per shape variation of the reconstruction of ttBaseProcessor_res on
+# synthetic events: everything recomputed for every variation, against the
+# jet path only with the Gen-level collections reused from the nominal one:
+#   python benchmarks/bench_variations.py --nevents 200000 --nvariations 10
+import argparse
+import time
+
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate
+
+from Functions.JetsCom import get_dijet, reconstruct_top_candidates
+from Functions.Matching import object_matching1
+from bench_bjj import synthetic_jets
+
+ak.behavior.update(candidate.behavior)
+
+def jet_path(jets, btag):
+    bjets, lightjets = jets[btag], jets[~btag]
+    jj = get_dijet(lightjets, taggerVars=False)
+    tops = reconstruct_top_candidates(bjets, jj, strategies=["deltaR", "deltaM"])
+    return {"jj": jj, "bjj_deltaR": tops["deltaR"], "bjj_deltaM": tops["deltaM"]}
+
+def gen_path(genjets, flavour):
+    good = genjets[(genjets.pt > 20) & (abs(genjets.eta) < 2.4)]
+    flavour = flavour[(genjets.pt > 20) & (abs(genjets.eta) < 2.4)]
+    genjj = get_dijet(good[flavour < 5], taggerVars=False)
+    tops = reconstruct_top_candidates(good[flavour == 5], genjj, strategies=["deltaR", "deltaM"])
+    return {"Genjj": genjj, "Genbjj_deltaR": tops["deltaR"], "Genbjj_deltaM": tops["deltaM"]}
+
+def matching(reco, gen):
+    return [object_matching1(reco[name], gen[f"Gen{name}"], dr_min=0.4)
+            for name in ["jj", "bjj_deltaR", "bjj_deltaM"]]
+
+def preselect(reco):
+    # Stand-in for the preselection: events with a W candidate above 40 GeV
+    return np.flatnonzero(ak.to_numpy(ak.fill_none(reco["jj"].pt > 40, False)))
+
+def shared(cache, lookup, index, compute):
+    # Nominal collections for the events also preselected in the nominal variation,
+    # computed for the others, as ttBaseProcessor_res._share_with_nominal
+    pos = lookup[index]
+    have = pos >= 0
+    computed = compute(index[~have])
+    order = np.argsort(np.concatenate([np.flatnonzero(have), np.flatnonzero(~have)]), kind="stable")
+    return {name: ak.concatenate([cache[name][pos[have]], computed[name]])[order] for name in cache}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nevents", type=int, default=200_000)
+    parser.add_argument("--nvariations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    jets = synthetic_jets(args.nevents, 5.0, rng)
+    btag = ak.unflatten(rng.uniform(size=ak.sum(ak.num(jets))) < 0.35, ak.num(jets))
+    genjets = synthetic_jets(args.nevents, 6.0, rng)
+    flavour = ak.unflatten(rng.choice([0, 4, 5], size=ak.sum(ak.num(genjets)), p=[0.6, 0.1, 0.3]),
+                           ak.num(genjets))
+
+    def varied_jets(scale):
+        return ak.with_field(jets, jets.pt * scale, "pt")
+
+    # Warm up the numba compilation outside of the timing
+    matching(jet_path(jets[:10], btag[:10]), gen_path(genjets[:10], flavour[:10]))
+
+    scales = 1 + 0.02 * rng.standard_normal(args.nvariations)
+
+    # Before: the Gen-level path is rebuilt in every variation
+    start = time.perf_counter()
+    for scale in scales:
+        reco = jet_path(varied_jets(scale), btag)
+        index = preselect(reco)
+        reco = {name: array[index] for name, array in reco.items()}
+        gen = gen_path(genjets[index], flavour[index])
+        matching(reco, gen)
+    before = (time.perf_counter() - start) / args.nvariations
+
+    # After: the nominal Gen-level collections are reused
+    nominal = jet_path(jets, btag)
+    nominal_index = preselect(nominal)
+    cache = gen_path(genjets[nominal_index], flavour[nominal_index])
+    lookup = np.full(args.nevents, -1)
+    lookup[nominal_index] = np.arange(len(nominal_index))
+    start = time.perf_counter()
+    for scale in scales:
+        reco = jet_path(varied_jets(scale), btag)
+        index = preselect(reco)
+        reco = {name: array[index] for name, array in reco.items()}
+        gen = shared(cache, lookup, index, lambda missing: gen_path(genjets[missing], flavour[missing]))
+        matching(reco, gen)
+    after = (time.perf_counter() - start) / args.nvariations
+
+    print(f"per variation: full {before:7.3f} s  shared {after:7.3f} s  speed-up {before / after:5.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,8 @@ cloudpickle.register_pickle_by_value(workflow)
 cloudpickle.register_pickle_by_value(Cut_func)
 
 from Cut_func import *
+from Functions.Histograms import resolved_hists
+from Functions.DatasetIndex import preload_metadata_cache
 import os
 localdir = os.path.dirname(os.path.abspath(__file__))
 
@@ -30,16 +32,97 @@ parameters = defaults.merge_parameters_from_files(default_parameters,
                                                   f"{localdir}/params/object_preselection.yaml",
                                                   f"{localdir}/params/triggers.yaml",
                                                   f"{localdir}/params/plotting.yaml",
+                                                  f"{localdir}/params/skim_cache.yaml",
+                                                  f"{localdir}/params/columns_export.yaml",
+                                                  f"{localdir}/params/quantile_sketches.yaml",
+                                                  f"{localdir}/params/efficiency.yaml",
+                                                  f"{localdir}/params/output_mode.yaml",
+                                                  f"{localdir}/params/profiling.yaml",
                                                   update=True)
 
+samples = ["TTToSemiLeptonic",
+           "TTTo2L2Nu",
+           "TTToHadronic"]
+
+# Columns or histograms per sample, see params/output_mode.yaml
+def output_mode(sample):
+    return parameters.output_mode.bysample.get(sample, parameters.output_mode.default)
+
+column_samples = [s for s in samples if output_mode(s) in ("columns", "both")]
+hist_samples = [s for s in samples if output_mode(s) in ("histograms", "both")]
+
+# Reco-level columns
+reco_columns = [
+    ColOut(
+        "MET",
+        ["pt", "phi", 
+        'fiducialGenPhi', 'fiducialGenPt'],
+        flatten=False
+    ),
+    # Save the reco data:
+    ColOut(
+        "jj",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "bjj_deltaR",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "bjj_deltaM",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+]
+
+# Columns of the truth stage of ttBaseProcessor_res
+truth_columns = [
+    # Save the Gen-level data:
+    ColOut(
+        "Genjj",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "Genbjj_deltaR",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "Genbjj_deltaM",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    # Save the matched data:
+    ColOut(
+        "Matchedjj",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "Matchedbjj_deltaR",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    ),
+    ColOut(
+        "Matchedbjj_deltaM",
+        ['pt', 'eta', 'phi', 'mass'],
+        flatten=False
+    )
+]
+
+dataset_jsons = [f"{localdir}/Datasets/signals_MC_ttbar.json",]
+# Files indexed with Functions/DatasetIndex.py are not opened again by the preprocessing
+preload_metadata_cache(dataset_jsons)
+
 cfg = Configurator(
     parameters = parameters,
     datasets = {
-        "jsons": [f"{localdir}/Datasets/signals_MC_ttbar.json",],
+        "jsons": dataset_jsons,
         "filter" : {
-            "samples": ["TTToSemiLeptonic",
-                        "TTTo2L2Nu",
-                        "TTToHadronic"],
+            "samples": samples,
 
             "samples_exclude" : [],
             "year": ['2018']
@@ -83,78 +166,27 @@ cfg = Configurator(
         "bysample": {
         }    
         },
-
+        # JES/JER of the AK4 jets, propagated to the MET (see met_preselection)
+        "shape": {
+            "common": {
+                "inclusive": ["JES_Total_AK4PFchs", "JER_AK4PFchs"],
+            },
+        },
     },   
     columns = {
         "common": {
-            "inclusive": [
-                ColOut(
-                    "MET",
-                    ["pt", "phi", 
-                    'fiducialGenPhi', 'fiducialGenPt'],
-                    flatten=False
-                ),
-                # Save the Gen-level data:
-                ColOut(
-                    "Genjj",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "Genbjj_deltaR",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "Genbjj_deltaM",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                # Save the reco data:
-                ColOut(
-                    "jj",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "bjj_deltaR",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "bjj_deltaM",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "Matchedbjj",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                # Save the matched data:
-                ColOut(
-                    "Matchedjj",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "Matchedbjj_deltaR",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                ),
-                ColOut(
-                    "Matchedbjj_deltaM",
-                    ['pt', 'eta', 'phi', 'mass'],
-                    flatten=False
-                )
-            ],
+            "inclusive": [],
             "bycategory": {},
         },
+        # The Gen-level and matched candidates only exist for the truth samples
         "bysample": {
+            sample: {"inclusive": reco_columns + (truth_columns if sample in ttBaseProcessor_res.truth_samples else [])}
+            for sample in column_samples
         },
     },
     
    variables = {
+        **resolved_hists(hist_samples, ttBaseProcessor_res.truth_samples),
         # **muon_hists(coll="MuonGood", pos=0),
         # **ele_hists(coll="ElectronGood", pos=0),
         # **count_hist(name="nElectronGood", coll="ElectronGood",bins=3, start=0, stop=3),
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The workflow and the Functions package are imported from the repository root,
+# as with export PYTHONPATH=..:$PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+from pocket_coffea.parameters import defaults
+
+from workflow import ttBaseProcessor_res
+
+localdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def parameters():
+    defaults.register_configuration_dir("config_dir", localdir + "/params")
+    return defaults.merge_parameters_from_files(
+        defaults.get_default_parameters(),
+        f"{localdir}/params/object_preselection.yaml",
+        f"{localdir}/params/triggers.yaml",
+        update=True,
+    )
+
+def test_calibration_and_trigger_branches(parameters):
+    # JER smearing on non-truth MC needs the GenJets and rho, the triggers their flags
+    branches = ttBaseProcessor_res.required_branches(isMC=True, truth=False, params=parameters, year="2018")
+    for branch in ["GenJet_pt", "nGenJet", "Jet_genJetIdx", "Jet_rawFactor", "Jet_area",
+                   "fixedGridRhoFastjetAll", "FatJet_area", "GenJetAK8_pt",
+                   "HLT_IsoMu24", "HLT_Ele32_WPTight_Gsf"]:
+        assert branch in branches
+    assert "GenJet_hadronFlavour" not in branches
+
+def test_data_branches(parameters):
+    branches = ttBaseProcessor_res.required_branches(isMC=False, truth=False, params=parameters, year="2018")
+    assert "Jet_rawFactor" in branches
+    assert not any(b.startswith("GenJet") for b in branches)
+
+def test_truth_branches():
+    branches = ttBaseProcessor_res.required_branches(isMC=True, truth=True)
+    assert "GenJet_hadronFlavour" in branches
+    assert "GenJet_hadronFlavour" not in ttBaseProcessor_res.required_branches(isMC=True, truth=False)
@@ -0,0 +1,21 @@
+import yaml
+from coffea.util import save
+from pocket_coffea.parameters import defaults
+
+from Functions.ChunkSize import tune_chunksize
+
+def test_chunksize_run_options(tmp_path):
+    # 0.01 MB per event on top of 500 MB, 1 ms per event
+    stats = [[n, n * 1e-3, n * 0.01, 500.] for n in (10_000, 20_000, 40_000)]
+    output = str(tmp_path / "output_all.coffea")
+    save({"chunk_stats": {"TTToSemiLeptonic_2018": stats}}, output)
+    result = tune_chunksize([output], target_memory_mb=1500., target_seconds=600.)
+    assert result["chunksize"] == 100_000
+
+    # Read back by pocket-coffea run -ro chunksize.yaml
+    path = tmp_path / "chunksize.yaml"
+    with open(path, "w") as f:
+        yaml.safe_dump(result, f, sort_keys=False)
+    run_options = defaults.get_default_run_options()["general"]
+    run_options = defaults.merge_parameters_from_files(run_options, str(path))
+    assert run_options["chunksize"] == 100_000
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+import uproot
+from coffea.processor.executor import DEFAULT_METADATA_CACHE, FileMeta
+
+from Functions.DatasetIndex import (
+    balance_chunks, build_index, coffea_metadata_cache, index_path, make_chunks, preload_metadata_cache
+)
+
+@pytest.fixture
+def root_files(tmp_path):
+    # Three clusters of 100, 50 and 100 events in the first file, one in the second
+    paths = [str(tmp_path / "a.root"), str(tmp_path / "b.root")]
+    with uproot.recreate(paths[0]) as f:
+        f["Events"] = {"x": np.arange(100.)}
+        f["Events"].extend({"x": np.arange(50.)})
+        f["Events"].extend({"x": np.arange(100.)})
+    with uproot.recreate(paths[1]) as f:
+        f["Events"] = {"x": np.arange(40.)}
+    return paths
+
+def test_index(root_files):
+    index = build_index({"ds": {"files": root_files + ["missing.root"]}}, workers=2)
+    entry = index["ds"][root_files[0]]
+    assert list(index["ds"]) == root_files
+    assert entry["nevents"] == 250
+    assert entry["clusters"] == [0, 100, 150, 250]
+    with uproot.open(root_files[0]) as f:
+        assert bytes.fromhex(entry["uuid"]) == f.file.fUUID
+
+def test_metadata_cache_matches_preprocessing(root_files):
+    index = build_index({"ds": {"files": root_files}}, workers=2)
+    cache = coffea_metadata_cache(index["ds"], "ds")
+    meta = cache[FileMeta("ds", root_files[0], "Events")]
+    with uproot.open(root_files[0]) as f:
+        # Same metadata as Runner.metadata_fetcher
+        assert meta["uuid"] == f.file.fUUID
+        assert meta["numentries"] == f["Events"].num_entries
+
+def test_preload(root_files, tmp_path):
+    dataset_json = str(tmp_path / "ds.json")
+    with open(index_path(dataset_json), "w") as f:
+        json.dump(build_index({"ds": {"files": root_files}}, workers=2), f)
+    assert preload_metadata_cache([dataset_json, str(tmp_path / "other.json")]) == 2
+    filemeta = FileMeta("ds", root_files[1], "Events")
+    filemeta.maybe_populate(DEFAULT_METADATA_CACHE)
+    assert filemeta.populated() and filemeta.metadata["numentries"] == 40
+
+def test_chunks_at_cluster_edges(root_files):
+    index = build_index({"ds": {"files": root_files}}, workers=2)["ds"]
+    bytes_per_event = index[root_files[0]]["bytes"] / 250
+    chunks = make_chunks(index, target_bytes=160 * bytes_per_event)
+    edges = [(start, stop) for path, start, stop, _ in chunks if path == root_files[0]]
+    assert edges == [(0, 150), (150, 250)]
+    assert [(start, stop) for path, start, stop, _ in chunks if path == root_files[1]] == [(0, 40)]
+
+def test_balance_by_bytes():
+    chunks = [("a", 0, 1, 10.), ("b", 0, 1, 6.), ("c", 0, 1, 5.), ("d", 0, 1, 1.)]
+    jobs = balance_chunks(chunks, 2)
+    assert sorted(sum(c[3] for c in job) for job in jobs) == [11., 11.]
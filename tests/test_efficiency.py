@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Functions.Efficiency import (
+    efficiency_intervals, fill_efficiencies, fill_efficiency, hist_efficiency, make_efficiency_hist
+)
+
+@pytest.mark.parametrize("method", ["clopper-pearson", "wilson"])
+def test_empty_bins_are_nan(method):
+    passed, total = np.array([0, 3, 0, 4]), np.array([0, 4, 0, 4])
+    eff, low, high = efficiency_intervals(passed, total, total, method=method)
+    assert np.isnan(eff[[0, 2]]).all() and np.isnan(low[[0, 2]]).all() and np.isnan(high[[0, 2]]).all()
+    assert eff[1] == 0.75 and low[1] < 0.75 < high[1]
+    # Full efficiency: the interval still has a width
+    assert eff[3] == 1. and low[3] < 1. and high[3] == pytest.approx(1.)
+
+def test_clopper_pearson_unweighted():
+    # Exact 68.3% Clopper-Pearson interval of 0 passed out of 10
+    eff, low, high = efficiency_intervals(0, 10)
+    assert eff == 0. and low == 0. and high == pytest.approx(1 - ((1 - 0.6827) / 2)**0.1, abs=1e-4)
+
+def test_weighted_effective_entries():
+    h = make_efficiency_hist([("num", "den")], (1, 0., 10.))
+    fill_efficiency(h, {"num/den": ([1., 2.], [1., 2., 3., 4.], [2., 2.], [2., 2., 2., 2.])})
+    eff, low, high = hist_efficiency(h, "num/den")
+    unweighted = efficiency_intervals(2, 4)
+    # Uniform weights: same interval as the unweighted entries
+    np.testing.assert_allclose([eff[0], low[0], high[0]], [u for u in unweighted])
+
+def test_fill_efficiencies_pairs():
+    df = pd.DataFrame({
+        "MatchedGenjj_pt": [50., 0., 80., 0.],
+        "Genjj_pt": [55., 30., 75., 0.],
+        "Matchedjj_pt": [48., 0., 0., 0.],
+        "jj_pt": [48., 20., 90., 0.],
+    })
+    h = fill_efficiencies(df, [("MatchedGenjj", "Genjj"), ("Matchedjj", "jj")], bins=[0., 100.])
+    eff, _, _ = hist_efficiency(h)
+    np.testing.assert_allclose(eff[:, 0], [2 / 3, 1 / 3])
+
+def test_fill_efficiencies_without_gen_objects():
+    df = pd.DataFrame({"MatchedGenjj_pt": [0., 0.], "Genjj_pt": [0., -1.]})
+    h = fill_efficiencies(df, [("MatchedGenjj", "Genjj")], bins=5)
+    eff, low, high = hist_efficiency(h, "MatchedGenjj/Genjj")
+    assert len(eff) == 5 and np.isnan(eff).all() and np.isnan(low).all()
@@ -0,0 +1,135 @@
+import awkward as ak
+import numpy as np
+import pytest
+from coffea.nanoevents.methods import candidate
+
+from Functions.JetsCom import (
+    CHI2_SIGMA_TOP, CHI2_SIGMA_W, TOP_MASS_NOMINAL, TOP_STRATEGIES, TRIPLET_TOP_MASS_BOUNDS,
+    TRIPLET_W_MASS_BOUNDS, W_MASS_NOMINAL, _bjj_deltaM_awkward, _bjj_deltaR_awkward,
+    _bjj_pair_kernel, _combine_jets_awkward, _flat_jets, _get_dijet_awkward, _leading_candidate,
+    bjj_deltaM, bjj_deltaR, combine_jets, get_dijet, reconstruct_top_candidates,
+    top_triplet_candidates,
+)
+
+ak.behavior.update(candidate.behavior)
+
+def jets(nevents, mean_njets, rng):
+    counts = rng.poisson(mean_njets, nevents)
+    ntot = counts.sum()
+    flat = {
+        "pt": rng.exponential(60., ntot) + 30.,
+        "eta": rng.uniform(-2.4, 2.4, ntot),
+        "phi": rng.uniform(-np.pi, np.pi, ntot),
+        "mass": rng.uniform(2., 20., ntot),
+        # Summed by the awkward references of the candidates
+        "charge": rng.choice([-1, 1], ntot),
+    }
+    jets = ak.zip({k: ak.unflatten(v, counts) for k, v in flat.items()}, with_name="PtEtaPhiMCandidate")
+    return jets[ak.argsort(jets.pt, ascending=False)]
+
+def assert_same_p4(out, ref):
+    for var in ("pt", "eta", "phi", "mass"):
+        np.testing.assert_allclose(ak.to_numpy(out[var]), ak.to_numpy(ref[var]), rtol=1e-6, atol=1e-6, err_msg=var)
+
+def w_candidates(lightjets):
+    # Singleton W candidates as stored by the resolved workflow, with the charge
+    # summed by the references
+    jj = get_dijet(lightjets, taggerVars=False)[:, None]
+    return ak.with_field(jj, ak.zeros_like(jj.pt, dtype=np.int64), "charge")
+
+@pytest.fixture(scope="module")
+def events():
+    # Low multiplicities: many events with 0 or 1 b-jet or light jet
+    rng = np.random.default_rng(2)
+    bjets, lightjets = jets(1000, 2., rng), jets(1000, 2.5, rng)
+    assert ak.any(ak.num(bjets) == 0) and ak.any(ak.num(bjets) == 1)
+    assert ak.any(ak.num(lightjets) == 0) and ak.any(ak.num(lightjets) == 1)
+    return bjets, w_candidates(lightjets)
+
+def test_bjj_pair_kernel(events):
+    bjets, jj = events
+    offsets, (pt, eta, phi, mass) = _flat_jets(bjets)
+    (w_pt, w_eta, w_phi, w_mass), w_ok = _leading_candidate(jj)
+    cands, dr, valid = _bjj_pair_kernel(offsets, pt, eta, phi, mass, w_pt, w_eta, w_phi, w_mass, w_ok)
+    assert valid.tolist() == ak.to_list(ak.num(bjets) >= 2)
+    w = ak.firsts(jj)
+    for j in range(2):
+        b = ak.firsts(bjets[valid][:, j:j + 1])
+        sums = b + w[valid]
+        for k, var in enumerate(("pt", "eta", "phi", "mass")):
+            np.testing.assert_allclose(cands[valid, j, k], ak.to_numpy(getattr(sums, var)), rtol=1e-6, atol=1e-6)
+        np.testing.assert_allclose(dr[valid, j], ak.to_numpy(b.delta_r(w[valid])), rtol=1e-9)
+    assert not cands[~valid].any()
+
+@pytest.mark.parametrize("fast, reference", [
+    (bjj_deltaR, _bjj_deltaR_awkward),
+    (bjj_deltaM, _bjj_deltaM_awkward),
+])
+def test_bjj_matches_awkward(events, fast, reference):
+    assert_same_p4(fast(*events), reference(*events))
+
+def test_get_dijet_matches_awkward():
+    rng = np.random.default_rng(3)
+    lightjets = jets(1000, 2., rng)
+    dijet = get_dijet(lightjets, taggerVars=False)
+    assert_same_p4(dijet, _get_dijet_awkward(lightjets, taggerVars=False))
+    assert ak.all((dijet.pt == 0) == (ak.num(lightjets) < 2))
+    # No event at all
+    assert len(get_dijet(lightjets[:0], taggerVars=False)) == 0
+
+def test_combine_jets_matches_awkward():
+    rng = np.random.default_rng(4)
+    jet1, jet2 = jets(1000, 1., rng), jets(1000, 1.5, rng)
+    combined = combine_jets(jet1, jet2)
+    assert_same_p4(combined, _combine_jets_awkward(jet1, jet2))
+    assert ak.all((combined.pt == 0) == ((ak.num(jet1) == 0) | (ak.num(jet2) == 0)))
+
+def _bjj_chi2_awkward(bjets, dijet):
+    # Same pairing as the awkward references, lowest chi2 of the W and top masses
+    pairs = ak.argcombinations(bjets, 2, axis=1)
+    bjj_1 = _combine_jets_awkward(bjets[pairs.slot0], dijet)
+    bjj_2 = _combine_jets_awkward(bjets[pairs.slot1], dijet)
+    w_term = ((ak.firsts(dijet).mass - W_MASS_NOMINAL) / CHI2_SIGMA_W)**2
+    chi2_1 = w_term + ((bjj_1.mass - TOP_MASS_NOMINAL) / CHI2_SIGMA_TOP)**2
+    chi2_2 = w_term + ((bjj_2.mass - TOP_MASS_NOMINAL) / CHI2_SIGMA_TOP)**2
+    return ak.where(chi2_1 < chi2_2, bjj_1, bjj_2)
+
+TOP_REFERENCES = {
+    "deltaR": _bjj_deltaR_awkward,
+    "deltaM": _bjj_deltaM_awkward,
+    "chi2": _bjj_chi2_awkward,
+}
+
+@pytest.mark.parametrize("strategy", list(TOP_STRATEGIES))
+def test_top_strategies_match_awkward(events, strategy):
+    tops = reconstruct_top_candidates(*events, strategies=list(TOP_STRATEGIES))
+    assert_same_p4(tops[strategy], TOP_REFERENCES[strategy](*events))
+
+def test_unknown_strategy(events):
+    with pytest.raises(ValueError, match="unknown"):
+        reconstruct_top_candidates(*events, strategies=["unknown"])
+
+@pytest.fixture(scope="module")
+def high_multiplicity():
+    # Busy events: up to 4 x 15 hypotheses each
+    rng = np.random.default_rng(1)
+    return jets(500, 3.5, rng), jets(500, 7., rng)
+
+def test_k_must_be_positive(high_multiplicity):
+    with pytest.raises(ValueError):
+        top_triplet_candidates(*high_multiplicity, k=0)
+
+def test_pruning_keeps_the_best_hypotheses_in_bounds(high_multiplicity):
+    k = 3
+    pruned = top_triplet_candidates(*high_multiplicity, k=k)
+    # All the hypotheses, without pruning
+    full = top_triplet_candidates(*high_multiplicity, k=60, w_mass_bounds=(None, None),
+                                  top_mass_bounds=(None, None))
+    in_bounds = full[
+        (full.mjj >= TRIPLET_W_MASS_BOUNDS[0]) & (full.mjj <= TRIPLET_W_MASS_BOUNDS[1])
+        & (full.mass >= TRIPLET_TOP_MASS_BOUNDS[0]) & (full.mass <= TRIPLET_TOP_MASS_BOUNDS[1])
+    ][:, :k]
+    assert ak.sum(ak.num(pruned)) > 0
+    assert ak.sum(ak.num(full)) > ak.sum(ak.num(in_bounds))
+    for field in ["b_idx", "j1_idx", "j2_idx", "score"]:
+        assert ak.to_list(pruned[field]) == ak.to_list(in_bounds[field])
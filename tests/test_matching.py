@@ -0,0 +1,127 @@
+import itertools
+
+import awkward as ak
+import numpy as np
+import pytest
+from coffea.nanoevents.methods import candidate
+
+from Functions.JetsCom import get_dijet
+from Functions.Matching import object_matching, object_matching1
+
+ak.behavior.update(candidate.behavior)
+
+DR_MIN = 0.4
+
+def brute_force_matching(obj, obj2, dr_min):
+    '''
+    Pure Python greedy matching over all the pairs of every event.
+    '''
+    result = []
+    for jets1, jets2 in zip(ak.to_list(obj), ak.to_list(obj2)):
+        pairs = []
+        for (a, j1), (b, j2) in itertools.product(enumerate(jets1), enumerate(jets2)):
+            if j1["pt"] <= 0 or j2["pt"] <= 0:
+                continue
+            dphi = (j1["phi"] - j2["phi"] + np.pi) % (2 * np.pi) - np.pi
+            dr = np.hypot(j1["eta"] - j2["eta"], dphi)
+            if dr < dr_min:
+                pairs.append((dr, a, b))
+        used1, used2, matches = set(), set(), []
+        for dr, a, b in sorted(pairs):
+            if a not in used1 and b not in used2:
+                used1.add(a)
+                used2.add(b)
+                matches.append((a, b, dr))
+        result.append(matches)
+    return result
+
+def make_jets(events):
+    return ak.zip({
+        field: [[jet[i] for jet in jets] for jets in events]
+        for i, field in enumerate(["pt", "eta", "phi", "mass"])
+    }, with_name="PtEtaPhiMCandidate")
+
+def random_jets(nevents, mean_njets, rng):
+    counts = rng.poisson(mean_njets, nevents)
+    ntot = counts.sum()
+    flat = {
+        # A fraction of zero-filled placeholders, never matched
+        "pt": np.where(rng.uniform(size=ntot) < 0.1, 0., rng.exponential(60., ntot) + 20.),
+        "eta": rng.uniform(-2.4, 2.4, ntot),
+        "phi": rng.uniform(-np.pi, np.pi, ntot),
+        "mass": rng.uniform(2., 20., ntot),
+    }
+    return ak.zip({k: ak.unflatten(v, counts) for k, v in flat.items()}, with_name="PtEtaPhiMCandidate")
+
+def smeared(jets, rng):
+    counts = ak.num(jets)
+    ntot = int(ak.sum(counts))
+    flat = {
+        "pt": ak.to_numpy(ak.flatten(jets.pt)) * rng.normal(1., 0.1, ntot),
+        "eta": ak.to_numpy(ak.flatten(jets.eta)) + rng.normal(0., 0.2, ntot),
+        "phi": ak.to_numpy(ak.flatten(jets.phi)) + rng.normal(0., 0.2, ntot),
+        "mass": ak.to_numpy(ak.flatten(jets.mass)),
+    }
+    return ak.zip({k: ak.unflatten(v, counts) for k, v in flat.items()}, with_name="PtEtaPhiMCandidate")
+
+def check(obj, obj2, dr_min=DR_MIN):
+    matched, matched2, deltaR = object_matching(obj, obj2, dr_min)
+    reference = brute_force_matching(obj, obj2, dr_min)
+    assert ak.to_list(ak.num(deltaR)) == [len(matches) for matches in reference]
+    for i, matches in enumerate(reference):
+        for n, (a, b, dr) in enumerate(matches):
+            assert matched[i][n].pt == obj[i][a].pt
+            assert matched2[i][n].pt == obj2[i][b].pt
+            assert deltaR[i][n] == pytest.approx(dr, abs=1e-9)
+
+@pytest.fixture(scope="module")
+def collections():
+    rng = np.random.default_rng(7)
+    reco = random_jets(2000, 4., rng)
+    return reco, smeared(reco, rng)
+
+def test_collections_match_brute_force(collections):
+    check(*collections)
+
+def test_singletons_match_brute_force(collections):
+    reco, gen = collections
+    check(ak.singletons(ak.firsts(reco)), ak.singletons(ak.firsts(gen)))
+
+def test_dijet_candidates(collections):
+    # get_dijet records, zero-filled in the events with less than 2 jets
+    reco, gen = collections
+    jj, genjj = get_dijet(reco, taggerVars=False), get_dijet(gen, taggerVars=False)
+    matched, matched2, deltaR = object_matching1(jj, genjj, DR_MIN)
+    reference = brute_force_matching(
+        [[c] for c in ak.to_list(jj)], [[c] for c in ak.to_list(genjj)], DR_MIN
+    )
+    assert ak.to_list(ak.num(deltaR)) == [len(matches) for matches in reference]
+    assert ak.all(matched.pt > 0) and ak.all(matched2.pt > 0)
+
+def test_empty_events():
+    jets = make_jets([[], [(50., 0., 0., 5.)], [], [(30., 1., 1., 5.), (20., -1., 2., 5.)]])
+    none = make_jets([[], [], [], []])
+    check(jets, none)
+    check(none, jets)
+    check(none, none)
+    assert ak.to_list(ak.num(object_matching(jets, jets, DR_MIN)[2])) == [0, 1, 0, 2]
+    # No event at all
+    check(jets[:0], jets[:0])
+
+def test_placeholders_never_match():
+    zero = (0., 0., 0., 0.)
+    jets = make_jets([[zero], [zero, (40., 0.1, 0.1, 5.)], [(-1., 0., 0., 0.)]])
+    gen = make_jets([[zero], [(40., 0., 0., 5.), (35., 0.1, 0.1, 5.)], [(20., 0., 0., 0.)]])
+    check(jets, gen)
+    matched, matched2, deltaR = object_matching(jets, gen, DR_MIN)
+    assert ak.to_list(matched.pt) == [[], [40.], []]
+    assert ak.to_list(matched2.pt) == [[], [35.], []]
+
+def test_ties():
+    # Equal ΔR: the first object of each collection is matched first
+    jets = make_jets([[(50., 0., 0., 5.), (40., 0., 0., 5.)], [(50., 0., 0., 5.)]])
+    gen = make_jets([[(45., 0.2, 0., 5.)], [(45., 0.2, 0., 5.), (35., -0.2, 0., 5.)]])
+    check(jets, gen)
+    matched, matched2, _ = object_matching(jets, gen, DR_MIN)
+    assert ak.to_list(matched.pt) == [[50.], [50.]]
+    assert ak.to_list(matched2.pt) == [[45.], [45.]]
@@ -0,0 +1,66 @@
+import os
+import shutil
+
+import hist
+import numpy as np
+import pytest
+from coffea.processor import column_accumulator
+from coffea.util import load, save
+
+from Functions.ColumnsExport import read_columns
+from Functions.MergeOutputs import tree_merge, watch
+
+def job_output(path, value, nevents=10):
+    h = hist.Hist(hist.axis.Regular(4, 0, 4, name="x"))
+    h.fill(np.full(nevents, value))
+    columns = {"jj_pt": column_accumulator(np.full(nevents, float(value)))}
+    save({"variables": {"x": h}, "columns": {"TT": {"TT_2018": {"baseline": columns}}}}, path)
+    return path
+
+def test_merge(tmp_path):
+    inputs = [job_output(str(tmp_path / f"output_job_{i}.coffea"), i % 4) for i in range(10)]
+    output = str(tmp_path / "output_all.coffea")
+    tree_merge(inputs, output, output + ".merge", fan_in=3, workers=2)
+    merged = load(output)
+    assert merged["variables"]["x"].values().tolist() == [30., 30., 20., 20.]
+
+    # The spilled columns do not depend on the work directory
+    shutil.rmtree(output + ".merge")
+    paths = merged["columns_manifest"]["TT"]["TT_2018"]["baseline"]
+    assert len(paths) == 10
+    assert all(not path.startswith(os.path.abspath(output + ".merge")) for path in paths)
+    assert len(read_columns(paths)) == 100
+
+def test_resume_with_changed_inputs(tmp_path):
+    inputs = [job_output(str(tmp_path / f"output_job_{i}.coffea"), 0) for i in range(4)]
+    output = str(tmp_path / "output_all.coffea")
+    tree_merge(inputs, output, output + ".merge", fan_in=2, workers=2)
+    assert load(output)["variables"]["x"].values()[0] == 40.
+
+    # Rewritten job output and one more job: the stale intermediates are not reused
+    job_output(inputs[0], 0, nevents=20)
+    os.utime(inputs[0], (1, 1))
+    inputs.append(job_output(str(tmp_path / "output_job_4.coffea"), 0))
+    tree_merge(inputs, output, output + ".merge", fan_in=2, workers=2)
+    assert load(output)["variables"]["x"].values()[0] == 60.
+
+def test_single_and_empty_inputs(tmp_path):
+    output = str(tmp_path / "output_all.coffea")
+    tree_merge([job_output(str(tmp_path / "output_job_0.coffea"), 1)], output, output + ".merge", workers=1)
+    assert "columns_manifest" in load(output)
+    with pytest.raises(ValueError):
+        tree_merge([], output, output + ".merge")
+
+def test_watch_with_relative_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("jobs")
+    for i in range(3):
+        job_output(f"jobs/output_job_{i}.coffea", i)
+    watch("jobs", "output_all.coffea", interval=0., njobs=3, settle=0.)
+    merged = load("output_all.coffea")
+    assert merged["variables"]["x"].values().tolist() == [10., 10., 10., 0.]
+    # The manifest is readable from another working directory
+    paths = merged["columns_manifest"]["TT"]["TT_2018"]["baseline"]
+    assert all(os.path.isabs(path) for path in paths)
+    monkeypatch.chdir("jobs")
+    assert len(read_columns(paths)) == 30
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+from coffea.processor import column_accumulator
+
+from Functions.ColumnsExport import write_columns
+from Functions.OpenFiles import (
+    arrow_to_dataframe, extract_arrow_tables, extract_dataframes, extract_parquet_dataframes
+)
+
+@pytest.fixture
+def columns():
+    return {
+        "mask": np.array([[True, False], [False, True], [True, True]]),
+        "jj_p4": np.arange(12.).reshape(3, 4),
+        "jj_pt": np.array([10., 20., 30.]),
+    }
+
+def output(columns):
+    return {"columns": {"TT": {"TT_2018": {"baseline": {
+        name: column_accumulator(value) for name, value in columns.items()
+    }}}}}
+
+def test_arrow_2d_columns_match_dataframes(columns):
+    data = output(columns)
+    table = extract_arrow_tables(data)["TT_TT_2018_baseline"]
+    df = arrow_to_dataframe(table)
+    expected = extract_dataframes(data)[1]["TT_TT_2018_baseline"]
+    pd.testing.assert_frame_equal(df[expected.columns], expected, check_dtype=False)
+    assert df["mask_2"].tolist() == [False, True, True]
+    assert arrow_to_dataframe(table, ["mask_1", "jj_p4_3"]).to_dict("list") == {
+        "mask_1": [True, False, True], "jj_p4_3": [2., 6., 10.]
+    }
+
+def test_parquet_2d_columns(columns, tmp_path):
+    manifest = write_columns(output(columns)["columns"]["TT"], str(tmp_path), "TT", "chunk")
+    df = extract_parquet_dataframes({"columns_manifest": {"TT": manifest}})["TT_TT_2018_baseline"]
+    assert df["mask_1"].tolist() == [True, False, True]
+    assert df["jj_p4_4"].tolist() == [3., 7., 11.]
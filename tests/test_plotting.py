@@ -0,0 +1,51 @@
+import hist
+import numpy as np
+import pandas as pd
+
+from Functions.Plotting import _spec_hash, fill_heat_map, fill_hists
+
+def test_heat_map_quantile_bins():
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame({"x": rng.exponential(50., 10_000) + 1., "y": rng.uniform(1., 2., 10_000)})
+    h = fill_heat_map({"a": df[:5000], "b": df[5000:]}, "x", "y", bins=10)
+    counts = h.values().sum(axis=1)
+    assert len(counts) == 10 and counts.sum() == len(df)
+    # About the same number of entries per quantile bin
+    assert counts.min() > 0.9 * counts.max()
+
+def test_heat_map_without_data_falls_back_to_fixed_bins():
+    empty = pd.DataFrame({"x": [np.nan, 0.], "y": [1., 2.]})
+    h = fill_heat_map(empty, "x", "y", bins=10, xlim=(0, 500), ylim=(0, 5))
+    assert h.axes[0].edges[0] == 0. and h.axes[0].edges[-1] >= 500.
+    assert len(h.axes[0]) == 10 and h.values().sum() == 0
+    assert h.axes[1].edges[0] == 0.
+
+def test_heat_map_single_value():
+    df = pd.DataFrame({"x": np.full(100, 40.), "y": np.linspace(1., 2., 100)})
+    h = fill_heat_map(df, "x", "y", bins=10)
+    assert h.values().sum() == 100
+
+def test_hists_skip_columns_without_values():
+    datasets = {
+        "a": pd.DataFrame({"pt": [10., np.nan, 30.], "nan": [np.nan] * 3}),
+        "b": pd.DataFrame({"pt": [50., np.inf], "nan": [np.nan] * 2}),
+    }
+    hists = fill_hists(datasets, bins=4)
+    assert set(hists["a"]) == set(hists["b"]) == {"pt"}
+    assert hists["a"]["pt"].axes[0].edges[0] == 10. and hists["b"]["pt"].axes[0].edges[-1] > 50.
+    assert hists["a"]["pt"].values().sum() == 2
+
+    # The configured limits are used instead
+    hists = fill_hists(datasets, bins=4, limits={"nan": (0., 100.)})
+    np.testing.assert_allclose(hists["a"]["nan"].axes[0].edges, [0., 25., 50., 75., 100.])
+    # Empty DataFrames
+    assert fill_hists({"a": datasets["a"][:0]}) == {"a": {}}
+
+def test_spec_hash_follows_the_contents():
+    h = hist.Hist(hist.axis.Regular(4, 0., 4., name="x"))
+    h.fill([1., 2.])
+    spec = {"func": "stacked_hist", "args": ({"TT": h}, "x", "2018"), "kwargs": {"a": 1, "b": 2}, "name": "x"}
+    same = {"name": "x", "kwargs": {"b": 2, "a": 1}, "args": [{"TT": h.copy()}, "x", "2018"], "func": "stacked_hist"}
+    assert _spec_hash(spec) == _spec_hash(same)
+    h.fill([3.])
+    assert _spec_hash(spec) != _spec_hash(same)
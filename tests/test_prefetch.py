@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from Functions.Prefetch import Prefetcher
+
+class FakeRead:
+    """
+    Stand-in of read_chunk returning `nbytes` per chunk, recording the number
+    of reads in flight and failing on the chunks listed in `fail`.
+    """
+
+    def __init__(self, nbytes=1_000_000, delay=0.01, fail=()):
+        self.nbytes = nbytes
+        self.delay = delay
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, file, entry_start, entry_stop, branches):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if entry_start in self.fail:
+                raise OSError(f"cannot read chunk {entry_start}")
+            return {"x": np.full(self.nbytes // 8, float(entry_start))}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+def chunks(n):
+    return [("file.root", i, i + 1) for i in range(n)]
+
+def test_order_and_content():
+    prefetcher = Prefetcher(chunks(6), ["x"], depth=3, read=FakeRead(nbytes=80))
+    assert [arrays["x"][0] for _, arrays in prefetcher] == list(range(6))
+
+def test_budget_counts_outstanding_reads():
+    # 1 MB chunks, 2.5 MB budget: the current chunk and one read ahead
+    read = FakeRead(nbytes=1_000_000, delay=0.05)
+    prefetcher = Prefetcher(chunks(8), ["x"], depth=4, memory_budget_mb=2.5, read=read)
+    for _ in prefetcher:
+        time.sleep(0.02)
+    assert read.max_running == 1
+
+def test_budget_in_scratch_mode(tmp_path):
+    # The chunks read into memory before being written count in the budget too
+    read = FakeRead(nbytes=1_000_000, delay=0.05)
+    prefetcher = Prefetcher(chunks(6), ["x"], depth=4, memory_budget_mb=2.5,
+                            scratch_dir=str(tmp_path), read=read)
+    for _ in prefetcher:
+        time.sleep(0.02)
+    assert read.max_running == 1
+
+def test_budget_from_the_index():
+    # Index estimates: two reads fit before the first chunk is known
+    read = FakeRead(nbytes=1_000_000, delay=0.05)
+    indexed = [chunk + (1_000_000,) for chunk in chunks(6)]
+    prefetcher = Prefetcher(indexed, ["x"], depth=4, memory_budget_mb=2.5, read=read)
+    assert [chunk for chunk, _ in prefetcher] == indexed
+    assert read.max_running == 2
+    # The estimates are scaled by the read / indexed bytes: 4x too low here
+    read = FakeRead(nbytes=1_000_000, delay=0.05)
+    indexed = [chunk + (250_000,) for chunk in chunks(6)]
+    prefetcher = Prefetcher(indexed, ["x"], depth=4, memory_budget_mb=2.5, read=read)
+    for _ in prefetcher:
+        time.sleep(0.02)
+    assert prefetcher._estimate(5) == 1_000_000
+
+def test_error_raised_at_its_chunk():
+    prefetcher = Prefetcher(chunks(5), ["x"], depth=3, read=FakeRead(nbytes=80, fail=(3,)))
+    seen = []
+    with pytest.raises(OSError, match="chunk 3"):
+        for chunk, arrays in prefetcher:
+            seen.append(chunk[1])
+    assert seen == [0, 1, 2]
+
+def test_shared_scratch_dir(tmp_path):
+    first = Prefetcher(chunks(4), ["x"], depth=2, scratch_dir=str(tmp_path), read=FakeRead(nbytes=80))
+    second = Prefetcher(chunks(4), ["x"], depth=2, scratch_dir=str(tmp_path), read=FakeRead(nbytes=80))
+    for (_, a), (_, b) in zip(first, second):
+        assert a["x"][0] == b["x"][0]
+    assert os.listdir(tmp_path) == []
+
+def test_abandoned_iteration_removes_scratch_files(tmp_path):
+    prefetcher = Prefetcher(chunks(6), ["x"], depth=3, scratch_dir=str(tmp_path), read=FakeRead(nbytes=80))
+    for chunk, arrays in prefetcher:
+        break
+    assert os.listdir(tmp_path) == []
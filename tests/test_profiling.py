@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from Functions.Profiling import PeakRSS, StageProfiler, profile_table
+
+def allocate(mb):
+    # Temporary freed before returning: invisible to an end-minus-start RSS
+    array = np.ones(int(mb * 1024**2 / 8))
+    array += 1
+    del array
+    return mb
+
+def test_peak_of_freed_temporaries():
+    with PeakRSS() as rss:
+        allocate(200)
+    assert rss.growth_mb > 150
+
+def test_nested_stages():
+    processor = SimpleNamespace(output={"profile": {}})
+    profiler = StageProfiler()
+    def outer():
+        profiler.measure(processor, "inner", allocate, lambda result: 1, 200)
+        return 1
+    for _ in range(2):
+        profiler.measure(processor, "outer", outer, lambda result: 1)
+    profile = processor.output["profile"]
+    assert profile["outer;inner"]["calls"] == 2
+    # Summed over the calls, the parent sees the peak of its child
+    assert profile["outer;inner"]["peak_mb"] > 2 * 150
+    assert profile["outer"]["peak_mb"] > 2 * 150
+    assert "peak MB/call" in profile_table(profile)
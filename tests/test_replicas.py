@@ -0,0 +1,72 @@
+import os
+import time
+
+import numpy as np
+import pytest
+import uproot
+
+from Functions.Replicas import ReplicaResolver
+
+LFN = "/store/mc/RunIISummer20UL18NanoAODv9/TTToSemiLeptonic/file.root"
+OTHER_LFN = "/store/mc/RunIISummer20UL18NanoAODv9/TTTo2L2Nu/file.root"
+
+def write_file(prefix, lfn):
+    os.makedirs(os.path.dirname(prefix + lfn), exist_ok=True)
+    with uproot.recreate(prefix + lfn) as f:
+        f["Events"] = {"x": np.arange(10.)}
+
+@pytest.fixture
+def sites(tmp_path):
+    # Local directories standing in for the sites, "dead" refuses the connections
+    sites_map = {"dead": "http://127.0.0.1:9"}
+    for site in ["slow", "fast"]:
+        sites_map[site] = str(tmp_path / site)
+        write_file(sites_map[site], LFN)
+    return sites_map
+
+def test_failed_probe_is_cached(sites, tmp_path, monkeypatch):
+    resolver = ReplicaResolver(sites, cache_file=str(tmp_path / "scores.json"))
+    resolver.resolve(LFN)
+    assert "error" in resolver.scores["dead"]
+    assert "throughput" in resolver.scores["fast"]
+
+    probed = []
+    measure = resolver._measure
+    monkeypatch.setattr(resolver, "_measure", lambda url: probed.append(url) or measure(url))
+    assert not resolver.resolve(LFN).startswith(sites["dead"])
+    assert probed == []
+    # The failures expire with the scores
+    resolver.scores["dead"]["time"] -= 2 * resolver.max_age
+    resolver.resolve(LFN)
+    assert probed == [sites["dead"] + LFN]
+
+def test_ranked_before_max_tries(sites, tmp_path):
+    resolver = ReplicaResolver(sites, cache_file=str(tmp_path / "scores.json"))
+    now = time.time()
+    resolver.scores["slow"] = {"latency": 10., "throughput": 1e3, "time": now}
+    resolver.scores["fast"] = {"latency": 0.01, "throughput": 1e9, "time": now}
+    # The dead site comes first in the map, then the slow one
+    assert resolver.resolve(LFN, max_tries=1) == sites["fast"] + LFN
+    assert [site for site, _ in resolver.replicas(LFN)] == ["fast", "slow", "dead"]
+
+def test_no_replica(sites, tmp_path):
+    resolver = ReplicaResolver({"dead": sites["dead"]}, cache_file=str(tmp_path / "scores.json"))
+    with pytest.raises(OSError, match="dead"):
+        resolver.resolve(LFN)
+    # Reloaded from the cache file
+    assert "error" in ReplicaResolver({"dead": sites["dead"]}, cache_file=str(tmp_path / "scores.json")).scores["dead"]
+
+def test_missing_file_is_per_file(tmp_path):
+    # Two sites hosting disjoint files: each one is still used for its own file
+    sites_map = {"first": str(tmp_path / "first"), "second": str(tmp_path / "second")}
+    write_file(sites_map["first"], LFN)
+    write_file(sites_map["second"], OTHER_LFN)
+    resolver = ReplicaResolver(sites_map, cache_file=str(tmp_path / "scores.json"))
+    assert resolver.resolve(LFN) == sites_map["first"] + LFN
+    assert resolver.resolve(OTHER_LFN) == sites_map["second"] + OTHER_LFN
+    assert not any("error" in score for score in resolver.scores.values())
+    # Resolved again from the cache, without a failing open of the missing replica
+    assert resolver.resolve(LFN) == sites_map["first"] + LFN
+    assert ("second", LFN) in resolver.missing
+    with pytest.raises(OSError, match="file not found"):
+        resolver.resolve("/store/mc/nowhere.root")
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from coffea.processor import accumulate
+
+from Functions.Sketch import QuantileSketch
+
+QS = np.linspace(0.01, 0.99, 99)
+
+@pytest.fixture(scope="module")
+def values():
+    rng = np.random.default_rng(5)
+    # Positive and negative values over several orders of magnitude
+    return np.concatenate([rng.lognormal(3., 1.5, 40_000), -rng.lognormal(1., 1., 10_000)])
+
+def test_relative_error(values):
+    alpha = 0.01
+    sketch = QuantileSketch(alpha=alpha).fill(values)
+    # Lower weighted quantile: the first value whose cumulative weight reaches q
+    exact = np.quantile(values, QS, method="inverted_cdf")
+    assert np.all(np.abs(sketch.quantile(QS) - exact) <= alpha * np.abs(exact))
+
+def test_weighted_quantiles():
+    sketch = QuantileSketch(alpha=0.001).fill([1., 10., 100.], weights=[1., 1., 8.])
+    np.testing.assert_allclose(sketch.quantile([0.05, 0.15, 0.5]), [1., 10., 100.], rtol=1.01e-3)
+
+def test_merge_across_workers(values):
+    single = QuantileSketch().fill(values)
+    # One sketch per chunk, accumulated as the processor outputs
+    chunks = [QuantileSketch().fill(chunk) for chunk in np.array_split(values, 7)]
+    merged = accumulate(chunks)
+    assert merged.total == pytest.approx(single.total)
+    np.testing.assert_array_equal(merged.quantile(QS), single.quantile(QS))
+
+def test_empty():
+    assert np.isnan(QuantileSketch().fill([]).quantile([0.5])).all()
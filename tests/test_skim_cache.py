@@ -0,0 +1,90 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import awkward as ak
+import numpy as np
+
+from Functions.SkimCache import SkimCache
+from workflow import ttBaseProcessor_res
+
+def branches(n):
+    return {
+        "nJet": ak.Array(np.full(n, 2)),
+        "Jet_pt": ak.Array([[30., 40.]] * n),
+        "fixedGridRhoFastjetAll": ak.Array(np.linspace(0., 1., n)),
+    }
+
+def test_store_and_load(tmp_path):
+    cache = SkimCache(str(tmp_path))
+    key = SkimCache.key(filename="a.root", entrystart=0, entrystop=10)
+    assert cache.load(key) is None
+    cache.store(key, branches(3), {"nevents_after_skim": 5})
+    path, info = cache.load(key)
+    assert info == {"nevents_after_skim": 5, "nevents": 3}
+    assert ak.to_list(ak.from_parquet(path)["Jet_pt"]) == [[30., 40.]] * 3
+    # No temporary file left behind
+    assert sorted(os.listdir(tmp_path)) == [key + ".json", key + ".parquet"]
+
+def test_empty_skim_is_stored(tmp_path):
+    cache = SkimCache(str(tmp_path))
+    cache.store("empty", branches(0), {"nevents_after_skim": 0})
+    assert cache.load("empty") == (None, {"nevents_after_skim": 0, "nevents": 0})
+
+def test_concurrent_writers(tmp_path):
+    cache = SkimCache(str(tmp_path))
+    errors = []
+    def store():
+        try:
+            cache.store("chunk", branches(100), {"nevents_after_skim": 100})
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=store) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    path, info = cache.load("chunk")
+    assert len(ak.from_parquet(path)) == 100
+
+def test_eviction(tmp_path):
+    cache = SkimCache(str(tmp_path), max_size_gb=0.)
+    cache.store("old", branches(10), {"nevents_after_skim": 10})
+    assert cache.load("old") is None
+
+def test_eviction_of_info_only_entries(tmp_path):
+    cache = SkimCache(str(tmp_path), max_entries=3)
+    for i in range(5):
+        cache.store(f"empty{i}", branches(0), {"nevents_after_skim": 0})
+        os.utime(tmp_path / f"empty{i}.json", (i, i))
+    cache.store("full", branches(2), {"nevents_after_skim": 2})
+    # The oldest info-only entries go first, the used ones are kept
+    assert cache.load("empty0") is None and cache.load("empty1") is None
+    assert cache.load("empty2") is None
+    assert cache.load("empty4") is not None and cache.load("full") is not None
+    assert len(os.listdir(tmp_path)) == 4
+
+def test_fingerprint_follows_the_code():
+    def cut(events, params):
+        return events.pt > params["pt"]
+    def other(events, params):
+        return events.pt >= params["pt"]
+    assert SkimCache.fingerprint(cut) == SkimCache.fingerprint(cut)
+    assert SkimCache.fingerprint(cut) != SkimCache.fingerprint(other)
+
+def test_store_union_of_variations(tmp_path):
+    # The masks of the nominal and shape variations are OR-ed before the store
+    processor = SimpleNamespace(
+        _skim_cache=SkimCache(str(tmp_path)),
+        _skim_cache_entry="chunk",
+        _skim_cache_raw=branches(4),
+        _skim_cache_mask=np.zeros(4, dtype=bool),
+        nEvents_after_skim=4,
+    )
+    for mask in [np.array([True, False, False, False]), np.array([False, False, True, False])]:
+        processor._skim_cache_mask |= mask
+    ttBaseProcessor_res._store_skim_cache(processor)
+    path, info = processor._skim_cache.load("chunk")
+    assert info["nevents"] == 2
+    assert ak.to_list(ak.from_parquet(path)["fixedGridRhoFastjetAll"]) == [0., 2. / 3]
@@ -0,0 +1,32 @@
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate
+
+from Functions.Variations import dependent_collections, propagate_met
+from workflow import ttBaseProcessor_res
+
+ak.behavior.update(candidate.behavior)
+
+def test_met_follows_the_jets():
+    dependent = dependent_collections(ttBaseProcessor_res.collection_inputs, ttBaseProcessor_res.varied_collections)
+    assert {"MET", "JetGood", "jj", "bjj_deltaR"} <= dependent
+    assert not dependent & {"LeptonGood", "ll", "Genjj"}
+
+def test_propagate_met():
+    jets = ak.zip({
+        "pt": [[100., 40., 10.], [], [50.]],
+        "eta": [[0., 1., 2.], [], [0.5]],
+        "phi": [[0., np.pi / 2, 1.], [], [np.pi]],
+        "mass": [[10., 5., 2.], [], [5.]],
+    }, with_name="PtEtaPhiMCandidate")
+    met = ak.zip({"pt": [20., 30., 10.], "phi": [np.pi, 0., 0.]})
+
+    pt, phi = propagate_met(met, jets, jets)
+    np.testing.assert_allclose(ak.to_numpy(pt), [20., 30., 10.])
+
+    # +10% on the jets: the 10 GeV jet stays below the threshold
+    up = ak.with_field(jets, jets.pt * 1.1, "pt")
+    pt, phi = propagate_met(met, up, jets)
+    px, py = ak.to_numpy(pt * np.cos(phi)), ak.to_numpy(pt * np.sin(phi))
+    np.testing.assert_allclose(px, [-20. - 10., 30., 10. + 5.], atol=1e-9)
+    np.testing.assert_allclose(py, [-4., 0., 0.], atol=1e-9)
@@ -1,3 +1,6 @@
+import os
+import time
+
 import awkward as ak
 import numpy as np
 
@@ -19,12 +22,497 @@ from pocket_coffea.lib.objects import (
     met_xy_correction,
 )
 
-from Functions.JetsCom import get_dijet, bjj_deltaR, bjj_deltaM
+from Functions.JetsCom import get_dijet, reconstruct_top_candidates
 from Functions.Matching import object_matching1
+from Functions.SkimCache import SkimCache
+from Functions.ColumnsExport import chunk_id, write_columns
+from Functions.Sketch import QuantileSketch
+from Functions.Efficiency import make_efficiency_hist, fill_efficiency
+from Functions.Variations import dependent_collections, propagate_met
+from Functions.Profiling import StageProfiler, ProfiledCut, profile_table, cutflow_table, PeakRSS
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+from omegaconf import OmegaConf
+
+class _CutflowCut:
+    '''
+    Preselection cut proxy passing the per-step cutflow dictionary of the chunk
+    to the cut function (`cutflow` argument, see Cut_func.progressive_mask).
+    '''
+    def __init__(self, cut, processor):
+        self._cut = cut
+        self._processor = processor
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._cut, name)
+
+    def get_mask(self, events, **kwargs):
+        processor = self._processor
+        if processor._presel_variation == "nominal":
+            kwargs["cutflow"] = processor.output["presel_cutflow"].setdefault(
+                processor._dataset, {}).setdefault(self._cut.name, {})
+        return self._cut.get_mask(events, **kwargs)
+
+def _flat_with_weights(values, weights):
+    '''
+    Flat numpy values of a per-event or jagged field, with the event weight
+    repeated for every object. Missing values become NaN.
+    '''
+    if values.ndim > 1:
+        values = ak.fill_none(values, [], axis=0)
+        weights = np.repeat(weights, ak.to_numpy(ak.num(values, axis=1)))
+        values = ak.flatten(values)
+    return ak.to_numpy(ak.fill_none(values, np.nan)), np.asarray(weights)
 
 class ttBaseProcessor_res(BaseProcessorABC):
+    # Truth stage: Gen-level W/top reconstruction and reco-Gen matching.
+    # It runs on MC samples listed here, unless the dataset metadata sets
+    # "truth": "True"/"False" explicitly.
+    truth_samples = ["TTToSemiLeptonic", "TTTo2L2Nu", "TTToHadronic"]
+    # GenJet branches read by the truth stage. The JER smearing reads the GenJet
+    # kinematics of every MC sample anyway (see `config_branches`): the truth
+    # stage only adds the flavours and the Gen-level reconstruction
+    truth_branches = {
+        "GenJet": ["pt", "eta", "phi", "mass", "hadronFlavour", "partonFlavour"],
+    }
+    # NanoAOD collections and fields read by each stage ("" for the event-level
+    # branches), see `required_branches`. The truth stage is only read for MC.
+    branch_dependencies = {
+        "skim": {
+            "": ["run", "luminosityBlock", "event", "genWeight"],
+            "PV": ["npvsGood", "npvs"],
+            "Pileup": ["nTrueInt"],
+        },
+        "object_preselection": {
+            "": ["fixedGridRhoFastjetAll"],
+            "MET": ["pt", "phi"],
+            "Muon": ["pt", "eta", "phi", "mass", "charge", "pfRelIso04_all", "tightId", "dxy", "dz"],
+            "Electron": ["pt", "eta", "phi", "mass", "charge", "deltaEtaSC", "pfRelIso03_all",
+                         "mvaFall17V2Iso_WP80", "dxy", "dz"],
+            "Jet": ["pt", "eta", "phi", "mass", "jetId", "puId", "btagDeepFlavB", "rawFactor",
+                    "area", "genJetIdx", "hadronFlavour", "partonFlavour"],
+        },
+        "truth": truth_branches,
+        "columns": {
+            "MET": ["fiducialGenPhi", "fiducialGenPt"],
+        },
+    }
+    truth_stages = ["truth"]
+    # Inputs of the derived collections: the shape variations only recompute
+    # the ones depending on `varied_collections`, the others are reused from
+    # the nominal variation of the chunk
+    collection_inputs = {
+        "MET": ["MET", "Jet"],
+        "Electron": ["Electron"],
+        "MuonGood": ["Muon"],
+        "ElectronGood": ["Electron"],
+        "LeptonGood": ["MuonGood", "ElectronGood"],
+        "LeptonSave": ["LeptonGood"],
+        "ll": ["MuonGood", "ElectronGood"],
+        "JetGood": ["Jet", "LeptonGood"],
+        "BJetGood": ["JetGood"],
+        "BJetBad": ["JetGood"],
+        "jj": ["BJetBad"],
+        "bjj_deltaR": ["BJetGood", "jj"],
+        "bjj_deltaM": ["BJetGood", "jj"],
+        "GenJetSave": ["GenJet"],
+        "GenJetGood": ["GenJet"],
+        "GenBJetGood": ["GenJet"],
+        "GenBJetBad": ["GenJet"],
+        "GenJetGoodSave": ["GenJetGood"],
+        "GenBJetGoodSave": ["GenBJetGood"],
+        "GenBJetBadSave": ["GenBJetBad"],
+        "Genjj": ["GenBJetBad"],
+        "Genbjj_deltaR": ["GenBJetGood", "Genjj"],
+        "Genbjj_deltaM": ["GenBJetGood", "Genjj"],
+    }
+    # Raw collections changed by the shape variations (JES/JER act on the jets)
+    varied_collections = {"Jet"}
+    # Stages measured when profiling is enabled, on top of the skim and preselection cuts
+    profiled_stages = [
+        "skim_events",
+        "apply_object_preselection",
+        "met_preselection",
+        "lepton_preselection",
+        "truth_gen_reconstruction",
+        "truth_object_preselection",
+        "count_objects",
+        "define_common_variables_before_presel",
+        "apply_preselections",
+        "define_common_variables_after_presel",
+        "truth_reconstruction",
+    ]
+
     def __init__(self, cfg: Configurator):
         super().__init__(cfg)
+        # Events and time spent in the truth stage, to estimate the time skipped
+        self.output_format["truth_stage"] = {}
+        # Events, time and peak RSS of every chunk, used to tune the chunk size
+        self.output_format["chunk_stats"] = {}
+        # Optional local cache of the events passing the skim and preselection
+        cache_params = self.params.get("skim_cache", None)
+        if cache_params is not None and cache_params.enabled:
+            self._skim_cache = SkimCache(cache_params.directory, cache_params.max_size_gb,
+                                         cache_params.get("max_entries", 100_000))
+        else:
+            self._skim_cache = None
+        # Columns streamed to Parquet instead of column_accumulators
+        export_params = self.params.get("columns_export", None)
+        if export_params is not None and export_params.mode == "parquet":
+            self._columns_dir = os.path.abspath(export_params.directory)
+            self.output_format["columns_manifest"] = {}
+        else:
+            self._columns_dir = None
+        # Weighted quantile sketches of the listed "<collection>.<field>"
+        sketch_params = self.params.get("quantile_sketches", None)
+        if sketch_params is not None and len(sketch_params.variables) > 0:
+            self._sketch_alpha = sketch_params.alpha
+            self._sketch_variables = list(sketch_params.variables)
+            self.output_format["quantile_sketches"] = {}
+        else:
+            self._sketch_variables = []
+        # Matching efficiencies of the truth samples, accumulated as histograms
+        eff_params = self.params.get("efficiency", None)
+        if eff_params is not None and eff_params.enabled:
+            self._eff_pairs = [tuple(pair) for pair in eff_params.pairs]
+            self._eff_bins = list(eff_params.bins)
+            self.output_format["efficiency"] = {}
+        else:
+            self._eff_pairs = []
+        # Collections recomputed for the shape variations
+        self._variation_dependent = dependent_collections(self.collection_inputs, self.varied_collections)
+        self._nominal = None
+        # Events in/out and time of every step of the preselection chains
+        self.output_format["presel_cutflow"] = {}
+        self._preselections = [_CutflowCut(cut, self) for cut in self._preselections]
+        self._presel_variation = None
+        # Opt-in per-stage profiling, the stages are wrapped on the workers
+        profiling_params = self.params.get("profiling", None)
+        if profiling_params is not None and profiling_params.enabled:
+            self._profiler = StageProfiler()
+            self.output_format[self._profiler.key] = {}
+        else:
+            self._profiler = None
+        self._profiling_installed = False
+
+    @classmethod
+    def config_branches(cls, params, year=None, isMC=True):
+        '''
+        Collections and fields read by the parts of pocket-coffea driven by the
+        parameters: the jet calibration (JEC/JER inputs, with the Gen-level jets of
+        the JER smearing in MC) and the HLT triggers. All the years if `year` is None.
+        '''
+        years = [year] if year is not None else list(params.jets_calibration.collection.keys())
+        collections = {"": {"fixedGridRhoFastjetAll"}, "Rho": {"fixedGridRhoFastjetAll"}}
+        for y in years:
+            calibrated = OmegaConf.select(params, f"jets_calibration.collection.{y}", throw_on_missing=False)
+            for jet_type, coll in (calibrated or {}).items():
+                collections.setdefault(coll, set()).update(["pt", "eta", "phi", "mass", "area", "rawFactor"])
+                if isMC:
+                    genjet, idx = ("GenJetAK8", "genJetAK8Idx") if jet_type.startswith("AK8") else ("GenJet", "genJetIdx")
+                    collections[coll].add(idx)
+                    collections.setdefault(genjet, set()).update(["pt", "eta", "phi", "mass"])
+            triggers = OmegaConf.select(params, f"HLT_triggers.{y}", throw_on_missing=False)
+            for paths in (triggers or {}).values():
+                collections.setdefault("HLT", set()).update(paths)
+        return collections
+
+    @classmethod
+    def branch_collections(cls, isMC=True, truth=True, params=None, year=None):
+        '''
+        Collections and fields read by the workflow ("" for the event-level branches):
+        the declared `branch_dependencies`, plus the ones of `config_branches` if
+        the parameters are given.
+        '''
+        collections = {}
+        for stage, stage_collections in cls.branch_dependencies.items():
+            if stage in cls.truth_stages and not (isMC and truth):
+                continue
+            for collection, fields in stage_collections.items():
+                collections.setdefault(collection, set()).update(fields)
+        if params is not None:
+            for collection, fields in cls.config_branches(params, year, isMC).items():
+                collections.setdefault(collection, set()).update(fields)
+        return collections
+
+    @classmethod
+    def required_branches(cls, isMC=True, truth=True, params=None, year=None):
+        '''
+        Sorted list of the NanoAOD branches read by the workflow, including the
+        `n<Collection>` counters. Branches missing in a file are simply not read.
+        Without `params`, the calibration and trigger branches are not included.
+        '''
+        branches = set()
+        for collection, fields in cls.branch_collections(isMC, truth, params, year).items():
+            if collection == "":
+                branches.update(fields)
+            elif collection == "HLT":
+                # Flags, no counter
+                branches.update(f"HLT_{field}" for field in fields)
+            else:
+                branches.add(f"n{collection}")
+                branches.update(f"{collection}_{field}" for field in fields)
+        return sorted(branches)
+
+    def load_metadata(self):
+        super().load_metadata()
+        truth = self.events.metadata.get("truth", None)
+        if truth is None:
+            self._isTruth = self._isMC and self._sample in self.truth_samples
+        else:
+            self._isTruth = self._isMC and truth == "True"
+
+    def _raw_branches(self):
+        '''
+        Lazy dictionary of the raw NanoAOD branches needed by the run, including the
+        ones of the calibrations and triggers, taken before any object is corrected
+        or replaced.
+        '''
+        arrays = {}
+        collections = self.branch_collections(self._isMC, self._isTruth, self.params, self._year)
+        for collection, fields in collections.items():
+            if collection == "":
+                arrays.update({f: self.events[f] for f in fields if f in self.events.fields})
+                continue
+            if collection not in self.events.fields:
+                continue
+            coll = self.events[collection]
+            if coll.ndim > 1:
+                arrays[f"n{collection}"] = ak.num(coll)
+            arrays.update({
+                f"{collection}_{f}": coll[f] for f in fields if f in coll.fields
+            })
+        return arrays
+
+    def _skim_cache_key(self):
+        metadata = self.events.metadata
+        return SkimCache.key(
+            filename=metadata["filename"],
+            entrystart=metadata["entrystart"],
+            entrystop=metadata["entrystop"],
+            skim={cut.name: [cut.params, SkimCache.fingerprint(cut.function)] for cut in self._skim},
+            preselections={
+                cut.name: [cut.params, SkimCache.fingerprint(cut.function)] for cut in self._preselections
+            },
+            object_preselection=self.params.object_preselection,
+            # The object preselection and the variations computed before the preselection
+            workflow=SkimCache.fingerprint(type(self).process),
+            branches=self.required_branches(self._isMC, self._isTruth, self.params, self._year),
+        )
+
+    def skim_events(self):
+        self._skim_cache_hit = False
+        if self._skim_cache is None:
+            return super().skim_events()
+
+        self._skim_cache_entry = self._skim_cache_key()
+        cached = self._skim_cache.load(self._skim_cache_entry)
+        if cached is None:
+            super().skim_events()
+            # Keep the raw skimmed branches, stored at the end of the chunk with the
+            # events passing the preselection of any variation
+            self._skim_cache_raw = self._raw_branches()
+            self._skim_cache_mask = np.zeros(len(self.events), dtype=bool)
+            return
+
+        # Cache hit: replace the remote events by the cached ones, which already
+        # pass the skim and the preselection
+        path, info = cached
+        if path is None:
+            self.events = self.events[:0]
+        else:
+            self.events = NanoEventsFactory.from_parquet(
+                path, schemaclass=NanoAODSchema, metadata=dict(self.events.metadata)
+            ).events()
+        self._skim_cache_hit = True
+        self.nEvents_after_skim = info["nevents_after_skim"]
+        self.output["cutflow"]["skim"][self._dataset] += self.nEvents_after_skim
+        self.has_events = len(self.events) > 0
+
+    def _store_skim_cache(self):
+        # Events passing the preselection of the nominal or of any shape variation,
+        # which all start from the same skimmed events
+        if self._skim_cache_raw is None:
+            return
+        mask = self._skim_cache_mask
+        self._skim_cache.store(
+            self._skim_cache_entry,
+            {branch: array[mask] for branch, array in self._skim_cache_raw.items()},
+            {"nevents_after_skim": self.nEvents_after_skim},
+        )
+
+    def apply_preselections(self, variation):
+        self._presel_variation = variation
+        super().apply_preselections(variation)
+        mask = self._preselection_masks.all(*self._preselection_masks.names)
+        # Indices of the preselected events in the chunk, to reuse the nominal
+        # collections in the shape variations
+        self._presel_index = np.flatnonzero(mask)
+        if variation == "nominal":
+            self._nominal["lookup"] = np.full(len(mask), -1)
+            self._nominal["lookup"][self._presel_index] = np.arange(len(self._presel_index))
+        if self._skim_cache_raw is not None:
+            self._skim_cache_mask |= ak.to_numpy(mask)
+
+    def _share_with_nominal(self, variation, names, compute, preselected=False):
+        '''
+        Sets the collections `names` by calling `compute()` in the nominal variation,
+        and reuses them in the shape variations unless one of them depends on the
+        varied collections (see `collection_inputs`).
+
+        After the preselection (`preselected`), the events differ between the
+        variations: the nominal collections are taken for the events also passing
+        the nominal preselection and `compute()` only runs on the other ones.
+        '''
+        cache = self._nominal["preselected" if preselected else "all"]
+        if (variation == "nominal" or not cache
+                or any(name in self._variation_dependent for name in names)):
+            compute()
+            if variation == "nominal":
+                cache.update({name: self.events[name] for name in names})
+            return
+
+        if not preselected:
+            for name in names:
+                self.events[name] = cache[name]
+            return
+
+        pos = self._nominal["lookup"][self._presel_index]
+        shared = pos >= 0
+        if shared.all():
+            for name in names:
+                self.events[name] = cache[name][pos]
+            return
+        # Compute the collections of the events missing in the nominal preselection,
+        # and put them back in the order of the events
+        events = self.events
+        self.events = events[~shared]
+        compute()
+        computed = {name: self.events[name] for name in names}
+        self.events = events
+        order = np.argsort(np.concatenate([np.flatnonzero(shared), np.flatnonzero(~shared)]), kind="stable")
+        for name in names:
+            self.events[name] = ak.concatenate([cache[name][pos[shared]], computed[name]])[order]
+
+    def _record_truth_stage(self, nevents, start=None):
+        # Accumulate per dataset the events processed (or skipped) by the truth stage
+        stats = self.output["truth_stage"].setdefault(
+            self._dataset, {"events": 0, "seconds": 0., "events_skipped": 0}
+        )
+        if start is None:
+            stats["events_skipped"] += nevents
+        else:
+            stats["events"] += nevents
+            stats["seconds"] += time.perf_counter() - start
+
+    def fill_quantile_sketches(self, variation):
+        if not self._sketch_variables or variation != "nominal":
+            return
+        out = self.output["quantile_sketches"].setdefault(self._sample, {}).setdefault(self._dataset, {})
+        for category, mask in self._categories.get_masks():
+            weights = self.weights_manager.get_weight(category)[mask]
+            events = self.events[mask]
+            for variable in self._sketch_variables:
+                collection, field = variable.split(".")
+                values, w = _flat_with_weights(events[collection][field], weights)
+                sketch = out.setdefault(category, {}).setdefault(variable, QuantileSketch(self._sketch_alpha))
+                sketch.fill(values, w)
+
+    def fill_efficiencies(self, variation):
+        if not self._eff_pairs or not self._isTruth or variation != "nominal":
+            return
+        out = self.output["efficiency"].setdefault(self._sample, {}).setdefault(self._dataset, {})
+        for category, mask in self._categories.get_masks():
+            weights = self.weights_manager.get_weight(category)[mask]
+            events = self.events[mask]
+            # All the pairs of the category are filled in one go
+            entries = {}
+            for num, den in self._eff_pairs:
+                passed, w_passed = _flat_with_weights(events[num].pt, weights)
+                total, w_total = _flat_with_weights(events[den].pt, weights)
+                entries[f"{num}/{den}"] = (passed[passed > 0], total[total > 0],
+                                           w_passed[passed > 0], w_total[total > 0])
+            if category not in out:
+                out[category] = make_efficiency_hist(self._eff_pairs, self._eff_bins, name="pt")
+            fill_efficiency(out[category], entries)
+
+    def fill_column_accumulators(self, variation):
+        super().fill_column_accumulators(variation)
+        self.fill_quantile_sketches(variation)
+        self.fill_efficiencies(variation)
+        if self._columns_dir is None or variation != "nominal":
+            return
+        # Move the columns of this chunk out of the output into Parquet files,
+        # only their paths are accumulated
+        columns = self.output["columns"].pop(self._sample, {})
+        manifest = write_columns(
+            columns, self._columns_dir, self._sample, chunk_id(self.events.metadata)
+        )
+        if manifest:
+            self.output["columns_manifest"][self._sample] = manifest
+
+    def _install_profiler(self):
+        # Instance attributes shadow the methods, so the nested calls are measured too
+        def nevents(result):
+            events = getattr(self, "events", None)
+            return 0 if events is None else len(events)
+        for name in self.profiled_stages:
+            method = getattr(self, name)
+            def profiled(*args, _name=name, _method=method, **kwargs):
+                return self._profiler.measure(self, _name, _method, nevents, *args, **kwargs)
+            setattr(self, name, profiled)
+        self._skim = [ProfiledCut(cut, self._profiler, self) for cut in self._skim]
+        self._preselections = [ProfiledCut(cut, self._profiler, self) for cut in self._preselections]
+        self._profiling_installed = True
+
+    def process(self, events):
+        rss, start = PeakRSS(), time.perf_counter()
+        # Nominal collections shared with the shape variations of this chunk
+        self._nominal = {"all": {}, "preselected": {}, "lookup": None, "MET": None, "Jet": None}
+        self._skim_cache_raw = None
+        with rss:
+            if self._profiler is not None:
+                if not self._profiling_installed:
+                    self._install_profiler()
+                output = self._profiler.measure(
+                    self, "process", super().process, lambda result: len(events), events
+                )
+            else:
+                output = super().process(events)
+        self._nominal = None
+        if self._skim_cache is not None:
+            self._store_skim_cache()
+            self._skim_cache_raw = None
+        # [events, seconds, peak RSS growth in MB, RSS before in MB] of the chunk,
+        # see Functions/ChunkSize.py. The peak is sampled while the chunk runs:
+        # ru_maxrss is the lifetime peak of the worker and cannot be reset per chunk.
+        output["chunk_stats"].setdefault(events.metadata["dataset"], []).append([
+            len(events),
+            time.perf_counter() - start,
+            rss.growth_mb,
+            rss.start_mb,
+        ])
+        return output
+
+    def postprocess(self, accumulator):
+        accumulator = super().postprocess(accumulator)
+        # Estimate the time saved on the skipped samples from the average time
+        # per event of the truth stage where it ran
+        stats = accumulator.get("truth_stage", {}).values()
+        events = sum(s["events"] for s in stats)
+        seconds = sum(s["seconds"] for s in stats)
+        skipped = sum(s["events_skipped"] for s in stats)
+        if events > 0 and skipped > 0:
+            print(f"Truth stage skipped for {skipped} events, "
+                  f"about {skipped * seconds / events:.1f} s saved")
+        cutflow = accumulator.get("presel_cutflow", {})
+        if cutflow:
+            print(cutflow_table(cutflow))
+        if self._profiler is not None:
+            # Written to profile_summary.txt by python -m Functions.Profiling <outdir>
+            print(profile_table(accumulator.get(self._profiler.key, {})))
+        return accumulator
 
 
     def apply_object_preselection(self, variation):
@@ -34,17 +522,51 @@ class ttBaseProcessor_res(BaseProcessorABC):
         self.events["N_before_cuts"] = len(self.events)
         # print("total number of events", len(self.events))
 
-###########################################################################
-        # MET:
-        met_pt_corr, met_phi_corr = met_xy_correction(self.params, self.events, self._year, self._era)
-        self.events["MET"] = ak.with_field(
-            self.events.MET, met_pt_corr, "pt"
+        self.met_preselection(variation)
+        # The leptons do not depend on the jets: computed once per chunk
+        self._share_with_nominal(
+            variation,
+            ["Electron", "MuonGood", "ElectronGood", "LeptonGood", "LeptonSave", "ll"],
+            self.lepton_preselection,
         )
-        self.events["MET"] = ak.with_field(
-            self.events.MET, met_phi_corr, "phi"
+
+###########################################################################
+        # AK4 Jets:
+        self.events["JetGood"], self.jetGoodMask = jet_selection(
+            self.events, "Jet", self.params, 
+            year=self._year, 
+            leptons_collection="LeptonGood"
         )
+        self.events["BJetGood"] = btagging(
+            self.events["JetGood"], self.params.btagging.working_point[self._year], wp=self.params.object_preselection.Jet.btag.wp)
+        
+        self.events["BJetBad"] = btagging(
+            self.events["JetGood"], self.params.btagging.working_point[self._year], wp=self.params.object_preselection.Jet.btag.wp, veto=True)
+        # The dijet and the GenJet splits are only built for the events passing
+        # the preselection, see define_common_variables_after_presel
+
+    def met_preselection(self, variation):
+        # The xy-corrected MET of the nominal variation is kept with the nominal
+        # jets: the events are shared by the variations, correcting their MET
+        # again would apply the xy correction twice
+        if variation == "nominal" or self._nominal["MET"] is None:
+            met_pt_corr, met_phi_corr = met_xy_correction(self.params, self.events, self._year, self._era)
+            self.events["MET"] = ak.with_field(
+                self.events.MET, met_pt_corr, "pt"
+            )
+            self.events["MET"] = ak.with_field(
+                self.events.MET, met_phi_corr, "phi"
+            )
+            if variation == "nominal":
+                self._nominal["MET"] = self.events.MET
+                self._nominal["Jet"] = self.events.Jet
+            return
+        # JES/JER: the change of the jets is propagated to the MET (type-1)
+        met_pt, met_phi = propagate_met(self._nominal["MET"], self.events.Jet, self._nominal["Jet"])
+        self.events["MET"] = ak.with_field(self._nominal["MET"], met_pt, "pt")
+        self.events["MET"] = ak.with_field(self.events.MET, met_phi, "phi")
 
-###########################################################################        
+    def lepton_preselection(self):
         # Leptons:
         # Include the supercluster pseudorapidity variable
         electron_etaSC = self.events.Electron.eta + self.events.Electron.deltaEtaSC
@@ -69,64 +591,76 @@ class ttBaseProcessor_res(BaseProcessorABC):
             self.events.ElectronGood, self.events.MuonGood
         )
 
-###########################################################################
-        # AK4 Jets:
-        self.events["JetGood"], self.jetGoodMask = jet_selection(
-            self.events, "Jet", self.params, 
-            year=self._year, 
-            leptons_collection="LeptonGood"
+    def truth_object_preselection(self):
+        genjets = ak.zip(
+            {field: self.events.GenJet[field] for field in self.truth_branches["GenJet"]},
+            with_name="PtEtaPhiMCandidate"
         )
-        self.events["BJetGood"] = btagging(
-            self.events["JetGood"], self.params.btagging.working_point[self._year], wp=self.params.object_preselection.Jet.btag.wp)
+        # GenJets acceptance cuts
+        mask_pt = genjets.pt > 20
+        mask_eta = abs(genjets.eta) < 2.4
+        mask_genjet = mask_pt & mask_eta
+        # Ghost-hadron matching
+        mask_b = genjets.hadronFlavour == 5 # b jets
+        mask_l = genjets.hadronFlavour < 5 # light-flavour jets
+        # Ghost-parton matching 
+        mask_b_parton = abs(genjets.partonFlavour) == 5 # b jet
+        mask_l_parton = abs(genjets.partonFlavour) < 5
+
+        self.events["GenJetSave"] = ak.firsts(genjets)
+
+        # New GenJet collections split by flavours
+        self.events["GenJetGood"] = genjets[mask_genjet]
+        # self.events["BGenJetGood"] = genjets[mask_genjet & mask_b]
+        # self.events["LGenJetGood"] = genjets[mask_genjet & mask_l] # non b-jets
+        self.events["GenBJetGood"] = genjets[mask_genjet & mask_b & mask_b_parton]
+        self.events["GenBJetBad"] = genjets[mask_genjet & mask_l & mask_l_parton] # non b-jets
         
-        self.events["BJetBad"] = btagging(
-            self.events["JetGood"], self.params.btagging.working_point[self._year], wp=self.params.object_preselection.Jet.btag.wp, veto=True)
+        self.events["GenJetGoodSave"] = ak.firsts(self.events["GenJetGood"])
+        self.events["GenBJetGoodSave"] = ak.firsts(self.events["GenBJetGood"])
+        self.events["GenBJetBadSave"] = ak.firsts(self.events["GenBJetBad"])
+
+    def define_common_variables_after_presel(self, variation):
         # combine two AK4 jets
         self.events["jj"] = get_dijet(
             self.events["BJetBad"], taggerVars=False
         )
 
-###########################################################################
-        # Get GenJets by flavours:    
-        if self._isMC:
-            # GenJets acceptance cuts
-            mask_pt = self.events["GenJet"].pt > 20
-            mask_eta = abs(self.events["GenJet"].eta) < 2.4
-            mask_genjet = mask_pt & mask_eta
-            # Ghost-hadron matching
-            mask_b = self.events["GenJet"].hadronFlavour == 5 # b jets
-            mask_l = self.events["GenJet"].hadronFlavour < 5 # light-flavour jets
-            # Ghost-parton matching 
-            mask_b_parton = abs(self.events["GenJet"].partonFlavour) == 5 # b jet
-            mask_l_parton = abs(self.events["GenJet"].partonFlavour) < 5
-
-            self.events["GenJetSave"] = ak.firsts(self.events["GenJet"])
-
-            # New GenJet collections split by flavours
-            self.events["GenJetGood"] = self.events.GenJet[mask_genjet]
-            # self.events["BGenJetGood"] = self.events.GenJet[mask_genjet & mask_b]
-            # self.events["LGenJetGood"] = self.events.GenJet[mask_genjet & mask_l] # non b-jets
-            self.events["GenBJetGood"] = self.events.GenJet[mask_genjet & mask_b & mask_b_parton]
-            self.events["GenBJetBad"] = self.events.GenJet[mask_genjet & mask_l & mask_l_parton] # non b-jets
-            
-            self.events["GenJetGoodSave"] = ak.firsts(self.events["GenJetGood"])
-            self.events["GenBJetGoodSave"] = ak.firsts(self.events["GenBJetGood"])
-            self.events["GenBJetBadSave"] = ak.firsts(self.events["GenBJetBad"])
-
-    def define_common_variables_after_presel(self, variation):
-
 ###########################################################################
         # Reconstruct the top by combining the W with 1 b-jets based on deltaR and deltaM with recon data
-        self.events["bjj_deltaR"] = bjj_deltaR(self.events["BJetGood"], self.events["jj"])
-        self.events["bjj_deltaM"] = bjj_deltaM(self.events["BJetGood"], self.events["jj"])
+        tops = reconstruct_top_candidates(
+            self.events["BJetGood"], self.events["jj"], strategies=["deltaR", "deltaM"]
+        )
+        self.events["bjj_deltaR"] = tops["deltaR"]
+        self.events["bjj_deltaM"] = tops["deltaM"]
 
 ###########################################################################
+        # GenJets by flavours, Gen-level W/top and matching, only for the truth samples
+        if self._isTruth:
+            start = time.perf_counter()
+            self._share_with_nominal(
+                variation,
+                ["GenJetSave", "GenJetGood", "GenBJetGood", "GenBJetBad", "GenJetGoodSave",
+                 "GenBJetGoodSave", "GenBJetBadSave", "Genjj", "Genbjj_deltaR", "Genbjj_deltaM"],
+                self.truth_gen_reconstruction,
+                preselected=True,
+            )
+            self.truth_reconstruction()
+            self._record_truth_stage(len(self.events), start)
+        else:
+            self._record_truth_stage(len(self.events))
+
+    def truth_gen_reconstruction(self):
+        self.truth_object_preselection()
         # Reconstuct the top with Gen-level data:
-        self.events["Genbjj_deltaR"] = bjj_deltaR(self.events["GenBJetGood"], self.events["Genjj"])
-        self.events["Genbjj_deltaM"] = bjj_deltaR(self.events["GenBJetGood"], self.events["Genjj"])
         self.events["Genjj"] = get_dijet(self.events["GenBJetBad"], taggerVars=False)
+        Gentops = reconstruct_top_candidates(
+            self.events["GenBJetGood"], self.events["Genjj"], strategies=["deltaR", "deltaM"]
+        )
+        self.events["Genbjj_deltaR"] = Gentops["deltaR"]
+        self.events["Genbjj_deltaM"] = Gentops["deltaM"]
 
-###########################################################################
+    def truth_reconstruction(self):
         # Match the Reco w, top to he Gen Reco w, top:
         self.events["Matchedjj"], self.events["MatchedGenjj"], deltaR_padnone = object_matching1(
             self.events["jj"], self.events["Genjj"], dr_min = 0.4
@@ -137,7 +671,12 @@ class ttBaseProcessor_res(BaseProcessorABC):
         self.events["Matchedbjj_deltaM"], self.events["MatchedGenbjj_deltaM"], deltaR_padnone = object_matching1(
             self.events["bjj_deltaM"], self.events["Genbjj_deltaM"], dr_min = 0.4
         )
-        
+        # Gen pt and reco/gen pt response of the matched candidates, for the response histograms
+        for coll in ["jj", "bjj_deltaR", "bjj_deltaM"]:
+            matched, gen = self.events[f"Matched{coll}"], self.events[f"MatchedGen{coll}"]
+            matched = ak.with_field(matched, gen.pt, "genPt")
+            self.events[f"Matched{coll}"] = ak.with_field(matched, matched.pt / gen.pt, "ptResponse")
+
     def count_objects(self, variation):
         self.events["nMuonGood"] = ak.num(self.events.MuonGood)
         self.events["nElectronGood"] = ak.num(self.events.ElectronGood)